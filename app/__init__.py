@@ -1,5 +1,5 @@
 import time
-from flask import Flask
+from flask import Flask, g, request
 
 _start_time = time.time()
 
@@ -14,9 +14,49 @@ def create_app() -> Flask:
     from app.routes.transactions import transactions_bp
     from app.routes.returns import returns_bp
     from app.routes.performance import performance_bp
+    from app.routes.rulesets import rulesets_bp
+    from app.routes.ledger import ledger_bp
+    from werkzeug.exceptions import RequestEntityTooLarge, TooManyRequests
+
+    from app.services.ruleset_service import UnknownRuleset
+    from app.utils.admission import AdmissionControl, retry_after_header
+    from app.utils.metrics import REQUESTS, metrics
+    from app.utils.serialization import json_response
 
     app.register_blueprint(transactions_bp)
     app.register_blueprint(returns_bp)
     app.register_blueprint(performance_bp)
+    app.register_blueprint(rulesets_bp)
+    app.register_blueprint(ledger_bp)
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    AdmissionControl().init_app(app)
+
+    @app.after_request
+    def record_latency(response):
+        # Streamed bodies are timed until the response is returned, not sent.
+        started = g.pop("request_started", None)
+        if started is not None:
+            rule = request.url_rule.rule if request.url_rule else "<unmatched>"
+            metrics.observe(
+                REQUESTS, f"{request.method} {rule}", time.perf_counter() - started
+            )
+        return response
+
+    @app.errorhandler(UnknownRuleset)
+    def unknown_ruleset(exc):
+        return json_response({"error": f"Unknown ruleset_id: {exc.args[0]}"}, 404)
+
+    @app.errorhandler(RequestEntityTooLarge)
+    @app.errorhandler(TooManyRequests)
+    def rejected(exc):
+        response = json_response({"error": exc.description}, exc.code)
+        retry_after = getattr(exc, "retry_after", None)
+        if retry_after is not None:
+            response.headers["Retry-After"] = retry_after_header(retry_after)
+        return response
 
     return app
@@ -0,0 +1,52 @@
+from flask import Blueprint
+
+from app.services import ledger_service
+from app.services.investment_service import INSTRUMENT_RATES
+from app.services.pipeline_service import compile_periods
+from app.services.ruleset_service import resolve_ruleset
+from app.utils.constants import DEFAULT_AGE, DEFAULT_INFLATION
+from app.utils.serialization import json_response, read_json
+
+ledger_bp = Blueprint("ledger", __name__, url_prefix="/blackrock/challenge/v1")
+
+
+@ledger_bp.route("/ledger/<user_id>/transactions", methods=["POST"])
+def append(user_id):
+    data = read_json()
+    compiled = resolve_ruleset(data)
+    if compiled is None and (data.get("q") or data.get("p")):
+        compiled = compile_periods(data.get("q", []), data.get("p", []))
+    result = ledger_service.store.append(
+        user_id, data.get("transactions", []), compiled,
+    )
+    return json_response(result)
+
+
+def _ledger_returns(user_id, instrument):
+    data = read_json()
+    compiled = resolve_ruleset(data)
+    k_periods = compiled.k_periods if compiled is not None else data.get("k", [])
+    try:
+        result = ledger_service.store.returns(
+            user_id,
+            k_periods,
+            age=data.get("age", DEFAULT_AGE),
+            wage=data.get("wage", 0),
+            inflation=data.get("inflation", DEFAULT_INFLATION),
+            rate=INSTRUMENT_RATES[instrument],
+            is_nps=instrument == "nps",
+            trajectory=bool(data.get("trajectory", False)),
+        )
+    except ValueError as exc:
+        return json_response({"error": str(exc)}, 400)
+    return json_response(result)
+
+
+@ledger_bp.route("/ledger/<user_id>/returns:nps", methods=["POST"])
+def nps(user_id):
+    return _ledger_returns(user_id, "nps")
+
+
+@ledger_bp.route("/ledger/<user_id>/returns:index", methods=["POST"])
+def index(user_id):
+    return _ledger_returns(user_id, "index")
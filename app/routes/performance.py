@@ -2,9 +2,12 @@ import os
 import threading
 
 import psutil
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response
 
 from app import get_uptime
+from app.utils import response_cache
+from app.utils.metrics import metrics
+from app.utils.serialization import json_response
 
 performance_bp = Blueprint(
     "performance", __name__, url_prefix="/blackrock/challenge/v1"
@@ -25,8 +28,34 @@ def performance():
 
     thread_count = threading.active_count()
 
-    return jsonify({
+    # time/memory/threads describe the worker serving this request; latency
+    # is merged across all workers.
+    latency = metrics.summary()
+    hits = latency["counters"].get("response_cache_hits", 0)
+    misses = latency["counters"].get("response_cache_misses", 0)
+    store_rows = latency["counters"].get("store_rows", 0)
+    store_bytes = latency["counters"].get("store_bytes", 0)
+    return json_response({
         "time": time_str,
         "memory": memory_str,
         "threads": thread_count,
+        "latency": latency,
+        "responseCache": {
+            **response_cache.response_cache.stats(),
+            "hits": hits,
+            "misses": misses,
+            "hitRatio": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        },
+        "transactionStore": {
+            "rows": store_rows,
+            "bytes": store_bytes,
+            "bytesPerTransaction": round(store_bytes / store_rows, 2) if store_rows else 0.0,
+        },
     })
+
+
+@performance_bp.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(
+        metrics.prometheus(), mimetype="text/plain; version=0.0.4"
+    )
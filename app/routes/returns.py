@@ -1,9 +1,18 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint
 
 from app.services.investment_service import (
+    INSTRUMENT_RATES,
+    INSTRUMENT_VOLATILITY,
     calculate_index_returns,
     calculate_nps_returns,
+    calculate_returns_batch,
+    calculate_scenarios,
 )
+from app.services.ruleset_service import resolve_ruleset
+from app.services.simulation_service import parse_simulation
+from app.utils.constants import DEFAULT_AGE, DEFAULT_INFLATION, MAX_BATCH_PORTFOLIOS
+from app.utils.response_cache import cached_response
+from app.utils.serialization import json_response, read_json
 
 returns_bp = Blueprint("returns", __name__, url_prefix="/blackrock/challenge/v1")
 
@@ -14,23 +23,82 @@ def _extract_common_params(data: dict) -> dict:
         "q_periods": data.get("q", []),
         "p_periods": data.get("p", []),
         "k_periods": data.get("k", []),
-        "age": data.get("age", 30),
+        "age": data.get("age", DEFAULT_AGE),
         "wage": data.get("wage", 0),
-        "inflation": data.get("inflation", 0.055),
+        "inflation": data.get("inflation", DEFAULT_INFLATION),
+        "compiled": resolve_ruleset(data),
     }
 
 
+def _deterministic(data):
+    # Unseeded simulations must draw fresh paths on every call.
+    simulation = data.get("simulation")
+    return not simulation or (isinstance(simulation, dict) and "seed" in simulation)
+
+
 @returns_bp.route("/returns:nps", methods=["POST"])
+@cached_response(_deterministic)
 def nps():
-    data = request.get_json(force=True)
+    data = read_json()
     params = _extract_common_params(data)
-    result = calculate_nps_returns(**params)
-    return jsonify(result)
+    try:
+        simulation = parse_simulation(
+            data.get("simulation"), INSTRUMENT_VOLATILITY["nps"]
+        )
+    except ValueError as exc:
+        return json_response({"error": str(exc)}, 400)
+    result = calculate_nps_returns(
+        **params,
+        trajectory=bool(data.get("trajectory", False)),
+        simulation=simulation,
+    )
+    return json_response(result)
 
 
 @returns_bp.route("/returns:index", methods=["POST"])
+@cached_response(_deterministic)
 def index():
-    data = request.get_json(force=True)
+    data = read_json()
     params = _extract_common_params(data)
-    result = calculate_index_returns(**params)
-    return jsonify(result)
+    try:
+        simulation = parse_simulation(
+            data.get("simulation"), INSTRUMENT_VOLATILITY["index"]
+        )
+    except ValueError as exc:
+        return json_response({"error": str(exc)}, 400)
+    result = calculate_index_returns(
+        **params,
+        trajectory=bool(data.get("trajectory", False)),
+        simulation=simulation,
+    )
+    return json_response(result)
+
+
+@returns_bp.route("/returns:scenarios", methods=["POST"])
+def scenarios():
+    data = read_json()
+    params = _extract_common_params(data)
+    del params["age"], params["inflation"]
+    try:
+        result = calculate_scenarios(
+            **params,
+            instruments=data.get("instruments", list(INSTRUMENT_RATES)),
+            ages=data.get("ages", [DEFAULT_AGE]),
+            inflations=data.get("inflations", [DEFAULT_INFLATION]),
+        )
+    except ValueError as exc:
+        return json_response({"error": str(exc)}, 400)
+    return json_response(result)
+
+
+@returns_bp.route("/returns:batch", methods=["POST"])
+def batch():
+    data = read_json()
+    portfolios = data.get("portfolios", [])
+    if not isinstance(portfolios, list):
+        return json_response({"error": "portfolios must be a list"}, 400)
+    if len(portfolios) > MAX_BATCH_PORTFOLIOS:
+        return json_response({
+            "error": f"Too many portfolios: {len(portfolios)} > {MAX_BATCH_PORTFOLIOS}"
+        }, 400)
+    return json_response({"results": calculate_returns_batch(portfolios)})
@@ -0,0 +1,23 @@
+from flask import Blueprint
+
+from app.services import ruleset_service
+from app.utils.serialization import json_response, read_json
+
+rulesets_bp = Blueprint("rulesets", __name__, url_prefix="/blackrock/challenge/v1")
+
+
+@rulesets_bp.route("/rulesets", methods=["POST"])
+def upload():
+    data = read_json()
+    try:
+        rid = ruleset_service.registry.register(
+            data.get("q", []), data.get("p", []), data.get("k", []),
+        )
+    except (KeyError, TypeError, ValueError) as exc:
+        return json_response({"error": f"Invalid rule set: {exc}"}, 400)
+    return json_response({"ruleset_id": rid}, 201)
+
+
+@rulesets_bp.route("/rulesets:stats", methods=["GET"])
+def stats():
+    return json_response(ruleset_service.registry.stats())
@@ -1,36 +1,104 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, request
 
-from app.services.transaction_service import parse_expenses, validate_transactions
+from app.services.transaction_service import (
+    iter_parse_expenses,
+    iter_validate_rows,
+    parse_expenses,
+    validate_transactions,
+)
+from app.services.output_shape import parse_output_shape
 from app.services.period_rule_service import filter_transactions
+from app.services.rollup_service import rollup_transactions
+from app.services.ruleset_service import resolve_ruleset
+from app.utils.ndjson import (
+    NDJSON_MIMETYPE,
+    encode_ndjson,
+    iter_ndjson_chunks,
+    ndjson_response,
+)
+from app.utils.response_cache import cached_response
+from app.utils.serialization import json_response, read_json
 
 transactions_bp = Blueprint(
     "transactions", __name__, url_prefix="/blackrock/challenge/v1"
 )
 
 
+def _is_ndjson():
+    return request.mimetype == NDJSON_MIMETYPE
+
+
 @transactions_bp.route("/transactions:parse", methods=["POST"])
 def parse():
-    data = request.get_json(force=True)
+    if _is_ndjson():
+        chunks = iter_parse_expenses(iter_ndjson_chunks(request.stream))
+        return ndjson_response(encode_ndjson(chunk) for chunk in chunks)
+
+    data = read_json()
     expenses = data.get("expenses", [])
     transactions = parse_expenses(expenses)
-    return jsonify({"transactions": transactions})
+    return json_response({"transactions": transactions})
+
+
+def _encode_validation_chunk(rows):
+    # In input order, so output line i answers input line i.
+    return encode_ndjson(
+        {"valid": row} if ok else {"invalid": row} for ok, row in rows
+    )
 
 
 @transactions_bp.route("/transactions:validator", methods=["POST"])
 def validator():
-    data = request.get_json(force=True)
+    if _is_ndjson():
+        wage = request.args.get("wage", 0, type=float)
+        results = iter_validate_rows(wage, iter_ndjson_chunks(request.stream))
+        return ndjson_response(_encode_validation_chunk(r) for r in results)
+
+    data = read_json()
     wage = data.get("wage", 0)
     transactions = data.get("transactions", [])
-    result = validate_transactions(wage, transactions)
-    return jsonify(result)
+    try:
+        shape = parse_output_shape(data)
+    except ValueError as exc:
+        return json_response({"error": str(exc)}, 400)
+    result = validate_transactions(wage, transactions, shape=shape)
+    return json_response(result)
 
 
 @transactions_bp.route("/transactions:filter", methods=["POST"])
+@cached_response()
 def filter_route():
-    data = request.get_json(force=True)
+    data = read_json()
     q_periods = data.get("q", [])
     p_periods = data.get("p", [])
     k_periods = data.get("k", [])
     transactions = data.get("transactions", [])
-    result = filter_transactions(transactions, q_periods, p_periods, k_periods)
-    return jsonify(result)
+    try:
+        shape = parse_output_shape(data)
+    except ValueError as exc:
+        return json_response({"error": str(exc)}, 400)
+    result = filter_transactions(
+        transactions, q_periods, p_periods, k_periods,
+        include_k_matches=data.get("includeKMatches", False),
+        compiled=resolve_ruleset(data),
+        shape=shape,
+    )
+    return json_response(result)
+
+
+@transactions_bp.route("/transactions:rollup", methods=["POST"])
+@cached_response()
+def rollup():
+    data = read_json()
+    try:
+        result = rollup_transactions(
+            data.get("transactions", []),
+            data.get("q", []), data.get("p", []), data.get("k", []),
+            granularity=data.get("granularity", "month"),
+            start=data.get("start"),
+            end=data.get("end"),
+            compiled=resolve_ruleset(data),
+        )
+    except ValueError as exc:
+        return json_response({"error": str(exc)}, 400)
+    return json_response(result)
@@ -0,0 +1,335 @@
+"""Offline processing of expense files, behind ``cli.py``.
+
+The file is cut into line-aligned byte ranges and every range goes through
+parse -> validate -> q/p -> k split in a worker process, which maps the
+file itself and sends back its rows already encoded as NDJSON, plus the
+few columns the returns need.  The parent writes the chunks in file order
+as they finish and, at the end, computes k totals and projections over all
+valid rows exactly as one ``calculate_returns`` call over them would.
+
+Duplicate dates are the one check that spans chunks.  Workers validate
+their chunk alone and report the dates they saw; the parent remembers the
+dates of earlier chunks (canonical ones as epochs in a few sorted runs, any
+other in a set) and, in the rare case that a chunk repeats one, has the
+chunk validated again with those dates marked as seen.
+
+The parent's memory grows by 8 bytes per row for those dates and 16 per
+valid row (epoch and remanent) for the k totals.  The totals are prefix
+sums over every valid row in time order, the same floats the endpoint
+adds, so they cannot be folded chunk by chunk without changing the last bit.
+"""
+import os
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.services.investment_service import INSTRUMENT_RATES, project_savings
+from app.services.period_rule_service import split_by_k
+from app.services.pipeline_service import (
+    PipelineResult,
+    compile_periods,
+    k_savings,
+    run_pipeline,
+    sorted_prefix_sums,
+)
+from app.services.transaction_service import parse_expenses, validate_transactions
+from app.utils import mmap_reader
+from app.utils.constants import BATCH_CHUNK_BYTES, DEFAULT_AGE, DEFAULT_INFLATION
+from app.utils.datetime_codec import decode_canonical
+from app.utils.ndjson import encode_ndjson
+from app.utils.serialization import dumps
+
+ChunkResult = namedtuple(
+    "ChunkResult",
+    [
+        "rows", "valid", "invalid", "valid_count", "invalid_count",
+        "date_epochs", "date_ok", "odd_dates",
+        "epochs", "remanents", "amounts", "ceilings",
+    ],
+)
+ChunkResult.__doc__ = """One processed byte range.
+
+``valid``/``invalid`` are NDJSON bytes.  ``date_epochs``/``date_ok`` are the
+canonical dates of every parsed row and ``odd_dates`` the ``(row, date)``
+pairs of the others, for cross-chunk duplicate checks.  ``epochs`` and
+``remanents`` (after q/p) cover every valid row, in order, for k totals;
+``amounts`` and ``ceilings`` are their plain values, for the totals.
+"""
+
+_worker = {}
+
+
+def _init_worker(path, fmt, columns, rules, include_k_matches):
+    _worker.update(
+        path=path, fmt=fmt, columns=columns,
+        compiled=compile_periods(rules.get("q"), rules.get("p"), rules.get("k", [])),
+        include_k_matches=include_k_matches,
+    )
+
+
+def _parse(records):
+    """``parse_expenses``, falling back to one record at a time on bad input.
+
+    Returns the transactions, the record index of each, and the failures
+    as ``(record index, invalid entry)`` pairs.
+    """
+    try:
+        return parse_expenses(records), range(len(records)), []
+    except (KeyError, TypeError, ValueError, AttributeError):
+        pass
+    parsed, rows, failed = [], [], []
+    for i, record in enumerate(records):
+        try:
+            parsed.extend(parse_expenses([record]))
+            rows.append(i)
+        except (KeyError, TypeError, ValueError, AttributeError) as exc:
+            failed.append((i, {
+                "expense": record,
+                "message": f"Unparseable expense: {type(exc).__name__}: {exc}",
+            }))
+    return parsed, rows, failed
+
+
+def process_chunk(start, end, seen_rows=()):
+    """Run one byte range through the pipeline (in a worker).
+
+    ``seen_rows`` lists rows whose dates already occurred in earlier chunks.
+    Invalid entries are written in input order, whichever stage rejected
+    them, so the output does not depend on where the chunks were cut.
+    """
+    records = mmap_reader.read_records(
+        _worker["path"], _worker["fmt"], start, end, _worker["columns"],
+    )
+    transactions, record_rows, failed = _parse(records)
+    dates = [txn["date"] for txn in transactions]
+    seen = {dates[i] for i in seen_rows}
+    checked = validate_transactions(0, transactions, seen_dates=seen)
+
+    compiled = _worker["compiled"]
+    valid = checked["valid"]
+    store = run_pipeline(valid, compiled, prefix_sums=False).store
+    split = split_by_k(store, compiled, _worker["include_k_matches"])
+
+    # Validation keeps the valid dicts themselves, and both stages keep
+    # input order, so every rejected entry can be traced to its record.
+    position = {id(txn): i for i, txn in enumerate(transactions)}
+    valid_rows = [record_rows[position[id(txn)]] for txn in valid]
+    kept = set(valid_rows)
+    rejected = [i for i in record_rows if i not in kept]
+    outside = valid_rows
+    if compiled.k_periods:
+        inside = compiled.k_index.contains_many(store.epochs)
+        outside = [valid_rows[i] for i in np.flatnonzero(~inside).tolist()]
+    invalid = failed + list(zip(rejected, checked["invalid"]))
+    invalid += zip(outside, split["invalid"])
+    invalid.sort(key=lambda entry: entry[0])
+    store.load_remanents()
+
+    date_epochs, date_ok = decode_canonical(dates)
+    return ChunkResult(
+        rows=len(records),
+        valid=encode_ndjson(split["valid"]),
+        invalid=encode_ndjson([entry for _, entry in invalid]),
+        valid_count=len(split["valid"]),
+        invalid_count=len(invalid),
+        date_epochs=date_epochs,
+        date_ok=date_ok,
+        odd_dates=[(i, dates[i]) for i in np.flatnonzero(~date_ok).tolist()],
+        epochs=store.epochs,
+        remanents=store.remanent_values().copy(),
+        amounts=[txn["amount"] for txn in valid],
+        ceilings=[txn["ceiling"] for txn in valid],
+    )
+
+
+class _SeenDates:
+    """Dates of the chunks written so far.
+
+    Canonical dates are kept as sorted runs of epochs, each more than twice
+    as long as the next.  A new chunk is merged into the runs before it
+    until that holds again, so there are O(log n) runs to search and every
+    epoch is copied O(log n) times in all (``copied`` counts them).
+    """
+
+    def __init__(self):
+        self.runs = []
+        self.odd = set()
+        self.copied = 0
+
+    def repeats(self, result):
+        """Rows of ``result`` whose date an earlier chunk already had."""
+        epochs = result.date_epochs
+        hit = np.zeros(len(epochs), dtype=bool)
+        for run in self.runs:
+            pos = np.searchsorted(run, epochs)
+            found = pos < len(run)
+            found[found] = run[pos[found]] == epochs[found]
+            hit |= found
+        rows = np.flatnonzero(hit & result.date_ok).tolist()
+        rows += [i for i, date in result.odd_dates if date in self.odd]
+        return sorted(rows)
+
+    def add(self, result):
+        run = np.sort(result.date_epochs[result.date_ok])
+        while self.runs and len(self.runs[-1]) <= 2 * len(run):
+            # A stable sort of two sorted runs is a linear merge.
+            run = np.sort(np.concatenate([self.runs.pop(), run]), kind="stable")
+            self.copied += len(run)
+        if len(run):
+            self.runs.append(run)
+        self.odd.update(date for _, date in result.odd_dates)
+
+
+class _Progress:
+    def __init__(self, total_bytes, stream, interval=0.5):
+        self.total_bytes = total_bytes
+        self.stream = stream
+        self.interval = interval
+        self.started = time.perf_counter()
+        self._last = 0.0
+
+    def update(self, done_bytes, rows, final=False):
+        if self.stream is None:
+            return
+        now = time.perf_counter()
+        if not final and now - self._last < self.interval:
+            return
+        self._last = now
+        elapsed = max(now - self.started, 1e-9)
+        pct = 100.0 * done_bytes / self.total_bytes if self.total_bytes else 100.0
+        self.stream.write(
+            f"\r{pct:5.1f}%  {rows:,} rows  {rows / elapsed:,.0f} rows/s"
+            + ("\n" if final else "")
+        )
+        self.stream.flush()
+
+
+def _results_in_order(ranges, workers, submit_args):
+    """Yield ``(range, ChunkResult, executor)`` in file order."""
+    if workers <= 1:
+        _init_worker(*submit_args)
+        for start, end in ranges:
+            yield (start, end), process_chunk(start, end), None
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=submit_args,
+    ) as pool:
+        pending = deque()
+        queued = iter(ranges)
+        for start, end in queued:
+            pending.append(((start, end), pool.submit(process_chunk, start, end)))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            rng, future = pending.popleft()
+            result = future.result()
+            nxt = next(queued, None)
+            if nxt is not None:
+                pending.append((nxt, pool.submit(process_chunk, *nxt)))
+            yield rng, result, pool
+
+
+def _returns(compiled, epochs, remanents, totals, age, wage, inflation, instruments):
+    sorted_epochs, prefix = sorted_prefix_sums(epochs, remanents)
+    savings_by_k = k_savings(compiled, PipelineResult(None, sorted_epochs, prefix))
+    total_amount, total_ceiling = (round(total, 2) for total in totals)
+    return {
+        name: {
+            "transactionsTotalAmount": total_amount,
+            "transactionsTotalCeiling": total_ceiling,
+            "savingsByDates": project_savings(
+                savings_by_k, age, wage, inflation, INSTRUMENT_RATES[name],
+                is_nps=name == "nps",
+            ),
+        }
+        for name in instruments
+    }
+
+
+def run_batch(
+    path, out_dir, fmt=None, rules=None, age=None, wage=0, inflation=None,
+    instruments=("nps", "index"), workers=1, chunk_bytes=None,
+    include_k_matches=False, progress=None,
+):
+    """Process an expense file into ``out_dir``; returns the run summary.
+
+    Writes ``valid.ndjson`` (transactions inside the k periods, after q/p),
+    ``invalid.ndjson`` (rejected rows, each with a ``message``),
+    ``returns.json`` (one ``calculate_returns`` response per instrument)
+    and ``summary.json``.  ``progress`` is a text stream for progress lines.
+    Totals are summed in file order like the endpoint's ``sum``; on Python
+    3.12+, whose ``sum`` compensates float error, they may differ from it
+    in the last bit.
+    """
+    age = DEFAULT_AGE if age is None else age
+    inflation = DEFAULT_INFLATION if inflation is None else inflation
+    chunk_bytes = chunk_bytes or BATCH_CHUNK_BYTES
+    rules = rules or {}
+    unknown = sorted(set(instruments) - set(INSTRUMENT_RATES))
+    if unknown:
+        raise ValueError(f"Unknown instrument(s): {', '.join(unknown)}")
+
+    fmt = fmt or mmap_reader.detect_format(path)
+    columns, data_start = mmap_reader.csv_header(path) if fmt == "csv" else (None, 0)
+    ranges = mmap_reader.split(path, chunk_bytes, data_start)
+    compiled = compile_periods(rules.get("q"), rules.get("p"), rules.get("k", []))
+
+    os.makedirs(out_dir, exist_ok=True)
+    meter = _Progress(os.path.getsize(path), progress)
+    seen = _SeenDates()
+    rows = valid_count = invalid_count = 0
+    epochs, remanents = [], []
+    total_amount = total_ceiling = 0
+    submit_args = (path, fmt, columns, rules, include_k_matches)
+
+    with open(os.path.join(out_dir, "valid.ndjson"), "wb") as valid_out, \
+            open(os.path.join(out_dir, "invalid.ndjson"), "wb") as invalid_out:
+        for (start, end), result, pool in _results_in_order(ranges, workers, submit_args):
+            repeats = seen.repeats(result)
+            if repeats:
+                result = (
+                    pool.submit(process_chunk, start, end, repeats).result()
+                    if pool is not None else process_chunk(start, end, repeats)
+                )
+            seen.add(result)
+            valid_out.write(result.valid)
+            invalid_out.write(result.invalid)
+            rows += result.rows
+            valid_count += result.valid_count
+            invalid_count += result.invalid_count
+            epochs.append(result.epochs)
+            remanents.append(result.remanents)
+            # Carried from chunk to chunk, the sums add in the same order
+            # and with the same int/float switch as one sum() over the file.
+            total_amount = sum(result.amounts, total_amount)
+            total_ceiling = sum(result.ceilings, total_ceiling)
+            meter.update(end, rows)
+
+    returns = _returns(
+        compiled,
+        np.concatenate(epochs) if epochs else np.empty(0, dtype=np.int64),
+        np.concatenate(remanents) if remanents else np.empty(0, dtype=np.float64),
+        (total_amount, total_ceiling), age, wage, inflation, instruments,
+    )
+    with open(os.path.join(out_dir, "returns.json"), "wb") as f:
+        f.write(dumps(returns))
+
+    seconds = time.perf_counter() - meter.started
+    meter.update(os.path.getsize(path), rows, final=True)
+    summary = {
+        "input": path,
+        "format": fmt,
+        "rows": rows,
+        "valid": valid_count,
+        "invalid": invalid_count,
+        "chunks": len(ranges),
+        "workers": workers,
+        "seconds": round(seconds, 3),
+        "rowsPerSecond": round(rows / seconds) if seconds > 0 else 0,
+    }
+    with open(os.path.join(out_dir, "summary.json"), "wb") as f:
+        f.write(dumps(summary))
+    return summary
@@ -0,0 +1,114 @@
+"""Columnar (NumPy) kernels for expense parsing and transaction validation.
+
+The kernels only ever decide what they can decide exactly.  Rows whose
+values fall outside the fast path (odd types, non-canonical dates, values
+within float error of a rounding boundary) are reported as ``UNDECIDED`` so
+the caller can fall back to the scalar code for just those rows.
+"""
+import numpy as np
+
+from app.utils.constants import MAX_AMOUNT, ROUNDING_CONST
+from app.utils.datetime_codec import decode_canonical
+from app.utils.rounding import round2
+
+OK, BAD, UNDECIDED = 0, 1, 2
+
+# Integers above 2**53 do not survive the trip through float64.
+_FLOAT_EXACT_INT = 2 ** 53
+
+_NUMERIC_TYPES = {int, float}
+
+
+def numeric_mask(values):
+    """True where the value is a plain int or float (bools excluded)."""
+    if set(map(type, values)) <= _NUMERIC_TYPES:
+        return np.ones(len(values), dtype=bool)
+    return np.fromiter(
+        (type(v) is int or type(v) is float for v in values),
+        dtype=bool, count=len(values),
+    )
+
+
+def load_numbers(values, mask):
+    """Load the ``mask`` rows of ``values`` into float64, NaN elsewhere.
+
+    Rows are dropped from ``mask`` when the float64 value would not be exact
+    (non-finite floats, integers beyond 2**53).
+    """
+    if mask.all():
+        arr = np.array(values, dtype=np.float64)
+    else:
+        arr = np.full(len(values), np.nan)
+        idx = np.flatnonzero(mask)
+        arr[idx] = [values[i] for i in idx]
+    with np.errstate(invalid="ignore"):
+        exact = np.isfinite(arr) & (np.abs(arr) < _FLOAT_EXACT_INT)
+    return arr, mask & exact
+
+
+def ceiling_and_remanent(amounts):
+    ceiling = np.ceil(amounts / ROUNDING_CONST) * ROUNDING_CONST
+    return ceiling, ceiling - amounts
+
+
+def parse_numbers(amounts, is_int):
+    """Vectorized body of ``parse_expenses`` over exactly loaded amounts.
+
+    Returns float64 ``(amount, remanent)`` holding the scalar loop's values
+    (rounded floats, or the exact ints where ``is_int``) and the int64
+    ceiling.
+    """
+    ceiling, remanent = ceiling_and_remanent(amounts)
+    amount = np.where(is_int, amounts, round2(amounts))
+    remanent = np.where(is_int, remanent, round2(remanent))
+    return amount, ceiling.astype(np.int64), remanent
+
+
+def _rounded_equal(given, expected, mask):
+    """``round(given, 2) == round(expected, 2)`` for the ``mask`` rows."""
+    diff = np.abs(given - expected)
+    equal = diff == 0
+    close = np.flatnonzero(mask & ~equal & (diff <= 0.011))
+    equal[close] = round2(given[close]) == round2(expected[close])
+    return equal
+
+
+def transaction_status(dates, amounts, ceilings, remanents):
+    """Per-row OK / BAD / UNDECIDED status, ignoring duplicate dates.
+
+    OK and BAD are exact verdicts of the scalar validation rules; UNDECIDED
+    rows must be checked by the scalar code.
+    """
+    _, date_ok = decode_canonical(dates)
+    return column_status(
+        date_ok,
+        load_numbers(amounts, numeric_mask(amounts)),
+        load_numbers(ceilings, numeric_mask(ceilings)),
+        load_numbers(remanents, numeric_mask(remanents)),
+    )
+
+
+def column_status(date_ok, amounts, ceilings, remanents):
+    """``transaction_status`` over loaded columns.
+
+    Each of ``amounts``, ``ceilings`` and ``remanents`` is a ``(values,
+    known)`` pair as ``load_numbers`` returns it.
+    """
+    n = len(date_ok)
+    amount, amount_known = amounts
+    ceiling, ceiling_known = ceilings
+    remanent, remanent_known = remanents
+
+    with np.errstate(invalid="ignore"):
+        in_range = (amount >= 0) & (amount < MAX_AMOUNT)
+    expected_ceiling, expected_remanent = ceiling_and_remanent(amount)
+    checked = date_ok & amount_known & in_range & ceiling_known & remanent_known
+    ceiling_ok = _rounded_equal(ceiling, expected_ceiling, checked)
+    remanent_ok = _rounded_equal(remanent, expected_remanent, checked)
+
+    status = np.full(n, UNDECIDED, dtype=np.int8)
+    status[checked & ceiling_ok & remanent_ok] = OK
+    status[checked & ~(ceiling_ok & remanent_ok)] = BAD
+    # A known amount out of range is bad whatever the date looks like.
+    status[amount_known & ~in_range] = BAD
+    return status
@@ -1,15 +1,36 @@
-from app.services.tax_service import calculate_nps_tax_benefit
-from app.services.period_rule_service import (
-    apply_k_grouping,
-    apply_p_rules,
-    apply_q_rules,
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+
+import numpy as np
+
+from app.services.simulation_service import parse_simulation, simulate
+from app.services.tax_service import nps_tax_benefits
+from app.services.pipeline_service import (
+    compile_periods,
+    k_savings,
+    run_pipeline,
 )
+from app.services.ruleset_service import UnknownRuleset, resolve_ruleset
+from app.utils.columnar_table import ColumnarTable
 from app.utils.constants import (
+    BATCH_PARALLEL_MIN_ITEMS,
+    DEFAULT_AGE,
+    DEFAULT_INFLATION,
     INDEX_RATE,
+    INDEX_VOLATILITY,
+    MAX_SCENARIOS,
     MIN_INVESTMENT_YEARS,
     NPS_RATE,
+    NPS_VOLATILITY,
     RETIREMENT_AGE,
+    TRAJECTORY_CACHE_SIZE,
 )
+from app.utils.metrics import metrics
+from app.utils.process_pool import discard_process_pool, get_process_pool, pool_size
+from app.utils.rounding import round2
+
+INSTRUMENT_RATES = {"nps": NPS_RATE, "index": INDEX_RATE}
+INSTRUMENT_VOLATILITY = {"nps": NPS_VOLATILITY, "index": INDEX_VOLATILITY}
 
 
 def _investment_years(age):
@@ -25,62 +46,311 @@ def _inflation_adjust(amount, inflation, years):
     return amount / ((1 + inflation) ** years)
 
 
+@lru_cache(maxsize=TRAJECTORY_CACHE_SIZE)
+def _factor_table(rate, inflation, years):
+    """Growth and inflation factors for years 1..years (read-only arrays).
+
+    Each factor is the same scalar ``**`` as ``_compound_interest`` and
+    ``_inflation_adjust``, so a trajectory's last point matches ``profits``.
+    """
+    steps = range(1, years + 1)
+    growth = np.array([(1 + rate) ** y for y in steps], dtype=np.float64)
+    discount = np.array([(1 + inflation) ** y for y in steps], dtype=np.float64)
+    growth.flags.writeable = False
+    discount.flags.writeable = False
+    return growth, discount
+
+
+def _trajectories(savings_by_k, age, inflation, rate):
+    """Yearly nominal and inflation-adjusted balances for every k bucket.
+
+    One outer product of bucket amounts against the cached factor tables.
+    """
+    years = _investment_years(age)
+    growth, discount = _factor_table(rate, inflation, years)
+    invested = np.array([s["amount"] for s in savings_by_k], dtype=np.float64)
+    nominal = invested[:, None] * growth[None, :]
+    real = round2(nominal / discount[None, :]).tolist()
+    nominal = round2(nominal).tolist()
+    ages = [age + y for y in range(1, years + 1)]
+    return [
+        {"age": ages, "nominal": nominal_row, "real": real_row}
+        for nominal_row, real_row in zip(nominal, real)
+    ]
+
+
+def _savings_by_k(transactions, q_periods, p_periods, k_periods, compiled=None):
+    """Run the q/p/k pipeline once: (total amount, total ceiling, k buckets)."""
+    if compiled is None:
+        compiled = compile_periods(q_periods, p_periods, k_periods)
+    result = run_pipeline(transactions, compiled)
+
+    # The stages only change remanents, so the totals come from the inputs.
+    if isinstance(transactions, ColumnarTable) and transactions:
+        amounts = transactions.pylist("amount")
+        ceilings = transactions.pylist("ceiling")
+    else:
+        amounts = (t["amount"] for t in transactions)
+        ceilings = (t["ceiling"] for t in transactions)
+    total_amount = round(sum(amounts), 2)
+    total_ceiling = round(sum(ceilings), 2)
+    return total_amount, total_ceiling, k_savings(compiled, result)
+
+
 def calculate_returns(
     transactions, q_periods, p_periods, k_periods,
-    age, wage, inflation, rate, is_nps=False,
+    age, wage, inflation, rate, is_nps=False, compiled=None, trajectory=False,
+    simulation=None,
 ):
-    adjusted = apply_q_rules(transactions, q_periods)
-    adjusted = apply_p_rules(adjusted, p_periods)
+    """Project k-bucket savings at ``rate``, net of inflation.
+
+    ``compiled`` (from the rule-set registry) replaces the period lists.
+    With a ``SimulationSpec`` as ``simulation``, each bucket also gets
+    ``realValueBands`` (Monte Carlo p5/p50/p95 of real value) and the
+    response a ``simulation`` summary.
+    """
+    total_amount, total_ceiling, savings_by_k = _savings_by_k(
+        transactions, q_periods, p_periods, k_periods, compiled,
+    )
+    result = {
+        "transactionsTotalAmount": total_amount,
+        "transactionsTotalCeiling": total_ceiling,
+        "savingsByDates": project_savings(
+            savings_by_k, age, wage, inflation, rate, is_nps, trajectory,
+        ),
+    }
+    if simulation is not None:
+        with metrics.time_stage("simulation"):
+            bands, info = simulate(
+                savings_by_k, _investment_years(age), rate, inflation, simulation,
+            )
+        for entry, band in zip(result["savingsByDates"], bands):
+            entry["realValueBands"] = band
+        result["simulation"] = info
+    return result
 
-    total_amount = round(sum(t["amount"] for t in adjusted), 2)
-    total_ceiling = round(sum(t["ceiling"] for t in adjusted), 2)
 
-    savings_by_k = apply_k_grouping(adjusted, k_periods)
+def project_savings(
+    savings_by_k, age, wage, inflation, rate, is_nps=False, trajectory=False,
+):
+    """Turn k-bucket totals into ``savingsByDates`` entries.
 
+    With ``trajectory`` each entry also gets the year-by-year balance up to
+    retirement: parallel ``age``, ``nominal`` and ``real`` lists.
+    """
     years = _investment_years(age)
     annual_income = wage * 12
 
+    tax_benefits = [0.0] * len(savings_by_k)
+    if is_nps:
+        with metrics.time_stage("tax"):
+            tax_benefits = nps_tax_benefits(
+                [saving["amount"] for saving in savings_by_k], annual_income,
+            )
+
     savings_by_dates = []
-    for saving in savings_by_k:
-        invested = saving["amount"]
-        future_value = _compound_interest(invested, rate, years)
-        real_value = _inflation_adjust(future_value, inflation, years)
-        profit = round(real_value - invested, 2)
-
-        tax_benefit = 0.0
-        if is_nps:
-            tax_benefit = calculate_nps_tax_benefit(invested, annual_income)
-
-        savings_by_dates.append({
-            "start": saving["start"],
-            "end": saving["end"],
-            "amount": round(invested, 2),
-            "profits": profit,
-            "taxBenefit": tax_benefit,
-        })
+    with metrics.time_stage("projection"):
+        for saving, tax_benefit in zip(savings_by_k, tax_benefits):
+            invested = saving["amount"]
+            future_value = _compound_interest(invested, rate, years)
+            real_value = _inflation_adjust(future_value, inflation, years)
+            profit = round(real_value - invested, 2)
 
-    return {
-        "transactionsTotalAmount": total_amount,
-        "transactionsTotalCeiling": total_ceiling,
-        "savingsByDates": savings_by_dates,
-    }
+            savings_by_dates.append({
+                "start": saving["start"],
+                "end": saving["end"],
+                "amount": round(invested, 2),
+                "profits": profit,
+                "taxBenefit": tax_benefit,
+            })
+        if trajectory:
+            for entry, curve in zip(
+                savings_by_dates, _trajectories(savings_by_k, age, inflation, rate)
+            ):
+                entry["trajectory"] = curve
+    return savings_by_dates
 
 
 def calculate_nps_returns(
     transactions, q_periods, p_periods, k_periods,
-    age, wage, inflation,
+    age, wage, inflation, compiled=None, trajectory=False, simulation=None,
 ):
     return calculate_returns(
         transactions, q_periods, p_periods, k_periods,
-        age, wage, inflation, NPS_RATE, is_nps=True,
+        age, wage, inflation, NPS_RATE, is_nps=True, compiled=compiled,
+        trajectory=trajectory, simulation=simulation,
     )
 
 
 def calculate_index_returns(
     transactions, q_periods, p_periods, k_periods,
-    age, wage, inflation,
+    age, wage, inflation, compiled=None, trajectory=False, simulation=None,
 ):
     return calculate_returns(
         transactions, q_periods, p_periods, k_periods,
-        age, wage, inflation, INDEX_RATE, is_nps=False,
+        age, wage, inflation, INDEX_RATE, is_nps=False, compiled=compiled,
+        trajectory=trajectory, simulation=simulation,
+    )
+
+
+def _number_list(name, values):
+    if not isinstance(values, list) or any(
+        isinstance(v, bool) or not isinstance(v, (int, float)) for v in values
+    ):
+        raise ValueError(f"{name} must be a list of numbers")
+    return values
+
+
+def calculate_scenarios(
+    transactions, q_periods, p_periods, k_periods,
+    wage, instruments, ages, inflations, compiled=None,
+):
+    """Evaluate every (instrument, age, inflation) combination in one pass.
+
+    The q/p/k pipeline and the NPS tax benefit run once; the projections for
+    the whole grid are one array expression over the k buckets.  Each
+    scenario's ``savingsByDates`` equals what the matching single returns
+    call would produce.  Raises ``ValueError`` for malformed lists.
+    """
+    if not isinstance(instruments, list) or not all(isinstance(i, str) for i in instruments):
+        raise ValueError("instruments must be a list of instrument names")
+    ages = _number_list("ages", ages)
+    inflations = _number_list("inflations", inflations)
+    unknown = sorted(set(instruments) - set(INSTRUMENT_RATES))
+    if unknown:
+        raise ValueError(f"Unknown instruments: {', '.join(unknown)}")
+    grid = [
+        (instrument, age, inflation)
+        for instrument in instruments
+        for age in ages
+        for inflation in inflations
+    ]
+    if len(grid) > MAX_SCENARIOS:
+        raise ValueError(f"Too many scenarios: {len(grid)} > {MAX_SCENARIOS}")
+
+    total_amount, total_ceiling, savings_by_k = _savings_by_k(
+        transactions, q_periods, p_periods, k_periods, compiled,
+    )
+
+    with metrics.time_stage("projection"):
+        invested = np.array([s["amount"] for s in savings_by_k], dtype=np.float64)
+        growth = np.array([
+            (1 + INSTRUMENT_RATES[instrument]) ** _investment_years(age)
+            for instrument, age, _ in grid
+        ])
+        discount = np.array([
+            (1 + inflation) ** _investment_years(age) for _, age, inflation in grid
+        ])
+        real_value = invested[None, :] * growth[:, None] / discount[:, None]
+        profits = round2(real_value - invested[None, :]).tolist()
+
+    nps_benefits = []
+    if "nps" in instruments:
+        annual_income = wage * 12
+        with metrics.time_stage("tax"):
+            nps_benefits = nps_tax_benefits(
+                [s["amount"] for s in savings_by_k], annual_income,
+            )
+
+    scenarios = []
+    for (instrument, age, inflation), row in zip(grid, profits):
+        benefits = nps_benefits if instrument == "nps" else [0.0] * len(row)
+        scenarios.append({
+            "instrument": instrument,
+            "age": age,
+            "inflation": inflation,
+            "savingsByDates": [
+                {
+                    "start": saving["start"],
+                    "end": saving["end"],
+                    "amount": round(saving["amount"], 2),
+                    "profits": profit,
+                    "taxBenefit": benefit,
+                }
+                for saving, profit, benefit in zip(savings_by_k, row, benefits)
+            ],
+        })
+
+    return {
+        "transactionsTotalAmount": total_amount,
+        "transactionsTotalCeiling": total_ceiling,
+        "scenarios": scenarios,
+    }
+
+
+def portfolio_returns(portfolio):
+    """Returns for one portfolio in request form.
+
+    ``portfolio`` is a ``/returns:nps`` or ``/returns:index`` body plus an
+    ``instrument`` key (``"nps"`` or ``"index"``, default ``"nps"``).  A
+    ``ruleset_id`` may stand in for the q/p/k lists.
+    """
+    if not isinstance(portfolio, dict):
+        raise ValueError("Portfolio must be an object")
+    instrument = portfolio.get("instrument", "nps")
+    if instrument not in INSTRUMENT_RATES:
+        raise ValueError(f"Unknown instrument: {instrument}")
+    compiled = resolve_ruleset(portfolio)
+    return calculate_returns(
+        portfolio.get("transactions", []),
+        portfolio.get("q", []),
+        portfolio.get("p", []),
+        portfolio.get("k", []),
+        portfolio.get("age", DEFAULT_AGE),
+        portfolio.get("wage", 0),
+        portfolio.get("inflation", DEFAULT_INFLATION),
+        INSTRUMENT_RATES[instrument],
+        is_nps=instrument == "nps",
+        compiled=compiled,
+        trajectory=bool(portfolio.get("trajectory", False)),
+        simulation=parse_simulation(
+            portfolio.get("simulation"), INSTRUMENT_VOLATILITY[instrument]
+        ),
     )
+
+
+def _portfolio_error(exc):
+    if isinstance(exc, UnknownRuleset):
+        return f"Unknown ruleset_id: {exc.args[0]}"
+    if isinstance(exc, KeyError):
+        return f"Missing field: {exc.args[0]}"
+    if isinstance(exc, ValueError):
+        return str(exc)
+    return "Malformed portfolio: a field has the wrong type"
+
+
+def _evaluate_portfolios(portfolios):
+    results = []
+    for portfolio in portfolios:
+        try:
+            results.append({"result": portfolio_returns(portfolio)})
+        except (ValueError, KeyError, TypeError, AttributeError) as exc:
+            results.append({"error": _portfolio_error(exc)})
+    return results
+
+
+def calculate_returns_batch(portfolios, chunksize=None):
+    """Returns for many independent portfolios, in input order.
+
+    Each item is ``{"result": ...}`` or ``{"error": "..."}``, so one bad
+    portfolio does not fail the batch.  Large batches are split into chunks
+    and spread over the shared process pool; ``chunksize`` defaults to about
+    four chunks per pool process.
+    """
+    workers = pool_size()
+    if len(portfolios) < BATCH_PARALLEL_MIN_ITEMS or workers < 2:
+        return _evaluate_portfolios(portfolios)
+
+    if chunksize is None:
+        chunksize = -(-len(portfolios) // (workers * 4))
+    chunks = [
+        portfolios[i:i + chunksize] for i in range(0, len(portfolios), chunksize)
+    ]
+    results = []
+    try:
+        for part in get_process_pool().map(_evaluate_portfolios, chunks):
+            results.extend(part)
+    except BrokenProcessPool:
+        discard_process_pool()
+        raise
+    return results
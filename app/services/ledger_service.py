@@ -0,0 +1,236 @@
+"""Append-only per-user transaction ledger backed by SQLite.
+
+SQLite is the source of truth and is shared by every gunicorn worker.  Each
+worker keeps, per user, the sorted transaction epochs and a Fenwick tree of
+remanents in integer paise, caught up incrementally from the rows it has
+not seen yet.  Appending in date order is O(log n) per transaction and each
+k-period sum is two binary searches plus two O(log n) prefix queries, so a
+returns query no longer re-processes the user's whole history.
+
+Remanents are stored rounded to whole paise, so k-period sums are exact
+sums of those rounded values.  They equal the ``/returns:*`` sums whenever
+every remanent has at most two decimals; one with more (the validator
+accepts 50.004 where 50 is expected) is counted as its nearest paisa.
+"""
+import os
+import sqlite3
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from app.services.investment_service import project_savings
+from app.services.pipeline_service import run_pipeline, transaction_epochs
+from app.services.transaction_service import validate_transactions
+from app.utils.constants import LEDGER_CACHE_USERS, LEDGER_DB
+from app.utils.datetime_codec import try_epoch
+from app.utils.fenwick import FenwickTree
+from app.utils.metrics import metrics
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ledger_transactions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    epoch INTEGER NOT NULL,
+    amount REAL NOT NULL,
+    ceiling REAL NOT NULL,
+    remanent_paise INTEGER NOT NULL,
+    UNIQUE (user_id, epoch)
+);
+CREATE INDEX IF NOT EXISTS ledger_user_seq ON ledger_transactions (user_id, seq);
+"""
+
+
+def _to_paise(value):
+    return int(round(value * 100))
+
+
+def _k_bounds(k_periods):
+    """``(start, end)`` epochs of each k period; ``ValueError`` if malformed."""
+    if not isinstance(k_periods, list):
+        raise ValueError("k must be a list of periods")
+    bounds = []
+    for i, kp in enumerate(k_periods):
+        if not isinstance(kp, dict):
+            raise ValueError(f"k[{i}] must be an object with start and end")
+        epochs = []
+        for name in ("start", "end"):
+            epoch = try_epoch(kp.get(name))
+            if epoch is None:
+                raise ValueError(
+                    f"k[{i}].{name} must be a date-time like 2023-01-31 23:59:59,"
+                    f" got {kp.get(name)!r}"
+                )
+            epochs.append(epoch)
+        bounds.append(tuple(epochs))
+    return bounds
+
+
+class _UserLedger:
+    """In-memory view of one user's rows, sorted by date."""
+
+    def __init__(self):
+        self.epochs = []
+        self.remanents = []
+        self.tree = FenwickTree()
+        self.amount_total = 0.0
+        self.ceiling_total = 0.0
+        self.last_seq = 0
+        self.lock = threading.Lock()
+
+    def apply(self, rows):
+        rebuild = False
+        for seq, epoch, amount, ceiling, remanent in rows:
+            if not self.epochs or epoch > self.epochs[-1]:
+                self.epochs.append(epoch)
+                self.remanents.append(remanent)
+                self.tree.append(remanent)
+            else:
+                # Back-dated entry: insert in place and rebuild the tree
+                # once for the whole batch (O(n) instead of O(log n)).
+                pos = bisect_left(self.epochs, epoch)
+                self.epochs.insert(pos, epoch)
+                self.remanents.insert(pos, remanent)
+                rebuild = True
+            self.amount_total += amount
+            self.ceiling_total += ceiling
+            self.last_seq = seq
+        if rebuild:
+            self.tree = FenwickTree(self.remanents)
+
+    def contains(self, epoch):
+        pos = bisect_left(self.epochs, epoch)
+        return pos < len(self.epochs) and self.epochs[pos] == epoch
+
+    def period_sum(self, start, end):
+        left = bisect_left(self.epochs, start)
+        right = bisect_right(self.epochs, end)
+        return self.tree.range_sum(left, right) / 100
+
+
+class LedgerStore:
+    def __init__(self, path=LEDGER_DB, max_users=LEDGER_CACHE_USERS):
+        self.path = path
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if not self._schema_ready:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._schema_ready = True
+        return conn
+
+    def _user(self, user_id):
+        with self._lock:
+            ledger = self._users.get(user_id)
+            if ledger is None:
+                ledger = self._users[user_id] = _UserLedger()
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+            return ledger
+
+    @staticmethod
+    def _catch_up(conn, user_id, ledger):
+        rows = conn.execute(
+            "SELECT seq, epoch, amount, ceiling, remanent_paise"
+            " FROM ledger_transactions WHERE user_id = ? AND seq > ? ORDER BY seq",
+            (user_id, ledger.last_seq),
+        ).fetchall()
+        ledger.apply(rows)
+
+    def append(self, user_id, transactions, compiled=None):
+        """Validate, optionally apply q/p rules, and append to the ledger.
+
+        Transactions failing validation, or dated on a second the ledger
+        already holds, are returned in ``rejected`` and not stored.
+        """
+        checked = validate_transactions(0, transactions)
+        rejected = checked["invalid"]
+        accepted = checked["valid"]
+        epochs = transaction_epochs(accepted)
+        store = None
+        if compiled is not None and accepted:
+            store = run_pipeline(accepted, compiled, epochs, prefix_sums=False).store
+
+        ledger = self._user(user_id)
+        conn = self._connect()
+        try:
+            with ledger.lock:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._catch_up(conn, user_id, ledger)
+                    rows = []
+                    for i, (epoch, txn) in enumerate(zip(epochs, accepted)):
+                        if ledger.contains(epoch):
+                            message = f"Duplicate date: {txn['date']}"
+                            rejected.append(
+                                {**txn, "message": message} if store is None
+                                else store.row(i, message=message)
+                            )
+                            continue
+                        remanent = txn["remanent"] if store is None else store.value(i)
+                        rows.append((
+                            user_id, txn["date"], epoch, txn["amount"],
+                            txn["ceiling"], _to_paise(remanent),
+                        ))
+                    conn.executemany(
+                        "INSERT INTO ledger_transactions"
+                        " (user_id, date, epoch, amount, ceiling, remanent_paise)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                self._catch_up(conn, user_id, ledger)
+                size = len(ledger.epochs)
+        finally:
+            conn.close()
+        return {"appended": len(rows), "rejected": rejected, "size": size}
+
+    def returns(
+        self, user_id, k_periods, age, wage, inflation, rate, is_nps=False,
+        trajectory=False,
+    ):
+        """Same response shape as ``calculate_returns``, from the ledger.
+
+        Raises ``ValueError`` for malformed ``k_periods``.
+        """
+        bounds = _k_bounds(k_periods)
+        ledger = self._user(user_id)
+        conn = self._connect()
+        try:
+            with ledger.lock:
+                self._catch_up(conn, user_id, ledger)
+                with metrics.time_stage("k_grouping"):
+                    savings_by_k = [
+                        {
+                            "start": kp["start"],
+                            "end": kp["end"],
+                            "amount": round(ledger.period_sum(start, end), 2),
+                        }
+                        for kp, (start, end) in zip(k_periods, bounds)
+                    ]
+                total_amount = round(ledger.amount_total, 2)
+                total_ceiling = round(ledger.ceiling_total, 2)
+        finally:
+            conn.close()
+        return {
+            "transactionsTotalAmount": total_amount,
+            "transactionsTotalCeiling": total_ceiling,
+            "savingsByDates": project_savings(
+                savings_by_k, age, wage, inflation, rate, is_nps, trajectory,
+            ),
+        }
+
+
+store = LedgerStore()
@@ -0,0 +1,147 @@
+"""Request-selected output shapes for the validator and filter endpoints.
+
+By default both endpoints echo every transaction back in ``valid`` and
+``invalid``.  A request may ask for less:
+
+``output``
+    ``"all"`` (the default), ``"invalid"`` (no ``valid`` list) or
+    ``"summary"`` (counts only).
+``fields``
+    Transaction fields to echo; the rest are left out of every row.
+``errorFormat``
+    ``"message"`` (the default) or ``"codes"``: invalid rows carry an
+    ``errors`` list of ``ERROR_CODES`` instead of a formatted ``message``.
+``maxErrors``
+    Stop after this many invalid rows.  Rows are checked in blocks of
+    ``SHAPE_BLOCK_ROWS`` and blocks after the one that reaches the limit
+    are not examined at all.
+
+Any of these adds ``counts`` (``valid`` / ``invalid`` rows examined) and
+``truncated`` to the response.  Services skip building rows and messages
+the shape leaves out.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from app.utils.columnar_table import ColumnarTable
+from app.utils.constants import SHAPE_BLOCK_ROWS
+
+ALL, INVALID, SUMMARY = "all", "invalid", "summary"
+MESSAGE, CODES = "message", "codes"
+
+INVALID_DATE = "INVALID_DATE"
+AMOUNT_NOT_NUMBER = "AMOUNT_NOT_NUMBER"
+AMOUNT_OUT_OF_RANGE = "AMOUNT_OUT_OF_RANGE"
+CEILING_MISMATCH = "CEILING_MISMATCH"
+REMANENT_MISMATCH = "REMANENT_MISMATCH"
+DUPLICATE_DATE = "DUPLICATE_DATE"
+OUTSIDE_K = "OUTSIDE_K"
+ERROR_CODES = (
+    INVALID_DATE, AMOUNT_NOT_NUMBER, AMOUNT_OUT_OF_RANGE, CEILING_MISMATCH,
+    REMANENT_MISMATCH, DUPLICATE_DATE, OUTSIDE_K,
+)
+
+OutputShape = namedtuple("OutputShape", ["rows", "fields", "codes", "max_errors"])
+OutputShape.__doc__ = """Parsed output options; see the module docstring.
+
+``rows`` is ``ALL``, ``INVALID`` or ``SUMMARY``, ``fields`` a tuple of
+names or ``None`` for every field, ``codes`` whether errors are codes and
+``max_errors`` an int or ``None``.
+"""
+
+FULL = OutputShape(ALL, None, False, None)
+
+
+def parse_output_shape(data):
+    """The ``OutputShape`` a request body asks for; ``ValueError`` if malformed."""
+    rows = data.get("output", ALL)
+    if rows not in (ALL, INVALID, SUMMARY):
+        raise ValueError(f"output must be one of {ALL}, {INVALID}, {SUMMARY}, got {rows!r}")
+    fields = data.get("fields")
+    if fields is not None:
+        if not isinstance(fields, list) or not all(isinstance(f, str) for f in fields):
+            raise ValueError("fields must be a list of field names")
+        fields = tuple(dict.fromkeys(fields))
+    error_format = data.get("errorFormat", MESSAGE)
+    if error_format not in (MESSAGE, CODES):
+        raise ValueError(f"errorFormat must be {MESSAGE} or {CODES}, got {error_format!r}")
+    max_errors = data.get("maxErrors")
+    if max_errors is not None and (type(max_errors) is not int or max_errors < 1):
+        raise ValueError("maxErrors must be a positive integer")
+    return OutputShape(rows, fields, error_format == CODES, max_errors)
+
+
+def examined_rows(is_valid, max_errors):
+    """Rows to examine: all, or up to and including the ``max_errors``-th invalid."""
+    if max_errors is not None:
+        invalid = np.flatnonzero(~is_valid)
+        if len(invalid) >= max_errors:
+            return int(invalid[max_errors - 1]) + 1
+    return len(is_valid)
+
+
+def examined_mask(status, n, max_errors, block_rows=SHAPE_BLOCK_ROWS):
+    """Validity of the rows to examine, out of ``n``.
+
+    ``status(start, stop)`` returns the validity mask of rows
+    ``start:stop``.  Without ``max_errors`` it is called once for every
+    row; otherwise for ``block_rows`` rows at a time, stopping at the block
+    that holds the ``max_errors``-th invalid row.
+    """
+    if max_errors is None:
+        return status(0, n)
+    parts = []
+    invalid = 0
+    for start in range(0, n, block_rows):
+        part = status(start, min(start + block_rows, n))
+        parts.append(part)
+        invalid += len(part) - int(np.count_nonzero(part))
+        if invalid >= max_errors:
+            break
+    is_valid = np.concatenate(parts) if parts else np.ones(0, dtype=bool)
+    return is_valid[:examined_rows(is_valid, max_errors)]
+
+
+def row_slice(transactions, start, stop):
+    """Rows ``start:stop`` of a list or ``ColumnarTable``."""
+    if start == 0 and stop == len(transactions):
+        return transactions
+    if isinstance(transactions, ColumnarTable):
+        return transactions.take(np.arange(start, stop))
+    return transactions[start:stop]
+
+
+def project(record, fields):
+    """``record`` itself, or a new dict of just ``fields`` (those it has)."""
+    if fields is None:
+        return record
+    return {name: record[name] for name in fields if name in record}
+
+
+def select_columns(table, fields):
+    """``ColumnarTable`` counterpart of ``project``."""
+    if fields is None:
+        return table
+    return ColumnarTable(
+        {name: table.columns[name] for name in fields if name in table.columns}, len(table),
+    )
+
+
+def shaped_result(shape, is_valid, total, build_valid, build_invalid):
+    """Response for a non-default ``shape``.
+
+    ``is_valid`` covers the examined rows; the builders take row indices
+    and are only called for the lists the shape includes.
+    """
+    valid = np.flatnonzero(is_valid)
+    invalid = np.flatnonzero(~is_valid)
+    result = {
+        "counts": {"valid": len(valid), "invalid": len(invalid)},
+        "truncated": len(is_valid) < total,
+    }
+    if shape.rows == ALL:
+        result["valid"] = build_valid(valid)
+    if shape.rows != SUMMARY:
+        result["invalid"] = build_invalid(invalid)
+    return result
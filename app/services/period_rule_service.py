@@ -1,117 +1,63 @@
-from bisect import bisect_left, bisect_right
-from datetime import datetime
-
-from sortedcontainers import SortedList
-
-from app.utils.constants import DATETIME_FMT
-
-
-def _parse_dt(s):
-    return datetime.strptime(s, DATETIME_FMT)
-
-
-def apply_q_rules(transactions, q_periods):
-    """Sweep-line approach: O((n + q) log(n + q)) instead of O(n * q).
+"""Period rules (q overrides, p extras, k grouping) as independent stages.
+
+Each stage is a thin wrapper around the fused engine in ``pipeline_service``,
+which callers needing more than one stage should use directly so that the
+periods are compiled once and the transactions are never copied.
+"""
+import numpy as np
+
+from app.services.pipeline_service import (
+    compile_periods,
+    k_savings,
+    run_pipeline,
+    transaction_epochs,
+)
+from app.services.output_shape import (
+    FULL,
+    OUTSIDE_K,
+    examined_mask,
+    row_slice,
+    select_columns,
+    shaped_result,
+)
+from app.utils.columnar_table import constant_column, list_column
+from app.utils.constants import SHAPE_BLOCK_ROWS
+from app.utils.metrics import metrics
+
+__all__ = [
+    "apply_k_grouping",
+    "apply_p_rules",
+    "apply_q_rules",
+    "filter_transactions",
+    "split_by_k",
+    "transaction_epochs",
+]
+
+
+def apply_q_rules(transactions, q_periods, epochs=None):
+    """Compiled timeline: O(q log q) once, then O(log q) per transaction.
 
     If multiple q periods match, use the one with the latest start.
     Ties broken by earliest position in the original list.
     """
     if not q_periods:
         return transactions
+    compiled = compile_periods(q_periods=q_periods)
+    return run_pipeline(transactions, compiled, epochs).adjusted
 
-    parsed_q = []
-    for i, qp in enumerate(q_periods):
-        parsed_q.append((
-            _parse_dt(qp["start"]),
-            _parse_dt(qp["end"]),
-            qp["fixed"],
-            i,
-        ))
-
-    START, TXN, END = 0, 1, 2
-    events = []
-    for start, end, fixed, idx in parsed_q:
-        events.append((start, START, idx, fixed, end))
-        events.append((end, END, idx, fixed, end))
-
-    txn_indices = {}
-    for ti, txn in enumerate(transactions):
-        dt = _parse_dt(txn["date"])
-        events.append((dt, TXN, ti, None, None))
-        txn_indices[ti] = dt
-
-    events.sort(key=lambda e: (e[0], e[1]))
-
-    # SortedList keyed by (-start_timestamp, idx) so first element = latest start, first in list
-    active = SortedList(key=lambda x: (-x[0].timestamp(), x[1]))
-    q_lookup = {}
-
-    result = [None] * len(transactions)
-
-    for ev in events:
-        ev_time, ev_type, ev_id, ev_fixed, ev_end = ev
-
-        if ev_type == START:
-            entry = (parsed_q[ev_id][0], ev_id, ev_fixed)
-            active.add(entry)
-            q_lookup[ev_id] = entry
-
-        elif ev_type == END:
-            entry = q_lookup.pop(ev_id, None)
-            if entry is not None:
-                active.discard(entry)
-
-        else:
-            txn = transactions[ev_id]
-            if active:
-                best = active[0]
-                result[ev_id] = {**txn, "remanent": round(best[2], 2)}
-            else:
-                result[ev_id] = txn.copy()
-
-    return result
 
-
-def apply_p_rules(transactions, p_periods):
-    """Sweep-line with running sum: O((n + p) log(n + p)) instead of O(n * p).
+def apply_p_rules(transactions, p_periods, epochs=None):
+    """Compiled timeline of running sums: O(log p) per transaction.
 
     All matching p periods stack -- their extras are summed.
     """
     if not p_periods:
         return transactions
-
-    ADD, TXN, REMOVE = 0, 1, 2
-    events = []
-    for pp in p_periods:
-        start = _parse_dt(pp["start"])
-        end = _parse_dt(pp["end"])
-        extra = pp["extra"]
-        events.append((start, ADD, extra, None))
-        events.append((end, REMOVE, extra, None))
-
-    for ti, txn in enumerate(transactions):
-        dt = _parse_dt(txn["date"])
-        events.append((dt, TXN, 0, ti))
-
-    events.sort(key=lambda e: (e[0], e[1]))
-
-    running_extra = 0.0
-    result = [None] * len(transactions)
-
-    for ev_time, ev_type, ev_val, ev_idx in events:
-        if ev_type == ADD:
-            running_extra += ev_val
-        elif ev_type == REMOVE:
-            running_extra -= ev_val
-        else:
-            txn = transactions[ev_idx]
-            new_remanent = txn.get("remanent", 0) + running_extra
-            result[ev_idx] = {**txn, "remanent": round(new_remanent, 2)}
-
-    return result
+    compiled = compile_periods(p_periods=p_periods)
+    return run_pipeline(transactions, compiled, epochs).adjusted
 
 
-def apply_k_grouping(transactions, k_periods):
+def apply_k_grouping(transactions, k_periods, epochs=None):
     """Prefix-sum with binary search: O(n log n + k log n) instead of O(n * k).
 
     Each k period independently sums remanents of transactions within its range.
@@ -123,59 +69,166 @@ def apply_k_grouping(transactions, k_periods):
             for kp in k_periods
         ]
 
-    paired = []
-    for txn in transactions:
-        paired.append((_parse_dt(txn["date"]), txn["remanent"]))
-    paired.sort(key=lambda x: x[0])
-
-    sorted_dates = [p[0] for p in paired]
-    prefix = [0.0] * (len(paired) + 1)
-    for i, (_, rem) in enumerate(paired):
-        prefix[i + 1] = prefix[i] + rem
-
-    savings = []
-    for kp in k_periods:
-        k_start = _parse_dt(kp["start"])
-        k_end = _parse_dt(kp["end"])
-        left = bisect_left(sorted_dates, k_start)
-        right = bisect_right(sorted_dates, k_end)
-        total = prefix[right] - prefix[left]
-        savings.append({
-            "start": kp["start"],
-            "end": kp["end"],
-            "amount": round(total, 2),
-        })
-    return savings
-
-
-def filter_transactions(transactions, q_periods, p_periods, k_periods):
-    """Full filter pipeline: q -> p -> k.
+    compiled = compile_periods(k_periods=k_periods)
+    return k_savings(compiled, run_pipeline(transactions, compiled, epochs))
+
+
+def filter_transactions(
+    transactions, q_periods, p_periods, k_periods, include_k_matches=False,
+    compiled=None, shape=None, block_rows=SHAPE_BLOCK_ROWS,
+):
+    """Full filter pipeline: q -> p from the compiled timeline, then k.
 
     Returns valid (within at least one k period) and invalid transactions.
+    k membership is an O(log k) lookup in the compiled interval index.  With
+    ``include_k_matches`` each valid transaction also carries ``kIndices``,
+    the positions in ``k_periods`` of every period containing it (the same
+    order as ``savingsByDates`` in the returns endpoints).  A precompiled
+    rule set may be passed as ``compiled``, in which case the period lists
+    are ignored.  A non-default ``OutputShape`` selects what the result
+    holds (see ``output_shape``); with ``maxErrors`` rows are checked
+    ``block_rows`` at a time.
     """
-    adjusted = apply_q_rules(transactions, q_periods)
-    adjusted = apply_p_rules(adjusted, p_periods)
+    if compiled is None:
+        compiled = compile_periods(q_periods, p_periods, k_periods or None)
+    if shape is not None and shape != FULL:
+        return _filter_shaped(transactions, compiled, include_k_matches, shape, block_rows)
+    store = run_pipeline(transactions, compiled, prefix_sums=False).store
+    return split_by_k(store, compiled, include_k_matches)
 
-    if not k_periods:
-        return {"valid": adjusted, "invalid": []}
 
-    parsed_k = [(_parse_dt(kp["start"]), _parse_dt(kp["end"])) for kp in k_periods]
+OUTSIDE_K_MESSAGE = "Transaction date outside all k periods"
 
-    # Sort k ranges by start for efficient checking
-    sorted_k = sorted(parsed_k)
 
+def split_by_k(store, compiled, include_k_matches=False):
+    """Materialize a pipeline's ``TransactionStore`` as ``valid``/``invalid``.
+
+    A store over a ``ColumnarTable`` is split into two tables instead, when
+    its remanents fit a column.
+    """
+    table = store.table()
+    if table is not None:
+        return _split_table(table, store.epochs, compiled, include_k_matches)
+    if not compiled.k_periods:
+        return {"valid": store.materialize(), "invalid": []}
+
+    k_index = compiled.k_index
     valid = []
     invalid = []
 
-    for txn in adjusted:
-        txn_dt = _parse_dt(txn["date"])
-        in_any_k = any(ks <= txn_dt <= ke for ks, ke in sorted_k)
-        if in_any_k:
-            valid.append(txn)
-        else:
-            invalid.append({
-                **txn,
-                "message": "Transaction date outside all k periods",
-            })
+    # Each output row is built once, straight from the store.
+    with metrics.time_stage("k_grouping"):
+        in_k = k_index.contains_many(store.epochs).tolist()
+        for i, (inside, epoch) in enumerate(zip(in_k, store.epochs.tolist())):
+            if not inside:
+                invalid.append(store.row(i, message=OUTSIDE_K_MESSAGE))
+            elif include_k_matches:
+                valid.append(store.row(i, kIndices=k_index.matches(epoch)))
+            else:
+                valid.append(store.row(i))
+
+    return {"valid": valid, "invalid": invalid}
+
 
+def _split_table(table, epochs, compiled, include_k_matches):
+    if not compiled.k_periods:
+        return {"valid": table, "invalid": []}
+
+    k_index = compiled.k_index
+    with metrics.time_stage("k_grouping"):
+        inside = k_index.contains_many(epochs)
+        rows = np.flatnonzero(inside)
+        outside = np.flatnonzero(~inside)
+        valid = table.take(rows)
+        if include_k_matches:
+            matches = [k_index.matches(epoch) for epoch in epochs[rows].tolist()]
+            valid = valid.with_columns(kIndices=list_column(matches))
+        invalid = table.take(outside).with_columns(
+            message=constant_column(OUTSIDE_K_MESSAGE, len(outside)),
+        )
     return {"valid": valid, "invalid": invalid}
+
+
+def _filter_shaped(transactions, compiled, include_k_matches, shape, block_rows):
+    """``filter_transactions`` for a non-default ``OutputShape``.
+
+    With ``maxErrors`` and k periods, k membership is checked block by
+    block first and only the rows up to the last reported error go
+    through the q/p pipeline.
+    """
+    if shape.max_errors is None or not compiled.k_periods:
+        store = run_pipeline(transactions, compiled, prefix_sums=False).store
+        return _split_shaped(store, compiled, include_k_matches, shape, len(store))
+
+    blocks = []
+
+    def status(start, stop):
+        epochs = np.asarray(
+            transaction_epochs(row_slice(transactions, start, stop)), dtype=np.int64,
+        )
+        blocks.append(epochs)
+        return compiled.k_index.contains_many(epochs)
+
+    with metrics.time_stage("k_grouping"):
+        inside = examined_mask(status, len(transactions), shape.max_errors, block_rows)
+    epochs = np.concatenate(blocks)[:len(inside)] if blocks else None
+    store = run_pipeline(
+        row_slice(transactions, 0, len(inside)), compiled, epochs, prefix_sums=False,
+    ).store
+    return _split_shaped(
+        store, compiled, include_k_matches, shape, len(transactions), inside,
+    )
+
+
+def _split_shaped(store, compiled, include_k_matches, shape, total, inside=None):
+    """``split_by_k`` for a non-default ``OutputShape``.
+
+    ``inside`` is the k membership of the store's rows when already known.
+    """
+    k_index = compiled.k_index if compiled.k_periods else None
+    with metrics.time_stage("k_grouping"):
+        if inside is None and k_index is None:
+            inside = np.ones(len(store), dtype=bool)
+        elif inside is None:
+            inside = k_index.contains_many(store.epochs)
+        table = store.table()
+        epochs = store.epochs
+
+        def build_valid(rows):
+            matches = None
+            if include_k_matches and k_index is not None:
+                matches = [k_index.matches(epoch) for epoch in epochs[rows].tolist()]
+            if table is not None:
+                valid = select_columns(table.take(rows), shape.fields)
+                if matches is not None:
+                    valid = valid.with_columns(kIndices=list_column(matches))
+                return valid
+            if matches is None:
+                return [_store_row(store, i, shape.fields) for i in rows.tolist()]
+            return [
+                _store_row(store, i, shape.fields, kIndices=indices)
+                for i, indices in zip(rows.tolist(), matches)
+            ]
+
+        def build_invalid(rows):
+            if shape.codes:
+                return [
+                    _store_row(store, i, shape.fields, errors=[OUTSIDE_K])
+                    for i in rows.tolist()
+                ]
+            if table is not None:
+                return select_columns(table.take(rows), shape.fields).with_columns(
+                    message=constant_column(OUTSIDE_K_MESSAGE, len(rows)),
+                )
+            return [
+                _store_row(store, i, shape.fields, message=OUTSIDE_K_MESSAGE)
+                for i in rows.tolist()
+            ]
+
+        return shaped_result(shape, inside, total, build_valid, build_invalid)
+
+
+def _store_row(store, i, fields, **extra):
+    if fields is None:
+        return store.row(i, **extra)
+    return {**store.project(i, fields), **extra}
@@ -0,0 +1,237 @@
+"""q and p periods compiled into a piecewise-constant timeline.
+
+Transaction dates are whole seconds, so a period ``[start, end]`` takes
+effect at ``start`` and stops at ``end + 1``.  Those instants cut the time
+axis into elementary intervals inside which the q winner and the p sum are
+constant.  Both are resolved once, at compile time, by replaying the
+boundary events in the order the original sweep applied them, so every
+interval holds exactly what the sweep computed: the latest-start q period
+(lowest index on ties), a q period whose end precedes its start never
+closing, and the p extras as the same running float sum.  Applying the
+rules to a batch of transactions is then one ``searchsorted``, whatever the
+number of periods or how much they overlap.
+"""
+import heapq
+
+import numpy as np
+
+from app.services.columnar_engine import load_numbers, numeric_mask
+from app.services.transaction_store import (
+    FLOAT,
+    INT,
+    OBJECT,
+    UNCHANGED,
+    remanent_kind,
+)
+from app.utils.columnar_table import ColumnarTable
+from app.utils.datetime_codec import to_epoch
+from app.utils.rounding import round2
+
+START, END = 0, 2
+# Resolved kind for rows whose p total must be computed on the Python value.
+P_PENDING = 4
+
+
+def sorted_events(periods, payload):
+    """``(epoch, kind, payload)`` boundary events in sweep order.
+
+    A START at t applies to a transaction at t, an END at t only after it.
+    """
+    events = []
+    for i, period in enumerate(periods):
+        events.append((to_epoch(period["start"]), START, payload(i, period)))
+        events.append((to_epoch(period["end"]), END, payload(i, period)))
+    events.sort(key=lambda e: (e[0], e[1]))
+    return events
+
+
+def _effective(event):
+    # First transaction second the event applies to.  Non-decreasing in
+    # sweep order, so the events applied by time t are always a prefix.
+    epoch, kind, _ = event
+    return epoch if kind == START else epoch + 1
+
+
+def _q_states(q_events):
+    """Breaks, and the winning ``(index, fixed)`` (or None) before/after each."""
+    breaks, states = [], [None]
+    heap, active = [], set()
+    for pos, event in enumerate(q_events):
+        _, kind, entry = event
+        if kind == START:
+            heapq.heappush(heap, entry)
+            active.add(entry[1])
+        else:
+            # An END seen before its START is ignored, so inverted periods
+            # stay open.
+            active.discard(entry[1])
+        if pos + 1 < len(q_events) and _effective(q_events[pos + 1]) == _effective(event):
+            continue
+        while heap and heap[0][1] not in active:
+            heapq.heappop(heap)
+        breaks.append(_effective(event))
+        states.append((heap[0][1], heap[0][2]) if heap else None)
+    return breaks, states
+
+
+def _p_states(p_events):
+    """Breaks, running extras before/after each, and the first failing break."""
+    breaks, states = [], [0.0]
+    running = 0.0
+    for pos, event in enumerate(p_events):
+        _, kind, extra = event
+        try:
+            running = running + extra if kind == START else running - extra
+        except TypeError as exc:
+            return breaks, states, (_effective(event), exc)
+        if pos + 1 < len(p_events) and _effective(p_events[pos + 1]) == _effective(event):
+            continue
+        breaks.append(_effective(event))
+        states.append(running)
+    return breaks, states, None
+
+
+class PeriodTimeline:
+    """Resolved q overrides and p extras per elementary interval.
+
+    ``breaks`` holds the sorted interval starts; slot ``j`` (0..len(breaks))
+    covers ``[breaks[j - 1], breaks[j])``, slot 0 being everything before
+    the first break.  Per slot, ``kind``/``value`` give the remanent a q
+    winner imposes (p extra included) in ``TransactionStore`` encoding, or
+    ``UNCHANGED`` when no q period is open, and ``extra`` the p sum.
+    """
+
+    def __init__(self, q_periods=None, p_periods=None):
+        self.has_q = bool(q_periods)
+        self.has_p = bool(p_periods)
+        q_breaks, q_states = _q_states(
+            sorted_events(q_periods, lambda i, qp: (-to_epoch(qp["start"]), i, qp["fixed"]))
+            if self.has_q else []
+        )
+        p_breaks, p_states, self._p_error = _p_states(
+            sorted_events(p_periods, lambda i, pp: pp["extra"]) if self.has_p else []
+        )
+
+        self.breaks = np.unique(np.array(q_breaks + p_breaks, dtype=np.int64))
+        starts = self.breaks.tolist()
+        q_slots = [0] + np.searchsorted(q_breaks, starts, side="right").tolist()
+        p_slots = [0] + np.searchsorted(p_breaks, starts, side="right").tolist()
+
+        self._fixed = []
+        self._extras = []
+        kinds, values = [], []
+        for q_slot, p_slot in zip(q_slots, p_slots):
+            winner = q_states[q_slot]
+            extra = p_states[min(p_slot, len(p_states) - 1)]
+            self._fixed.append(winner)
+            self._extras.append(extra)
+            if winner is None:
+                kinds.append(UNCHANGED)
+                values.append(0.0)
+                continue
+            try:
+                value = self._q_remanent(len(self._fixed) - 1)
+            except (TypeError, ValueError, OverflowError):
+                # Raised again, row by row, when a transaction lands here.
+                kinds.append(OBJECT)
+                values.append(0.0)
+                continue
+            kind = remanent_kind(value)
+            kinds.append(kind)
+            values.append(value if kind != OBJECT else 0.0)
+        self.kind = np.array(kinds, dtype=np.uint8)
+        self.value = np.array(values, dtype=np.float64)
+        self.extra = np.array(self._extras, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.kind)
+
+    def _q_remanent(self, slot):
+        remanent = round(self._fixed[slot][1], 2)
+        if self.has_p:
+            remanent = round(remanent + self._extras[slot], 2)
+        return remanent
+
+    def slots(self, epochs):
+        """Slot of every epoch: one ``searchsorted`` over the batch."""
+        return np.searchsorted(self.breaks, epochs, side="right")
+
+    def window(self, lo=None, hi=None):
+        """``resolve`` arguments covering the epochs in ``[lo, hi]``.
+
+        Only the slots those epochs can fall in are kept, so a time shard
+        ships just the periods around its range.
+        """
+        first = 0 if lo is None else int(np.searchsorted(self.breaks, lo, side="right"))
+        last = len(self.breaks) if hi is None else int(
+            np.searchsorted(self.breaks, hi, side="right")
+        )
+        return (
+            self.breaks[first:last], self.kind[first:last + 1],
+            self.value[first:last + 1], self.extra[first:last + 1], self.has_p,
+        )
+
+    def check(self, epochs):
+        """Raise the p extras' ``TypeError`` if any epoch reaches it."""
+        if self._p_error is not None:
+            at, exc = self._p_error
+            if (epochs >= at).any():
+                raise type(exc)(*exc.args)
+
+    def source_numbers(self, store):
+        """The source remanents (0 when absent) that p extras add to.
+
+        ``(float64 values, exact mask)``; only needed when ``has_p``.
+        """
+        source = store.source
+        if isinstance(source, ColumnarTable):
+            return source.numbers("remanent", default=0)
+        remanents = [txn.get("remanent", 0) for txn in source]
+        return load_numbers(remanents, numeric_mask(remanents))
+
+    def apply(self, store):
+        """Write the q/p remanent of every row into ``store``."""
+        self.check(store.epochs)
+        numbers = exact = None
+        if self.has_p:
+            numbers, exact = self.source_numbers(store)
+        kinds, values = resolve(*self.window(), store.epochs, numbers, exact)
+        self.write(store, kinds, values)
+
+    def write(self, store, kinds, values):
+        """Store ``resolve``'s output, finishing the rows it left pending."""
+        for kind in (FLOAT, INT):
+            rows = np.flatnonzero(kinds == kind)
+            store.assign(rows, values[rows], kind)
+        for kind in (OBJECT, P_PENDING):
+            rows = np.flatnonzero(kinds == kind)
+            for i, slot in zip(rows.tolist(), self.slots(store.epochs[rows]).tolist()):
+                if kind == OBJECT:
+                    store.set_remanent(i, self._q_remanent(slot))
+                else:
+                    remanent = store.source[i].get("remanent", 0)
+                    store.set_remanent(i, round(remanent + self._extras[slot], 2))
+
+
+def resolve(breaks, kind, value, extra, has_p, epochs, numbers, exact):
+    """Per-row ``(kinds, values)`` of a timeline window for ``epochs``.
+
+    ``numbers``/``exact`` are the rows' source remanents (for p).  Rows
+    with no q winner get their p total as ``FLOAT``; those whose remanent
+    is not a plain float64 come back ``P_PENDING``, and q ``OBJECT`` rows
+    as they are, for ``PeriodTimeline.write`` to finish one by one.  Plain
+    NumPy, so it runs the same in a pool process on one time shard.
+    """
+    slots = np.searchsorted(breaks, epochs, side="right")
+    kinds = kind[slots]
+    values = value[slots]
+    if has_p:
+        # No q winner: the p extra goes on top of the row's own remanent.
+        rows = np.flatnonzero(kinds == UNCHANGED)
+        with np.errstate(invalid="ignore"):
+            totals = round2(numbers[rows] + extra[slots[rows]])
+        ok = exact[rows]
+        values[rows[ok]] = totals[ok]
+        kinds[rows[ok]] = FLOAT
+        kinds[rows[~ok]] = P_PENDING
+    return kinds, values
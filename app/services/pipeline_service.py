@@ -0,0 +1,252 @@
+"""Fused q -> p -> k engine.
+
+q and p periods are compiled ahead of time into a ``PeriodTimeline``, so the
+q override and p extra of every transaction come from one ``searchsorted``
+and are written into a ``TransactionStore``; no transaction dict is copied
+until a caller materializes the result.  k totals are differences of one
+cumulative sum over the remanents in epoch order, and k membership is
+answered by an ``IntervalIndex`` built at compile time.
+
+Requests of ``PARALLEL_PIPELINE_MIN_ROWS`` transactions or more spread the
+array work over the shared process pool.  Date decoding is split by list
+position.  The q/p resolution and the epoch sort are split by time range,
+and each shard receives only the timeline slots around its range.  Shards
+never split a run of equal epochs, so their sorted rows, concatenated in
+time order, are exactly the serial stable sort.  The k prefix sum stays one
+cumulative sum in the parent, so every total is bit-identical to the
+serial path.
+"""
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from app.services.period_timeline import PeriodTimeline, resolve
+from app.services.transaction_store import TransactionStore
+from app.utils.columnar_table import EPOCH, ColumnarTable
+from app.utils.constants import PARALLEL_PIPELINE_MIN_ROWS
+from app.utils.datetime_codec import to_epoch, to_epochs
+from app.utils.interval_index import IntervalIndex
+from app.utils.metrics import metrics
+from app.utils.process_pool import discard_process_pool, get_process_pool, pool_size
+
+CompiledPeriods = namedtuple(
+    "CompiledPeriods", ["timeline", "k_index", "k_bounds", "k_periods"]
+)
+CompiledPeriods.__doc__ = """Parsed q/p/k rules, reusable across requests.
+
+``timeline`` is the ``PeriodTimeline`` of the q and p periods, ``None``
+when both are absent.  ``k_index`` is an ``IntervalIndex`` over
+``k_bounds``.  An absent rule set is not the same as an empty one for q and
+p: absent stages leave transactions untouched.
+"""
+
+
+class PipelineResult(
+    namedtuple("PipelineResult", ["store", "sorted_epochs", "prefix"])
+):
+    """Output of ``run_pipeline``.
+
+    ``store`` is the ``TransactionStore`` the stages wrote to; ``adjusted``
+    materializes it as dicts.  ``sorted_epochs`` and ``prefix`` are the
+    float64 remanent prefix sums over the sorted epochs (both NumPy arrays).
+    """
+
+    __slots__ = ()
+
+    @property
+    def adjusted(self):
+        return self.store.materialize()
+
+    @property
+    def epochs(self):
+        return self.store.epochs
+
+
+def transaction_epochs(transactions):
+    """Epoch seconds of every transaction date, in list order.
+
+    Compute this once per request and pass it to each stage as ``epochs``;
+    the q/p stages keep list order, so the same epochs stay valid throughout.
+    """
+    return _date_epochs(transactions).tolist()
+
+
+def _date_epochs(transactions, shards=1):
+    if isinstance(transactions, ColumnarTable) and transactions.kind("date") == EPOCH:
+        return transactions.columns["date"].values
+    dates = [txn["date"] for txn in transactions]
+    if shards < 2:
+        return to_epochs(dates)
+    # In list order, so the first bad date raises as it would serially.
+    size = -(-len(dates) // shards)
+    parts = [dates[i:i + size] for i in range(0, len(dates), size)]
+    return np.concatenate(list(_pool_map(to_epochs, parts)))
+
+
+def _shard_count(transactions):
+    """Time shards for one request: 1 (serial) unless it is large."""
+    if (
+        not PARALLEL_PIPELINE_MIN_ROWS
+        or len(transactions) < PARALLEL_PIPELINE_MIN_ROWS
+        or pool_size() < 2
+        # Pool processes (returns:batch, cli.py) must not start pools.
+        or multiprocessing.parent_process() is not None
+    ):
+        return 1
+    return pool_size()
+
+
+def _pool_map(func, *iterables):
+    try:
+        return list(get_process_pool().map(func, *iterables))
+    except BrokenProcessPool:
+        discard_process_pool()
+        raise
+
+
+def compile_periods(q_periods=None, p_periods=None, k_periods=None):
+    """Parse period boundaries and resolve the q/p timeline once.
+
+    Falsy q/p lists are absent (stage skipped), matching the
+    ``if not q_periods: return transactions`` shortcut of the stages.
+    """
+    timeline = k_index = k_bounds = None
+    if q_periods or p_periods:
+        timeline = PeriodTimeline(q_periods, p_periods)
+    if k_periods is not None:
+        k_bounds = [(to_epoch(kp["start"]), to_epoch(kp["end"])) for kp in k_periods]
+        k_index = IntervalIndex(k_bounds)
+    return CompiledPeriods(timeline, k_index, k_bounds, k_periods)
+
+
+def run_pipeline(transactions, compiled, epochs=None, prefix_sums=True):
+    """Apply q overrides and p extras, and prefix-sum for k.
+
+    The compiled timeline writes every remanent into a ``TransactionStore``
+    over ``transactions``, without copying dicts.  The sorted epochs and
+    remanent prefix sums used for k totals are ``None`` when no k periods
+    were compiled or ``prefix_sums`` is off.  The store's size is added to
+    the ``store_rows`` and ``store_bytes`` counters.
+    """
+    with metrics.time_stage("qp_sweep"):
+        result = _sweep(transactions, compiled, epochs, prefix_sums)
+    metrics.increment("store_rows", len(result.store))
+    metrics.increment("store_bytes", result.store.nbytes)
+    return result
+
+
+def _sweep(transactions, compiled, epochs, prefix_sums):
+    shards = _shard_count(transactions)
+    if epochs is None:
+        epochs = _date_epochs(transactions, shards)
+    epochs = np.asarray(epochs, dtype=np.int64)
+    if shards > 1:
+        return _sweep_sharded(transactions, compiled, epochs, prefix_sums, shards)
+
+    store = TransactionStore(transactions, epochs, compiled.timeline is not None)
+    if compiled.timeline is not None:
+        compiled.timeline.apply(store)
+    if not prefix_sums or compiled.k_bounds is None:
+        return PipelineResult(store, None, None)
+
+    store.load_remanents()
+    return PipelineResult(store, *sorted_prefix_sums(epochs, store.remanent_values()))
+
+
+def _time_shards(epochs, shards):
+    """Row indices of each time shard, in list order within a shard.
+
+    Cut points are epoch quantiles; rows equal to a cut stay below it, so
+    equal epochs always share a shard.  Empty shards are dropped.
+    """
+    sample = np.sort(epochs[::max(1, len(epochs) // (64 * shards))])
+    cuts = np.unique(sample[(np.arange(1, shards) * len(sample)) // shards])
+    shard_of = np.searchsorted(cuts, epochs, side="left").astype(np.uint16)
+    order = np.argsort(shard_of, kind="stable")
+    bounds = np.cumsum(np.bincount(shard_of, minlength=len(cuts) + 1))[:-1]
+    return [rows for rows in np.split(order, bounds) if len(rows)]
+
+
+def _resolve_shard(window, epochs, numbers, exact, sort):
+    """One time shard, in a pool process: q/p resolution and epoch order."""
+    kinds = values = None
+    if window is not None:
+        kinds, values = resolve(*window, epochs, numbers, exact)
+    order = np.argsort(epochs, kind="stable") if sort else None
+    return kinds, values, order
+
+
+def _sweep_sharded(transactions, compiled, epochs, prefix_sums, shards):
+    timeline = compiled.timeline
+    need_k = prefix_sums and compiled.k_bounds is not None
+    store = TransactionStore(transactions, epochs, timeline is not None)
+    if timeline is None and not need_k:
+        return PipelineResult(store, None, None)
+
+    numbers = exact = None
+    if timeline is not None:
+        timeline.check(epochs)
+        if timeline.has_p:
+            numbers, exact = timeline.source_numbers(store)
+    parts = _time_shards(epochs, shards)
+    tasks = []
+    for rows in parts:
+        shard_epochs = epochs[rows]
+        tasks.append((
+            None if timeline is None
+            else timeline.window(shard_epochs.min(), shard_epochs.max()),
+            shard_epochs,
+            None if numbers is None else numbers[rows],
+            None if exact is None else exact[rows],
+            need_k,
+        ))
+    results = _pool_map(_resolve_shard, *zip(*tasks))
+
+    if timeline is not None:
+        kinds = np.empty(len(epochs), dtype=np.uint8)
+        values = np.empty(len(epochs), dtype=np.float64)
+        for rows, (shard_kinds, shard_values, _) in zip(parts, results):
+            kinds[rows] = shard_kinds
+            values[rows] = shard_values
+        timeline.write(store, kinds, values)
+    if not need_k:
+        return PipelineResult(store, None, None)
+
+    store.load_remanents()
+    order = np.concatenate(
+        [rows[shard_order] for rows, (_, _, shard_order) in zip(parts, results)]
+    )
+    return PipelineResult(
+        store, *sorted_prefix_sums(epochs, store.remanent_values(), order)
+    )
+
+
+def sorted_prefix_sums(epochs, remanents, order=None):
+    """``(sorted_epochs, prefix)`` for k totals over parallel arrays.
+
+    Rows are put in epoch order with a stable sort (equal epochs keep list
+    order, as ``sorted`` did) and summed one by one, exactly like a running
+    float sum.  ``order`` may pass that sort in, already computed.
+    """
+    if order is None:
+        order = np.argsort(epochs, kind="stable")
+    prefix = np.empty(len(order) + 1, dtype=np.float64)
+    prefix[0] = 0.0
+    prefix[1:] = remanents[order]
+    np.cumsum(prefix, out=prefix)
+    return epochs[order], prefix
+
+
+def k_savings(compiled, result):
+    """Sum of remanents inside each k period, from the sweep's prefix sums."""
+    with metrics.time_stage("k_grouping"):
+        bounds = np.array(compiled.k_bounds, dtype=np.int64).reshape(-1, 2)
+        left = np.searchsorted(result.sorted_epochs, bounds[:, 0], side="left")
+        right = np.searchsorted(result.sorted_epochs, bounds[:, 1], side="right")
+        totals = (result.prefix[right] - result.prefix[left]).tolist()
+        return [
+            {"start": kp["start"], "end": kp["end"], "amount": round(total, 2)}
+            for kp, total in zip(compiled.k_periods, totals)
+        ]
@@ -0,0 +1,161 @@
+"""Savings totals per calendar bucket (day, ISO week, month or year).
+
+The transactions go through the same q/p engine as ``/transactions:filter``
+and, when k periods are given, only those inside one count, so a rollup
+aggregates exactly the filter's ``valid`` output.  Epochs are mapped to an
+int64 bucket key with array arithmetic and every total is one
+``np.bincount`` over those keys, so the response holds one entry per
+non-empty bucket however many transactions went in.
+"""
+from datetime import date
+
+import numpy as np
+
+from app.services.pipeline_service import compile_periods, run_pipeline
+from app.utils.columnar_table import FLOAT, INT, ColumnarTable, format_epochs
+from app.utils.datetime_codec import try_epoch
+from app.utils.metrics import metrics
+from app.utils.rounding import round2
+
+GRANULARITIES = ("day", "week", "month", "year")
+
+_SECONDS_PER_DAY = 86_400
+# 1970-01-01 was a Thursday; ISO weeks start on Monday, three days earlier.
+_WEEK_OFFSET_DAYS = 3
+_UNITS = {"month": "datetime64[M]", "year": "datetime64[Y]"}
+_LABEL_LEN = {"day": 10, "month": 7, "year": 4}
+# Keys spanning up to this many slots per row are counted densely.
+_DENSE_SPAN_PER_ROW = 4
+
+
+def bucket_keys(epochs, granularity):
+    """Calendar bucket of each epoch as consecutive int64 keys."""
+    if granularity in _UNITS:
+        return epochs.astype("datetime64[s]").astype(_UNITS[granularity]).astype(np.int64)
+    days = epochs // _SECONDS_PER_DAY
+    if granularity == "day":
+        return days
+    return (days + _WEEK_OFFSET_DAYS) // 7
+
+
+def bucket_starts(keys, granularity):
+    """Epoch seconds at which each bucket key begins."""
+    if granularity in _UNITS:
+        return keys.astype(_UNITS[granularity]).astype("datetime64[s]").astype(np.int64)
+    if granularity == "day":
+        return keys * _SECONDS_PER_DAY
+    return (keys * 7 - _WEEK_OFFSET_DAYS) * _SECONDS_PER_DAY
+
+
+def _labels(starts, granularity):
+    if granularity == "week":
+        weeks = (date.fromisoformat(s[:10]).isocalendar() for s in starts)
+        return [f"{year:04d}-W{week:02d}" for year, week, _ in weeks]
+    size = _LABEL_LEN[granularity]
+    return [s[:size] for s in starts]
+
+
+def _group(keys):
+    """``(unique keys, row -> bucket index)``, keys ascending."""
+    lo, hi = int(keys.min()), int(keys.max())
+    if hi - lo < _DENSE_SPAN_PER_ROW * len(keys) + 1024:
+        offsets = keys - lo
+        present = np.flatnonzero(np.bincount(offsets, minlength=hi - lo + 1))
+        slot = np.empty(hi - lo + 1, dtype=np.int64)
+        slot[present] = np.arange(len(present))
+        return present + lo, slot[offsets]
+    return np.unique(keys, return_inverse=True)
+
+
+def _field(transactions, name):
+    if isinstance(transactions, ColumnarTable) and transactions.kind(name) in (INT, FLOAT):
+        return transactions.numbers(name)[0]
+    if isinstance(transactions, ColumnarTable):
+        return np.array(transactions.pylist(name), dtype=np.float64)
+    return np.fromiter(
+        (txn[name] for txn in transactions), dtype=np.float64, count=len(transactions),
+    )
+
+
+def _bound(name, value):
+    if value is None:
+        return None
+    epoch = try_epoch(value)
+    if epoch is None:
+        raise ValueError(f"{name} must be a date-time like 2023-01-31 23:59:59, got {value!r}")
+    return epoch
+
+
+def _totals(count, sums):
+    return {"count": count, **{name: round(float(total), 2) for name, total in sums.items()}}
+
+
+def rollup_transactions(
+    transactions, q_periods, p_periods, k_periods, granularity="month",
+    start=None, end=None, compiled=None,
+):
+    """Per-bucket ``count`` and ``amount``/``ceiling``/``remanent`` totals.
+
+    ``start`` and ``end`` (``DATETIME_FMT``, inclusive) restrict the range.
+    Buckets are listed in time order with their label (``2023-07-14``,
+    ``2023-W28``, ``2023-07`` or ``2023``) and first and last second.
+    Raises ``ValueError`` for an unknown granularity or a bad bound.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(
+            f"granularity must be one of {', '.join(GRANULARITIES)}, got {granularity!r}"
+        )
+    lo, hi = (_bound(name, value) for name, value in (("start", start), ("end", end)))
+    if compiled is None:
+        compiled = compile_periods(q_periods, p_periods, k_periods or None)
+
+    store = run_pipeline(transactions, compiled, prefix_sums=False).store
+    with metrics.time_stage("rollup"):
+        store.load_remanents()
+        epochs = np.asarray(store.epochs, dtype=np.int64)
+        keep = np.ones(len(epochs), dtype=bool)
+        if compiled.k_periods:
+            keep &= compiled.k_index.contains_many(epochs)
+        if lo is not None:
+            keep &= epochs >= lo
+        if hi is not None:
+            keep &= epochs <= hi
+        rows = np.flatnonzero(keep)
+        values = {
+            "amount": _field(transactions, "amount")[rows],
+            "ceiling": _field(transactions, "ceiling")[rows],
+            "remanent": store.remanent_values()[rows],
+        }
+        result = {
+            "granularity": granularity,
+            "buckets": [],
+            "totals": _totals(len(rows), {name: v.sum() for name, v in values.items()}),
+        }
+        if not len(rows):
+            return result
+
+        keys, inverse = _group(bucket_keys(epochs[rows], granularity))
+        counts = np.bincount(inverse, minlength=len(keys)).tolist()
+        sums = {
+            name: round2(np.bincount(inverse, weights=v, minlength=len(keys))).tolist()
+            for name, v in values.items()
+        }
+        starts = bucket_starts(keys, granularity)
+        ends = bucket_starts(keys + 1, granularity) - 1
+        start_text = format_epochs(starts)
+        result["buckets"] = [
+            {
+                "bucket": label,
+                "start": first,
+                "end": last,
+                "count": count,
+                "amount": amount,
+                "ceiling": ceiling,
+                "remanent": remanent,
+            }
+            for label, first, last, count, amount, ceiling, remanent in zip(
+                _labels(start_text, granularity), start_text, format_epochs(ends),
+                counts, sums["amount"], sums["ceiling"], sums["remanent"],
+            )
+        ]
+    return result
@@ -0,0 +1,130 @@
+"""Registry of uploaded q/p/k rule sets, addressed by content hash.
+
+Rule sets are compiled once (q/p timeline resolved, k interval index built)
+and kept in a size-bounded LRU.  The raw rules are also written to
+``RULESET_DIR`` so that any gunicorn worker can recompile an ID it has not
+seen yet.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+from app.services.pipeline_service import compile_periods
+from app.utils.constants import RULESET_CACHE_SIZE, RULESET_DIR
+
+
+class UnknownRuleset(KeyError):
+    pass
+
+
+_RULESET_ID = re.compile(r"[0-9a-f]{64}")
+
+
+def _canonical_rules(q_periods, p_periods, k_periods):
+    return {"q": q_periods, "p": p_periods, "k": k_periods}
+
+
+def ruleset_id(q_periods, p_periods, k_periods):
+    """Content hash of a rule set; identical rules always get the same ID."""
+    payload = json.dumps(
+        _canonical_rules(q_periods, p_periods, k_periods),
+        sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _compile(rules):
+    return compile_periods(rules["q"], rules["p"], rules["k"])
+
+
+class RulesetRegistry:
+    def __init__(self, capacity=RULESET_CACHE_SIZE, directory=RULESET_DIR):
+        self.capacity = capacity
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, rid):
+        return os.path.join(self.directory, f"{rid}.json")
+
+    def _remember(self, rid, compiled):
+        with self._lock:
+            self._cache[rid] = compiled
+            self._cache.move_to_end(rid)
+            while len(self._cache) > self.capacity:
+                self._cache.popitem(last=False)
+
+    def register(self, q_periods, p_periods, k_periods):
+        """Compile and store a rule set, returning its ID.
+
+        Raises ``ValueError``/``KeyError`` if the periods do not parse.
+        """
+        rules = _canonical_rules(q_periods, p_periods, k_periods)
+        compiled = _compile(rules)
+        rid = ruleset_id(q_periods, p_periods, k_periods)
+
+        path = self._path(rid)
+        if not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(rules, f)
+            os.replace(tmp, path)
+        self._remember(rid, compiled)
+        return rid
+
+    def get(self, rid):
+        """Compiled periods for ``rid``; raises ``UnknownRuleset`` if absent.
+
+        Only well-formed IDs are looked up, and a file read from disk must
+        hash back to ``rid``, so neither odd IDs nor a tampered or corrupt
+        file can fill the cache.
+        """
+        if not isinstance(rid, str) or not _RULESET_ID.fullmatch(rid):
+            raise UnknownRuleset(rid)
+        with self._lock:
+            compiled = self._cache.get(rid)
+            if compiled is not None:
+                self._cache.move_to_end(rid)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+
+        try:
+            with open(self._path(rid)) as f:
+                rules = json.load(f)
+            if ruleset_id(rules["q"], rules["p"], rules["k"]) != rid:
+                raise ValueError("rule set does not match its ID")
+            compiled = _compile(rules)
+        except (OSError, ValueError, KeyError, TypeError):
+            raise UnknownRuleset(rid) from None
+        self._remember(rid, compiled)
+        return compiled
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRatio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+registry = RulesetRegistry()
+
+
+def resolve_ruleset(data):
+    """Compiled periods for a request body's ``ruleset_id``, or ``None``."""
+    rid = data.get("ruleset_id")
+    if rid is None:
+        return None
+    return registry.get(str(rid))
@@ -0,0 +1,124 @@
+"""Monte Carlo projection of k-bucket savings.
+
+Each path draws one log return and one log inflation per year until
+retirement.  The means are set so that the expected yearly growth is
+``1 + rate`` and ``1 + inflation``, the deterministic figures.  A path's
+real growth factor is the exponential of its summed yearly differences.
+Paths are drawn in batches of ``SIM_BATCH_PATHS`` from a single seeded
+generator, so the first N paths are identical for a given seed no matter
+where the time budget stops the run.  Real value is linear in the
+invested amount, so each bucket's bands are its amount times the factor
+percentiles: one (buckets x 3) product, whatever the path count.
+"""
+import secrets
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from app.utils.constants import (
+    INFLATION_VOLATILITY,
+    SIM_BATCH_PATHS,
+    SIM_DEFAULT_BUDGET_MS,
+    SIM_DEFAULT_PATHS,
+    SIM_MAX_BUDGET_MS,
+    SIM_MAX_PATHS,
+)
+from app.utils.rounding import round2
+
+PERCENTILES = (5, 50, 95)
+
+SimulationSpec = namedtuple(
+    "SimulationSpec",
+    ["paths", "seed", "time_budget_ms", "return_volatility", "inflation_volatility"],
+)
+
+
+def _number(spec, key, default, low, high, kind):
+    value = spec.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"simulation.{key} must be a number")
+    if kind is int and value != int(value):
+        raise ValueError(f"simulation.{key} must be an integer")
+    if not low <= value <= high:
+        raise ValueError(f"simulation.{key} must be between {low} and {high}")
+    return kind(value)
+
+
+def parse_simulation(spec, return_volatility):
+    """``SimulationSpec`` from a request's ``simulation`` object, or ``None``.
+
+    ``return_volatility`` is the instrument's default; the request may
+    override it.  Raises ``ValueError`` on out-of-range settings.
+    """
+    if spec is None or spec is False:
+        return None
+    if spec is True:
+        spec = {}
+    if not isinstance(spec, dict):
+        raise ValueError("simulation must be an object")
+    seed = spec.get("seed")
+    if seed is None:
+        seed = secrets.randbits(32)
+    elif isinstance(seed, bool) or not isinstance(seed, int) or seed < 0:
+        raise ValueError("simulation.seed must be a non-negative integer")
+    return SimulationSpec(
+        paths=_number(spec, "paths", SIM_DEFAULT_PATHS, 1, SIM_MAX_PATHS, int),
+        seed=seed,
+        time_budget_ms=_number(
+            spec, "timeBudgetMs", SIM_DEFAULT_BUDGET_MS, 1, SIM_MAX_BUDGET_MS, int
+        ),
+        return_volatility=_number(
+            spec, "returnVolatility", return_volatility, 0.0, 1.0, float
+        ),
+        inflation_volatility=_number(
+            spec, "inflationVolatility", INFLATION_VOLATILITY, 0.0, 1.0, float
+        ),
+    )
+
+
+def _real_log_factors(rng, paths, years, rate, inflation, spec):
+    sigma_r = spec.return_volatility
+    sigma_i = spec.inflation_volatility
+    mu_r = np.log1p(rate) - sigma_r ** 2 / 2
+    mu_i = np.log1p(inflation) - sigma_i ** 2 / 2
+    returns = rng.normal(mu_r, sigma_r, size=(paths, years))
+    returns -= rng.normal(mu_i, sigma_i, size=(paths, years))
+    return returns.sum(axis=1)
+
+
+def simulate(savings_by_k, years, rate, inflation, spec):
+    """Percentile bands of real value per bucket, plus run information.
+
+    Stops drawing new batches once ``spec.time_budget_ms`` has elapsed; the
+    returned ``paths`` says how many were actually used.
+    """
+    deadline = time.perf_counter() + spec.time_budget_ms / 1000
+    rng = np.random.default_rng(spec.seed)
+    batches = []
+    done = 0
+    while done < spec.paths:
+        size = min(SIM_BATCH_PATHS, spec.paths - done)
+        batches.append(_real_log_factors(rng, size, years, rate, inflation, spec))
+        done += size
+        if time.perf_counter() >= deadline:
+            break
+
+    factors = np.exp(np.concatenate(batches))
+    low, mid, high = np.percentile(factors, PERCENTILES)
+    amounts = np.array([s["amount"] for s in savings_by_k], dtype=np.float64)
+    # Negative amounts flip the order of the bands.
+    bands = np.where(
+        amounts[:, None] >= 0,
+        amounts[:, None] * np.array([low, mid, high]),
+        amounts[:, None] * np.array([high, mid, low]),
+    )
+    bands = round2(bands).tolist()
+    info = {
+        "paths": done,
+        "seed": spec.seed,
+        "truncated": done < spec.paths,
+    }
+    return [
+        {f"p{p}": value for p, value in zip(PERCENTILES, row)} for row in bands
+    ], info
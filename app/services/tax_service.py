@@ -1,11 +1,172 @@
+"""Slab-based income tax and the NPS deduction benefit.
+
+Slab tables are compiled once into cumulative-tax breakpoints
+(``TaxRegime``), so the tax on one income is a binary search plus one
+multiply-add, and arrays of incomes are answered with one ``searchsorted``.
+Results are bit-for-bit those of walking the slabs.  Regimes are loaded at
+import: ``TAX_SLABS`` as ``DEFAULT_TAX_REGIME`` plus any in
+``TAX_REGIMES_FILE``; ``TAX_REGIME`` picks the active one.
+"""
+import json
+from bisect import bisect_left
+
+import numpy as np
+
 from app.utils.constants import (
+    DEFAULT_TAX_REGIME,
     MAX_NPS_DEDUCTION,
     NPS_DEDUCTION_INCOME_PCT,
+    TAX_REGIME,
+    TAX_REGIMES_FILE,
     TAX_SLABS,
+    TAX_VECTOR_MIN,
 )
+from app.utils.rounding import round2
+
+# Beyond 2**53, Python int arithmetic and float64 can disagree; such rows
+# (and non-finite ones) are computed one by one.
+_EXACT_LIMIT = 2.0 ** 53
+
+
+class TaxRegime:
+    """A slab table ``[(upper_limit, rate), ...]`` compiled for lookup.
+
+    ``cumulative[i]`` is the tax on every slab below slab ``i``, summed in the
+    same order as the slab walk, so ``cumulative[i] + (income - lower[i]) *
+    rate[i]`` reproduces the walk exactly.
+    """
+
+    def __init__(self, slabs):
+        self.slabs = [(limit, rate) for limit, rate in slabs]
+        if not self.slabs:
+            raise ValueError("A tax regime needs at least one slab")
+        self.limits = [limit for limit, _ in self.slabs]
+        if any(a >= b for a, b in zip(self.limits, self.limits[1:])):
+            raise ValueError("Slab limits must be strictly increasing")
+        self.rates = [rate for _, rate in self.slabs]
+        self.lowers = []
+        self.cumulative = []
+        tax = 0.0
+        prev_limit = 0.0
+        for limit, rate in self.slabs:
+            self.lowers.append(prev_limit)
+            self.cumulative.append(tax)
+            tax += (limit - prev_limit) * rate
+            prev_limit = limit
+
+        self._limits = np.array(self.limits, dtype=np.float64)
+        self._lowers = np.array(self.lowers, dtype=np.float64)
+        self._rates = np.array(self.rates, dtype=np.float64)
+        self._cumulative = np.array(self.cumulative, dtype=np.float64)
+
+    def _walk(self, income):
+        # The reference slab walk, for inputs the breakpoints cannot take.
+        if income <= self.limits[0]:
+            return 0.0
+        tax = 0.0
+        prev_limit = 0.0
+        for limit, rate in self.slabs:
+            if income <= limit:
+                tax += (income - prev_limit) * rate
+                break
+            else:
+                tax += (limit - prev_limit) * rate
+            prev_limit = limit
+        return round(tax, 2)
+
+    def tax(self, income):
+        if income <= self.limits[0]:
+            return 0.0
+        i = bisect_left(self.limits, income)
+        if i == 0 or i == len(self.limits):
+            # NaN, or above the last limit of a table without an open top slab.
+            return self._walk(income)
+        return round(self.cumulative[i] + (income - self.lowers[i]) * self.rates[i], 2)
+
+    def taxes(self, incomes):
+        """``tax`` for every income in a sequence, as a float64 array."""
+        values = incomes
+        incomes = np.asarray(incomes, dtype=np.float64)
+        exact = np.abs(incomes) < _EXACT_LIMIT
+        i = np.searchsorted(self._limits, incomes, side="left")
+        fast = exact & (incomes > self._limits[0]) & (i < len(self.limits))
+        zero = exact & ~(incomes > self._limits[0])
+
+        out = np.zeros(len(incomes), dtype=np.float64)
+        idx = i[fast]
+        out[fast] = round2(
+            self._cumulative[idx] + (incomes[fast] - self._lowers[idx]) * self._rates[idx]
+        )
+        for pos in np.flatnonzero(~(fast | zero)).tolist():
+            out[pos] = self.tax(values[pos])
+        return out
+
+    def nps_benefit(self, invested, annual_income, income_tax=None):
+        """Tax saved by deducting the NPS contribution from ``annual_income``.
 
+        ``income_tax`` may carry ``tax(annual_income)`` when it is known.
+        """
+        nps_deduction = min(
+            invested,
+            NPS_DEDUCTION_INCOME_PCT * annual_income,
+            MAX_NPS_DEDUCTION,
+        )
+        if income_tax is None:
+            income_tax = self.tax(annual_income)
+        return round(income_tax - self.tax(annual_income - nps_deduction), 2)
 
-def calculate_tax(income: float) -> float:
+    def nps_benefits(self, invested, annual_income):
+        """``nps_benefit`` for many contributions at one income, as a list."""
+        income_tax = self.tax(annual_income)
+        if len(invested) < TAX_VECTOR_MIN or not abs(annual_income) < _EXACT_LIMIT:
+            return [self.nps_benefit(x, annual_income, income_tax) for x in invested]
+
+        amounts = np.asarray(invested, dtype=np.float64)
+        exact = np.abs(amounts) < _EXACT_LIMIT
+        deductions = np.minimum(
+            np.minimum(amounts, NPS_DEDUCTION_INCOME_PCT * annual_income),
+            MAX_NPS_DEDUCTION,
+        )
+        deductions[~exact] = 0.0
+        benefits = round2(income_tax - self.taxes(annual_income - deductions))
+        for pos in np.flatnonzero(~exact).tolist():
+            benefits[pos] = self.nps_benefit(invested[pos], annual_income, income_tax)
+        return benefits.tolist()
+
+
+def _parse_limit(limit):
+    return float("inf") if limit is None else limit
+
+
+def load_regimes(path=TAX_REGIMES_FILE):
+    """Built-in regime plus those in the JSON file at ``path`` (if any)."""
+    regimes = {DEFAULT_TAX_REGIME: TaxRegime(TAX_SLABS)}
+    if path:
+        with open(path) as f:
+            for name, slabs in json.load(f).items():
+                regimes[name] = TaxRegime(
+                    (_parse_limit(limit), rate) for limit, rate in slabs
+                )
+    return regimes
+
+
+REGIMES = load_regimes()
+
+
+def get_regime(name=None):
+    """Regime by name; ``None`` means the configured ``TAX_REGIME``."""
+    name = TAX_REGIME if name is None else name
+    try:
+        return REGIMES[name]
+    except KeyError:
+        raise ValueError(f"Unknown tax regime: {name}") from None
+
+
+# Fail at start-up, not on the first request, if TAX_REGIME is misspelt.
+get_regime()
+
+
+def calculate_tax(income: float, regime=None) -> float:
     """
     Calculate tax
     Slabs:
@@ -15,33 +176,18 @@ def calculate_tax(income: float) -> float:
       12L - 15L: 20%
       15L+:      30%
     """
-    if income <= TAX_SLABS[0][0]:
-        return 0.0
-
-    tax = 0.0
-    prev_limit = 0.0
-    for limit, rate in TAX_SLABS:
-        if income <= limit:
-            tax += (income - prev_limit) * rate
-            break
-        else:
-            tax += (limit - prev_limit) * rate
-        prev_limit = limit
-    return round(tax, 2)
+    return get_regime(regime).tax(income)
 
 
 def calculate_nps_tax_benefit(
-    invested, annual_income):
+    invested, annual_income, regime=None):
     """
     NPS tax benefit = Tax(income) - Tax(income - NPS_Deduction).
     NPS_Deduction = min(invested, 10% of annual_income, 2,00,000)
     """
-    nps_deduction = min(
-        invested,
-        NPS_DEDUCTION_INCOME_PCT * annual_income,
-        MAX_NPS_DEDUCTION,
-    )
-    benefit = calculate_tax(annual_income) - calculate_tax(
-        annual_income - nps_deduction
-    )
-    return round(benefit, 2)
+    return get_regime(regime).nps_benefit(invested, annual_income)
+
+
+def nps_tax_benefits(invested, annual_income, regime=None):
+    """``calculate_nps_tax_benefit`` for a list of amounts at one income."""
+    return get_regime(regime).nps_benefits(invested, annual_income)
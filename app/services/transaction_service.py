@@ -1,14 +1,45 @@
 import math
-from datetime import datetime
 
-from app.utils.constants import DATETIME_FMT, MAX_AMOUNT, ROUNDING_CONST
+import numpy as np
+
+from app.services import columnar_engine
+from app.services.output_shape import (
+    AMOUNT_NOT_NUMBER,
+    AMOUNT_OUT_OF_RANGE,
+    CEILING_MISMATCH,
+    DUPLICATE_DATE,
+    FULL,
+    INVALID_DATE,
+    REMANENT_MISMATCH,
+    examined_mask,
+    project,
+    row_slice,
+    select_columns,
+    shaped_result,
+)
+from app.utils.columnar_table import (
+    EPOCH,
+    INT,
+    Column,
+    ColumnarTable,
+    number_column,
+    string_column,
+)
+from app.utils.constants import (
+    COLUMNAR_MIN_ROWS,
+    MAX_AMOUNT,
+    ROUNDING_CONST,
+    SHAPE_BLOCK_ROWS,
+)
+from app.utils.datetime_codec import try_epoch
+from app.utils.metrics import metrics
 
 
 def compute_ceiling(amount):
     return math.ceil(amount / ROUNDING_CONST) * ROUNDING_CONST
 
 
-def parse_expenses(expenses):
+def _parse_expenses_scalar(expenses):
     transactions = []
     for exp in expenses:
         amount = exp["amount"]
@@ -23,56 +54,309 @@ def parse_expenses(expenses):
     return transactions
 
 
-def _parse_date(date_str):
-    try:
-        return datetime.strptime(date_str, DATETIME_FMT)
-    except (ValueError, TypeError):
+def _parse_expenses_table(expenses):
+    amounts, exact = expenses.numbers("amount")
+    if "timestamp" not in expenses or "amount" not in expenses or not exact.all():
         return None
+    is_int = expenses.int_mask("amount")
+    amount, ceiling, remanent = columnar_engine.parse_numbers(amounts, is_int)
+    return ColumnarTable({
+        "date": expenses.columns["timestamp"],
+        "amount": number_column(amount, is_int),
+        "ceiling": Column(INT, ceiling, None),
+        "remanent": number_column(remanent, is_int),
+    }, len(expenses))
+
+
+def parse_expenses(expenses):
+    """Round each expense up to the next multiple of ROUNDING_CONST.
+
+    A ``ColumnarTable`` of expenses is parsed column-wise into a table of
+    transactions, with output identical to the per-record loop.  A list of
+    dicts goes through that loop: the response needs a dict per row anyway,
+    and building those dominates the cost, so arrays would not pay off.
+    """
+    with metrics.time_stage("parse"):
+        if isinstance(expenses, ColumnarTable):
+            transactions = _parse_expenses_table(expenses)
+            if transactions is not None:
+                return transactions
+        return _parse_expenses_scalar(expenses)
+
+
+def iter_parse_expenses(expense_chunks):
+    """Generator form of ``parse_expenses`` over an iterable of chunks."""
+    for chunk in expense_chunks:
+        yield parse_expenses(chunk)
+
+
+def _transaction_errors(txn, codes=False):
+    """All validation errors for one transaction, except duplicate dates.
+
+    Formatted messages, or just their ``output_shape`` codes with ``codes``.
+    """
+    errors = []
+
+    date_str = txn.get("date", "")
+    if try_epoch(date_str) is None:
+        errors.append(INVALID_DATE if codes else f"Invalid date format: {date_str}")
+
+    amount = txn.get("amount")
+    if amount is None or not isinstance(amount, (int, float)):
+        errors.append(AMOUNT_NOT_NUMBER if codes else "Amount must be a number")
+    elif amount < 0 or amount >= MAX_AMOUNT:
+        errors.append(
+            AMOUNT_OUT_OF_RANGE if codes
+            else f"Amount {amount} out of range [0, {MAX_AMOUNT})"
+        )
 
+    if not errors and isinstance(amount, (int, float)):
+        expected_ceiling = compute_ceiling(amount)
+        expected_remanent = expected_ceiling - amount
 
-def validate_transactions(wage, transactions):
+        ceiling = txn.get("ceiling")
+        remanent = txn.get("remanent")
+
+        if ceiling is None or round(ceiling, 2) != round(expected_ceiling, 2):
+            errors.append(
+                CEILING_MISMATCH if codes
+                else f"Ceiling mismatch: expected {expected_ceiling}, got {ceiling}"
+            )
+        if remanent is None or round(remanent, 2) != round(expected_remanent, 2):
+            errors.append(
+                REMANENT_MISMATCH if codes
+                else f"Remanent mismatch: expected {expected_remanent}, got {remanent}"
+            )
+    return errors
+
+
+def _invalid_message(txn, errors, duplicate):
+    if duplicate:
+        errors.append(f"Duplicate date: {txn.get('date', '')}")
+    return "; ".join(errors)
+
+
+def _invalid_entry(txn, errors, duplicate):
+    return {**txn, "message": _invalid_message(txn, errors, duplicate)}
+
+
+def _validate_scalar(transactions, seen_dates):
     valid = []
     invalid = []
-    seen_dates = {}
 
-    for idx, txn in enumerate(transactions):
-        errors = []
+    for txn in transactions:
+        errors = _transaction_errors(txn)
 
         date_str = txn.get("date", "")
-        dt = _parse_date(date_str)
-        if dt is None:
-            errors.append(f"Invalid date format: {date_str}")
-
-        amount = txn.get("amount")
-        if amount is None or not isinstance(amount, (int, float)):
-            errors.append("Amount must be a number")
-        elif amount < 0 or amount >= MAX_AMOUNT:
-            errors.append(f"Amount {amount} out of range [0, {MAX_AMOUNT})")
-
-        if not errors and isinstance(amount, (int, float)):
-            expected_ceiling = compute_ceiling(amount)
-            expected_remanent = expected_ceiling - amount
-
-            ceiling = txn.get("ceiling")
-            remanent = txn.get("remanent")
-
-            if ceiling is None or round(ceiling, 2) != round(expected_ceiling, 2):
-                errors.append(
-                    f"Ceiling mismatch: expected {expected_ceiling}, got {ceiling}"
-                )
-            if remanent is None or round(remanent, 2) != round(expected_remanent, 2):
-                errors.append(
-                    f"Remanent mismatch: expected {expected_remanent}, got {remanent}"
-                )
-
-        if date_str in seen_dates:
-            errors.append(f"Duplicate date: {date_str}")
-        else:
-            seen_dates[date_str] = idx
+        duplicate = date_str in seen_dates
+        if not duplicate:
+            seen_dates.add(date_str)
 
-        if errors:
-            invalid.append({**txn, "message": "; ".join(errors)})
+        if errors or duplicate:
+            invalid.append(_invalid_entry(txn, errors, duplicate))
         else:
             valid.append(txn)
 
     return {"valid": valid, "invalid": invalid}
+
+
+def _duplicate_mask(dates, seen_dates):
+    """Flag every date already seen, adding new ones to ``seen_dates``."""
+    unique = set(dates)
+    if len(unique) == len(dates) and seen_dates.isdisjoint(unique):
+        seen_dates |= unique
+        return np.zeros(len(dates), dtype=bool)
+    seen_add = seen_dates.add
+    return np.array([d in seen_dates or seen_add(d) for d in dates], dtype=bool)
+
+
+def _list_status(transactions, seen_dates):
+    """``(is_valid, duplicate)`` masks over a list of transaction dicts."""
+    dates = [txn.get("date", "") for txn in transactions]
+    status = columnar_engine.transaction_status(
+        dates,
+        [txn.get("amount") for txn in transactions],
+        [txn.get("ceiling") for txn in transactions],
+        [txn.get("remanent") for txn in transactions],
+    )
+
+    duplicate = _duplicate_mask(dates, seen_dates)
+    for i in np.flatnonzero(status == columnar_engine.UNDECIDED):
+        status[i] = (
+            columnar_engine.BAD if _transaction_errors(transactions[i])
+            else columnar_engine.OK
+        )
+    return (status == columnar_engine.OK) & ~duplicate, duplicate
+
+
+def _validate_columnar(transactions, seen_dates):
+    is_valid, duplicate = _list_status(transactions, seen_dates)
+    valid = [transactions[i] for i in np.flatnonzero(is_valid)]
+    invalid = [
+        _invalid_entry(
+            transactions[i], _transaction_errors(transactions[i]), duplicate[i]
+        )
+        for i in np.flatnonzero(~is_valid)
+    ]
+    return {"valid": valid, "invalid": invalid}
+
+
+def _table_status(table, seen_dates):
+    """``_list_status`` for a table with an ``EPOCH`` date column."""
+    status = columnar_engine.column_status(
+        np.ones(len(table), dtype=bool),
+        table.numbers("amount"),
+        table.numbers("ceiling"),
+        table.numbers("remanent"),
+    )
+    if seen_dates is not None:
+        duplicate = _duplicate_mask(table.pylist("date"), seen_dates)
+    else:
+        # Canonical dates are equal exactly when their epochs are.
+        duplicate = np.ones(len(table), dtype=bool)
+        _, first = np.unique(table.columns["date"].values, return_index=True)
+        duplicate[first] = False
+    for i in np.flatnonzero(status == columnar_engine.UNDECIDED):
+        status[i] = (
+            columnar_engine.BAD if _transaction_errors(table[i])
+            else columnar_engine.OK
+        )
+    return (status == columnar_engine.OK) & ~duplicate, duplicate
+
+
+def _validate_table(table, seen_dates):
+    if table.kind("date") != EPOCH:
+        return _validate_columnar(table.records(), seen_dates or set())
+
+    is_valid, duplicate = _table_status(table, seen_dates)
+    rows = np.flatnonzero(~is_valid)
+    messages = []
+    for i in rows.tolist():
+        txn = table[i]
+        messages.append(
+            _invalid_message(txn, _transaction_errors(txn), duplicate[i])
+        )
+    return {
+        "valid": table.take(np.flatnonzero(is_valid)),
+        "invalid": table.take(rows).with_columns(message=string_column(messages)),
+    }
+
+
+def _shaped_invalid(txn, duplicate, shape):
+    entry = dict(project(txn, shape.fields))
+    errors = _transaction_errors(txn, shape.codes)
+    if not shape.codes:
+        entry["message"] = _invalid_message(txn, errors, duplicate)
+        return entry
+    if duplicate:
+        errors.append(DUPLICATE_DATE)
+    entry["errors"] = errors
+    return entry
+
+
+def _validate_shaped(transactions, seen_dates, shape, block_rows):
+    """``validate_transactions`` for a non-default ``OutputShape``."""
+    table = None
+    if isinstance(transactions, ColumnarTable) and transactions.kind("date") == EPOCH:
+        table = transactions
+        if seen_dates is None and shape.max_errors is not None:
+            # Blocks need a set to find duplicates across them.
+            seen_dates = set()
+        row_status = _table_status
+    else:
+        if isinstance(transactions, ColumnarTable):
+            transactions = transactions.records()
+        if seen_dates is None:
+            seen_dates = set()
+        row_status = _list_status
+    duplicate = np.zeros(len(transactions), dtype=bool)
+
+    def status(start, stop):
+        block_valid, duplicate[start:stop] = row_status(
+            row_slice(transactions, start, stop), seen_dates,
+        )
+        return block_valid
+
+    is_valid = examined_mask(status, len(transactions), shape.max_errors, block_rows)
+
+    def build_valid(rows):
+        if table is not None:
+            return select_columns(table.take(rows), shape.fields)
+        return [project(transactions[i], shape.fields) for i in rows.tolist()]
+
+    def build_invalid(rows):
+        if table is None or shape.codes:
+            return [
+                _shaped_invalid(transactions[i], duplicate[i], shape)
+                for i in rows.tolist()
+            ]
+        messages = []
+        for i in rows.tolist():
+            txn = table[i]
+            messages.append(
+                _invalid_message(txn, _transaction_errors(txn), duplicate[i])
+            )
+        return select_columns(table.take(rows), shape.fields).with_columns(
+            message=string_column(messages),
+        )
+
+    return shaped_result(shape, is_valid, len(transactions), build_valid, build_invalid)
+
+
+def validate_transactions(
+    wage, transactions, seen_dates=None, shape=None, block_rows=SHAPE_BLOCK_ROWS,
+):
+    """Split transactions into valid and invalid.
+
+    ``seen_dates`` may be passed in to carry duplicate detection across
+    several calls, e.g. when validating a stream chunk by chunk.  Large
+    batches are checked column-wise; only rows that fail (or that the
+    columnar engine cannot decide exactly) go through the per-record rules.
+    A ``ColumnarTable`` is always checked column-wise and split into two
+    tables.  A non-default ``OutputShape`` selects what the result holds
+    (see ``output_shape``); rows and messages it leaves out are not built,
+    and with ``maxErrors`` rows are checked ``block_rows`` at a time.
+    """
+    if shape is not None and shape != FULL:
+        with metrics.time_stage("validate"):
+            return _validate_shaped(transactions, seen_dates, shape, block_rows)
+    if isinstance(transactions, ColumnarTable):
+        with metrics.time_stage("validate"):
+            return _validate_table(transactions, seen_dates)
+    if seen_dates is None:
+        seen_dates = set()
+    with metrics.time_stage("validate"):
+        if len(transactions) >= COLUMNAR_MIN_ROWS:
+            return _validate_columnar(transactions, seen_dates)
+        return _validate_scalar(transactions, seen_dates)
+
+
+def iter_validate_transactions(wage, transaction_chunks):
+    """Generator form of ``validate_transactions`` over an iterable of chunks.
+
+    Duplicate dates are detected across chunk boundaries.
+    """
+    seen_dates = set()
+    for chunk in transaction_chunks:
+        yield validate_transactions(wage, chunk, seen_dates=seen_dates)
+
+
+def iter_validate_rows(wage, transaction_chunks):
+    """Per chunk, ``(is_valid, row)`` pairs in input order.
+
+    ``row`` is the transaction itself when valid, else its ``invalid``
+    entry with the ``message``.  Duplicate dates are detected across chunk
+    boundaries, as in ``iter_validate_transactions``.
+    """
+    seen_dates = set()
+    for chunk in transaction_chunks:
+        # Yield outside the timer: the consumer's encoding and writes to
+        # the client are not part of the stage.
+        with metrics.time_stage("validate"):
+            is_valid, duplicate = _list_status(chunk, seen_dates)
+            rows = [
+                (True, txn) if ok
+                else (False, _invalid_entry(txn, _transaction_errors(txn), dup))
+                for txn, ok, dup in zip(chunk, is_valid.tolist(), duplicate.tolist())
+            ]
+        yield rows
@@ -0,0 +1,194 @@
+"""Compact per-request transaction state for the q -> p -> k engine.
+
+The caller's transaction dicts are never copied while the stages run.
+Each row is described by parallel columns instead: ``epochs`` (int64),
+``remanent`` (float64) and a one-byte ``kind`` that records whether the
+stages replaced the remanent, and with which type.  A float column cannot
+tell ``5`` from ``5.0``, and the two serialize differently, so ints are
+flagged and values a float64 cannot hold exactly (ints beyond 2**53 and
+other odd types) are kept aside as objects.  Amount, ceiling and any other
+fields are read from the source dicts, so sums over them stay the plain
+Python sums they always were.  Dicts are built only at the response
+boundary (``row`` / ``materialize``), and not at all when the source is a
+``ColumnarTable``: ``table`` then hands the result back as columns.
+"""
+from array import array
+
+import numpy as np
+
+from app.utils.columnar_table import ColumnarTable, number_column
+
+UNCHANGED, FLOAT, INT, OBJECT = 0, 1, 2, 3
+
+_FLOAT_EXACT_INT = 2 ** 53
+
+
+def remanent_kind(value):
+    """Column encoding for a remanent value: ``FLOAT``, ``INT`` or ``OBJECT``."""
+    if type(value) is float:
+        return FLOAT
+    if type(value) is int and -_FLOAT_EXACT_INT < value < _FLOAT_EXACT_INT:
+        return INT
+    return OBJECT
+
+
+class TransactionStore:
+    """Parallel-column view over a list of transaction dicts.
+
+    ``remanent[i]`` is meaningful where ``kind[i]`` is not ``UNCHANGED``,
+    and for unchanged rows once ``load_remanents`` has copied them from the
+    source.  ``staged`` is False when no q/p stage ran, in which case
+    ``materialize`` hands back the source list itself.
+    """
+
+    __slots__ = ("source", "epochs", "remanent", "kind", "staged", "_objects")
+
+    def __init__(self, source, epochs, staged=False):
+        n = len(source)
+        self.source = source
+        self.epochs = epochs
+        self.remanent = array("d", bytes(8 * n))
+        self.kind = bytearray(n)
+        self.staged = staged
+        self._objects = {}
+
+    def __len__(self):
+        return len(self.source)
+
+    def set_remanent(self, i, value):
+        """Record a stage's remanent for row ``i``, keeping its exact type."""
+        # array('d') raises TypeError for non-numbers, as arithmetic on the
+        # value would.
+        self.remanent[i] = value
+        kind = self.kind[i] = remanent_kind(value)
+        if kind == OBJECT:
+            self._objects[i] = value
+
+    def assign(self, rows, values, kind):
+        """Bulk ``set_remanent`` of float64 ``values`` (``FLOAT`` or ``INT``)."""
+        self.remanent_values()[rows] = values
+        np.frombuffer(self.kind, dtype=np.uint8)[rows] = kind
+
+    def load_remanents(self):
+        """Copy the source remanent into every unchanged row (for k sums).
+
+        Raises ``KeyError`` / ``TypeError`` for a missing or non-numeric
+        remanent, as summing it would.
+        """
+        if isinstance(self.source, ColumnarTable) and self._load_column():
+            return
+        if not self.staged:
+            self.remanent = array("d", [txn["remanent"] for txn in self.source])
+            return
+        source = self.source
+        remanent = self.remanent
+        for i in np.flatnonzero(np.frombuffer(self.kind, dtype=np.uint8) == UNCHANGED).tolist():
+            remanent[i] = source[i]["remanent"]
+
+    def _load_column(self):
+        # Whole-column copy from a table source; False if some value needs
+        # the row-by-row path (and its errors).
+        numbers, exact = self.source.numbers("remanent")
+        if not self.staged:
+            if not exact.all():
+                return False
+            self.remanent = array("d", numbers.tobytes())
+            return True
+        unchanged = np.frombuffer(self.kind, dtype=np.uint8) == UNCHANGED
+        if not exact[unchanged].all():
+            return False
+        self.remanent_values()[unchanged] = numbers[unchanged]
+        return True
+
+    def remanent_values(self):
+        """The remanent column as a float64 array (shares memory)."""
+        return np.frombuffer(self.remanent, dtype=np.float64)
+
+    def value(self, i):
+        """Row ``i``'s remanent as the stages produced it."""
+        kind = self.kind[i]
+        if kind == FLOAT:
+            return self.remanent[i]
+        if kind == INT:
+            return int(self.remanent[i])
+        if kind == OBJECT:
+            return self._objects[i]
+        return self.source[i]["remanent"]
+
+    def row(self, i, **fields):
+        """Row ``i`` as a new dict, with ``fields`` added.
+
+        Without ``fields``, a row no stage touched is returned as the source
+        dict itself if no stage ran at all.
+        """
+        txn = self.source[i]
+        if self.kind[i] != UNCHANGED:
+            return {**txn, "remanent": self.value(i), **fields}
+        if fields:
+            return {**txn, **fields}
+        return txn.copy() if self.staged else txn
+
+    def project(self, i, fields):
+        """Row ``i`` as a new dict of just ``fields`` (those it has)."""
+        txn = self.source[i]
+        out = {name: txn[name] for name in fields if name in txn}
+        if "remanent" in fields and self.kind[i] != UNCHANGED:
+            out["remanent"] = self.value(i)
+        return out
+
+    def materialize(self):
+        """Every row as a dict, in list order."""
+        if not self.staged:
+            return self.source
+        objects = self._objects
+        out = []
+        for i, (txn, kind, value) in enumerate(zip(self.source, self.kind, self.remanent)):
+            if kind == FLOAT:
+                out.append({**txn, "remanent": value})
+            elif kind == INT:
+                out.append({**txn, "remanent": int(value)})
+            elif kind == UNCHANGED:
+                out.append(txn.copy())
+            else:
+                out.append({**txn, "remanent": objects[i]})
+        return out
+
+    def table(self):
+        """The rows as a ``ColumnarTable``, for a table source.
+
+        ``None`` for a list source, or when some remanent has no column
+        encoding (an object, or an unchanged row whose source value is not
+        a plain number); ``materialize`` covers those.
+        """
+        source = self.source
+        if not isinstance(source, ColumnarTable):
+            return None
+        if not self.staged:
+            return source
+        kind = np.frombuffer(self.kind, dtype=np.uint8)
+        if (kind == OBJECT).any():
+            return None
+        values = self.remanent_values().copy()
+        ints = kind == INT
+        unchanged = kind == UNCHANGED
+        if unchanged.any():
+            if "remanent" not in source:
+                return None
+            numbers, exact = source.numbers("remanent")
+            if not exact[unchanged].all():
+                return None
+            values[unchanged] = numbers[unchanged]
+            ints |= unchanged & source.int_mask("remanent")
+        return source.with_columns(remanent=number_column(values, ints))
+
+    @property
+    def nbytes(self):
+        """Bytes held by the columns (the source dicts excluded)."""
+        return (
+            self.epochs.nbytes
+            + self.remanent.itemsize * len(self.remanent)
+            + len(self.kind)
+        )
+
+    def bytes_per_transaction(self):
+        return self.nbytes / len(self) if len(self) else 0.0
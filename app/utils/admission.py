@@ -0,0 +1,208 @@
+"""Admission control: payload limits, per-client rate limits and backpressure.
+
+Runs before every request and answers an overloaded server fast instead
+of queueing work behind it:
+
+* Bodies declared larger than ``max_body_bytes`` get 413 before anything
+  is read (Flask's ``MAX_CONTENT_LENGTH`` catches chunked ones as they
+  are read).  Once parsed, a body with more transactions or periods than
+  the limits is also 413 (``check_payload``, called by ``read_json``).
+* With ``rate`` set, each client (remote address, or the value of
+  ``client_header``) has a token bucket of ``burst`` requests refilled at
+  ``rate`` per second; an empty bucket is 429.
+* Requests with a body of at least ``small_bytes`` are weighed by their
+  declared size and admitted while the weights in flight stay within
+  ``inflight_bytes``; the rest are 429.  A single request above the
+  capacity still runs when nothing else heavy is in flight.  Smaller
+  requests are never held back, so they keep worker threads available
+  under mixed load.
+
+Rejections carry ``Retry-After``.  State is per worker process, so the
+limits apply to each gunicorn worker separately.  NDJSON uploads are
+streamed in bounded memory and only subject to the body size limit.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, request
+from werkzeug.exceptions import RequestEntityTooLarge, TooManyRequests
+
+from app.utils.columnar_table import ColumnarTable
+from app.utils.constants import (
+    ADMISSION_BURST,
+    ADMISSION_CLIENT_HEADER,
+    ADMISSION_INFLIGHT_BYTES,
+    ADMISSION_MAX_BODY_BYTES,
+    ADMISSION_MAX_CLIENTS,
+    ADMISSION_MAX_PERIODS,
+    ADMISSION_MAX_TRANSACTIONS,
+    ADMISSION_RATE,
+    ADMISSION_RETRY_AFTER,
+    ADMISSION_SMALL_BYTES,
+)
+from app.utils.metrics import metrics
+
+ROW_FIELDS = ("transactions", "expenses")
+PERIOD_FIELDS = ("q", "p", "k")
+
+
+def retry_after_header(seconds):
+    """``Retry-After`` value: whole seconds, at least 1."""
+    return str(max(1, math.ceil(seconds)))
+
+
+class TokenBuckets:
+    """One token bucket per client, keeping the ``max_clients`` most recent."""
+
+    def __init__(self, rate, burst, max_clients=ADMISSION_MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # client -> (tokens, monotonic stamp)
+        self._lock = threading.Lock()
+
+    def take(self, client, now=None):
+        """Take a token: 0.0 if one was available, else seconds until one is."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, stamp = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[client] = (tokens, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class WeightedLimiter:
+    """Admits work while the summed weight in flight stays within ``capacity``."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.inflight = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self, weight):
+        with self._lock:
+            if self.inflight and self.inflight + weight > self.capacity:
+                return False
+            self.inflight += weight
+            return True
+
+    def release(self, weight):
+        with self._lock:
+            self.inflight -= weight
+
+
+def _count(value):
+    return len(value) if isinstance(value, (list, ColumnarTable)) else 0
+
+
+class AdmissionControl:
+    def __init__(
+        self,
+        max_body_bytes=ADMISSION_MAX_BODY_BYTES,
+        max_transactions=ADMISSION_MAX_TRANSACTIONS,
+        max_periods=ADMISSION_MAX_PERIODS,
+        rate=ADMISSION_RATE,
+        burst=ADMISSION_BURST,
+        client_header=ADMISSION_CLIENT_HEADER,
+        small_bytes=ADMISSION_SMALL_BYTES,
+        inflight_bytes=ADMISSION_INFLIGHT_BYTES,
+        retry_after=ADMISSION_RETRY_AFTER,
+    ):
+        self.max_body_bytes = max_body_bytes
+        self.max_transactions = max_transactions
+        self.max_periods = max_periods
+        self.buckets = TokenBuckets(rate, burst) if rate > 0 else None
+        self.client_header = client_header
+        self.small_bytes = small_bytes
+        self.limiter = WeightedLimiter(inflight_bytes)
+        self.retry_after = retry_after
+
+    def init_app(self, app):
+        app.config["MAX_CONTENT_LENGTH"] = self.max_body_bytes
+        app.extensions["admission"] = self
+        app.before_request(self.admit)
+        app.teardown_request(self.release)
+
+    def _client(self):
+        if self.client_header:
+            value = request.headers.get(self.client_header)
+            if value:
+                return value
+        return request.remote_addr
+
+    def _weight(self):
+        size = request.content_length
+        if size is not None:
+            return size
+        if "chunked" in request.headers.get("Transfer-Encoding", "").lower():
+            return self.limiter.capacity
+        return 0
+
+    def admit(self):
+        """``before_request`` hook; raises 413/429 to turn the request away."""
+        if self.buckets is not None:
+            wait = self.buckets.take(self._client())
+            if wait:
+                metrics.increment("admission_rate_limited")
+                raise TooManyRequests("Rate limit exceeded", retry_after=wait)
+        size = request.content_length
+        if size is not None and size > self.max_body_bytes:
+            metrics.increment("admission_too_large")
+            raise RequestEntityTooLarge(
+                f"Body of {size} bytes exceeds the limit of {self.max_body_bytes}"
+            )
+        weight = self._weight()
+        if weight >= self.small_bytes:
+            if not self.limiter.try_acquire(weight):
+                metrics.increment("admission_overloaded")
+                raise TooManyRequests(
+                    "Server is busy with large requests", retry_after=self.retry_after,
+                )
+            g.admission_weight = weight
+
+    def release(self, exc=None):
+        """``teardown_request`` hook: return the request's weight."""
+        weight = g.pop("admission_weight", None)
+        if weight is not None:
+            self.limiter.release(weight)
+
+    def check_counts(self, data):
+        """Raise 413 if a parsed body has too many transactions or periods.
+
+        Counts the top-level lists and those of every ``portfolios`` entry.
+        """
+        if not isinstance(data, dict):
+            return
+        bodies = [data]
+        portfolios = data.get("portfolios")
+        if isinstance(portfolios, list):
+            bodies += [p for p in portfolios if isinstance(p, dict)]
+        rows = sum(_count(body.get(name)) for body in bodies for name in ROW_FIELDS)
+        if rows > self.max_transactions:
+            metrics.increment("admission_too_large")
+            raise RequestEntityTooLarge(
+                f"{rows} transactions exceed the limit of {self.max_transactions}"
+            )
+        for name in PERIOD_FIELDS:
+            periods = sum(_count(body.get(name)) for body in bodies)
+            if periods > self.max_periods:
+                metrics.increment("admission_too_large")
+                raise RequestEntityTooLarge(
+                    f"{periods} {name} periods exceed the limit of {self.max_periods}"
+                )
+
+
+def check_payload(data):
+    """Apply the app's transaction and period limits to a parsed body."""
+    control = current_app.extensions.get("admission")
+    if control is not None:
+        control.check_counts(data)
@@ -0,0 +1,271 @@
+"""Column-oriented tables of records, read as a sequence of dicts.
+
+A ``ColumnarTable`` holds one NumPy array per field and behaves like the
+list of dicts the services were written for: ``len``, indexing, slicing and
+iteration all work, with each row built on demand.  The services check for
+it where whole columns can be read instead, so a request decoded from the
+columnar wire format goes through the engine without a dict per row.
+
+Column kinds keep the JSON types exact: ``EPOCH`` rows read as
+``DATETIME_FMT`` strings, ``INT`` as ints and ``FLOAT`` as floats, except
+rows flagged in its ``extra`` mask, which read as ints (so ``5`` and ``5.0``
+stay apart).  ``STR`` columns hold codes into the ``extra`` labels and
+``LIST`` columns lists of ints (``values`` are the row offsets into the
+``extra`` items).
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from app.utils.datetime_codec import decode_canonical
+
+EPOCH, INT, FLOAT, STR, LIST = "epoch", "int", "float", "str", "list"
+
+_FLOAT_EXACT_INT = 2 ** 53
+_INT64_RANGE = (-2 ** 63, 2 ** 63)
+
+Column = namedtuple("Column", ["kind", "values", "extra"])
+Column.__doc__ = """One typed column; see the module docstring for ``extra``."""
+
+
+def string_column(strings):
+    """A ``STR`` column from a list of strings."""
+    codes = {}
+    values = np.fromiter(
+        (codes.setdefault(s, len(codes)) for s in strings),
+        dtype=np.int64, count=len(strings),
+    )
+    return Column(STR, values, list(codes))
+
+
+def constant_column(value, n):
+    """A ``STR`` column repeating ``value`` ``n`` times."""
+    return Column(STR, np.zeros(n, dtype=np.int64), [value])
+
+
+def number_column(values, ints):
+    """An ``INT`` column if every row is an int, else a ``FLOAT`` column.
+
+    ``values`` is float64 and ``ints`` flags its rows that hold ints.
+    """
+    if len(values) and ints.all():
+        return Column(INT, values.astype(np.int64), None)
+    return Column(FLOAT, values, ints if ints.any() else None)
+
+
+def list_column(lists):
+    """A ``LIST`` column from a list of int lists."""
+    lengths = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    items = np.fromiter(
+        (v for row in lists for v in row), dtype=np.int64, count=int(offsets[-1]),
+    )
+    return Column(LIST, offsets, items)
+
+
+def format_epochs(epochs):
+    """``DATETIME_FMT`` strings for an int64 array of epoch seconds."""
+    if not len(epochs):
+        return []
+    text = np.datetime_as_string(epochs.astype("datetime64[s]")).astype("U19")
+    chars = text.view(np.uint32).reshape(-1, 19)
+    chars[:, 10] = ord(" ")
+    return text.tolist()
+
+
+def _column_length(column):
+    return len(column.values) - 1 if column.kind == LIST else len(column.values)
+
+
+def _infer_column(values):
+    """The column for a list of JSON values, or ``None`` if none fits."""
+    types = set(map(type, values))
+    if types == {str}:
+        epochs, ok = decode_canonical(values)
+        if ok.all():
+            return Column(EPOCH, epochs, None)
+        return string_column(values)
+    if types == {int}:
+        if min(values) < _INT64_RANGE[0] or max(values) >= _INT64_RANGE[1]:
+            return None
+        return Column(INT, np.array(values, dtype=np.int64), None)
+    if types == {int, float}:
+        ints = np.fromiter((type(v) is int for v in values), bool, len(values))
+        if any(abs(values[i]) >= _FLOAT_EXACT_INT for i in np.flatnonzero(ints).tolist()):
+            return None
+        return Column(FLOAT, np.array(values, dtype=np.float64), ints)
+    if types == {float}:
+        return Column(FLOAT, np.array(values, dtype=np.float64), None)
+    if types == {list} and all(
+        type(v) is int and _INT64_RANGE[0] <= v < _INT64_RANGE[1]
+        for row in values for v in row
+    ):
+        return list_column(values)
+    return None
+
+
+class ColumnarTable:
+    """A table of ``n`` rows; ``columns`` maps field names to ``Column``."""
+
+    __slots__ = ("columns", "n")
+
+    def __init__(self, columns, n=None):
+        self.columns = dict(columns)
+        if n is None:
+            n = _column_length(next(iter(self.columns.values()))) if self.columns else 0
+        for name, column in self.columns.items():
+            if _column_length(column) != n:
+                raise ValueError(f"Column {name!r} does not have {n} rows")
+        self.n = n
+
+    @classmethod
+    def from_records(cls, records):
+        """Table of a list of flat dicts sharing the same keys, else ``None``."""
+        if not records or any(type(r) is not dict for r in records):
+            return None
+        names = list(records[0])
+        if any(len(r) != len(names) for r in records):
+            return None
+        columns = {}
+        for name in names:
+            try:
+                values = [r[name] for r in records]
+            except KeyError:
+                return None
+            column = _infer_column(values)
+            if column is None:
+                return None
+            columns[name] = column
+        return cls(columns, len(records))
+
+    def __len__(self):
+        return self.n
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __iter__(self):
+        return iter(self.records())
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.take(np.arange(self.n)[i])
+        if i < 0:
+            i += self.n
+        if not 0 <= i < self.n:
+            raise IndexError("table index out of range")
+        return {name: self._value(column, i) for name, column in self.columns.items()}
+
+    def __eq__(self, other):
+        if isinstance(other, ColumnarTable):
+            other = other.records()
+        return self.records() == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"ColumnarTable({self.n} rows: {', '.join(self.columns)})"
+
+    @staticmethod
+    def _value(column, i):
+        kind, values, extra = column
+        if kind == EPOCH:
+            return format_epochs(values[i:i + 1])[0]
+        if kind == INT:
+            return int(values[i])
+        if kind == FLOAT:
+            return int(values[i]) if extra is not None and extra[i] else float(values[i])
+        if kind == STR:
+            return extra[values[i]]
+        return extra[values[i]:values[i + 1]].tolist()
+
+    def kind(self, name):
+        """Kind of column ``name``, ``None`` if the table has none."""
+        column = self.columns.get(name)
+        return None if column is None else column.kind
+
+    def pylist(self, name):
+        """Column ``name`` as a list of Python values (``KeyError`` if absent)."""
+        kind, values, extra = self.columns[name]
+        if kind == EPOCH:
+            return format_epochs(values)
+        if kind == STR:
+            return [extra[code] for code in values.tolist()]
+        if kind == LIST:
+            items = extra.tolist()
+            bounds = values.tolist()
+            return [items[a:b] for a, b in zip(bounds, bounds[1:])]
+        out = values.tolist()
+        if kind == FLOAT and extra is not None:
+            for i in np.flatnonzero(extra).tolist():
+                out[i] = int(out[i])
+        return out
+
+    def numbers(self, name, default=None):
+        """``(float64 values, exact mask)`` of a column, like ``load_numbers``.
+
+        Rows of non-numeric columns, and values a float64 does not hold
+        exactly, are left out of the mask.  A missing column reads as
+        ``default`` on every row, or as unknown when ``default`` is None.
+        """
+        column = self.columns.get(name)
+        if column is None and default is not None:
+            return np.full(self.n, float(default)), np.ones(self.n, dtype=bool)
+        if column is None or column.kind not in (INT, FLOAT):
+            return np.full(self.n, np.nan), np.zeros(self.n, dtype=bool)
+        arr = column.values.astype(np.float64)
+        with np.errstate(invalid="ignore"):
+            exact = np.abs(arr) < _FLOAT_EXACT_INT
+        return arr, exact
+
+    def int_mask(self, name):
+        """True where column ``name`` holds an int."""
+        kind, values, extra = self.columns[name]
+        if kind == INT:
+            return np.ones(self.n, dtype=bool)
+        if kind == FLOAT and extra is not None:
+            return extra.copy()
+        return np.zeros(self.n, dtype=bool)
+
+    def take(self, rows):
+        """A new table of the given rows (an index array), in that order."""
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = {}
+        for name, (kind, values, extra) in self.columns.items():
+            if kind == LIST:
+                lengths = np.diff(values)[rows]
+                offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+                np.cumsum(lengths, out=offsets[1:])
+                starts = np.repeat(values[:-1][rows] - offsets[:-1], lengths)
+                columns[name] = Column(
+                    LIST, offsets, extra[starts + np.arange(offsets[-1])],
+                )
+            elif kind == FLOAT and extra is not None:
+                columns[name] = Column(kind, values[rows], extra[rows])
+            else:
+                columns[name] = Column(kind, values[rows], extra)
+        return ColumnarTable(columns, len(rows))
+
+    def with_columns(self, **columns):
+        """A new table with ``columns`` added or replaced (no data copied)."""
+        return ColumnarTable({**self.columns, **columns}, self.n)
+
+    def records(self):
+        """Every row as a dict, in order."""
+        names = list(self.columns)
+        if not names:
+            return [{} for _ in range(self.n)]
+        return [
+            dict(zip(names, row))
+            for row in zip(*(self.pylist(name) for name in names))
+        ]
+
+    @property
+    def nbytes(self):
+        total = 0
+        for _, values, extra in self.columns.values():
+            total += values.nbytes
+            if isinstance(extra, np.ndarray):
+                total += extra.nbytes
+        return total
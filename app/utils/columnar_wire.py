@@ -0,0 +1,260 @@
+"""Binary columnar wire format (``application/x-blk-columnar``).
+
+A body is a JSON object whose tables (lists of flat records) travel as
+little-endian column buffers instead of text::
+
+    b"BLKC" | u16 version | 2 pad bytes | u64 header length | header (JSON)
+    | column buffers, each padded to 8 bytes
+
+The header is ``{"meta": {...}, "tables": [...]}``: ``meta`` holds every
+other field of the object as plain JSON and each table entry gives its
+``name``, ``rows`` and ``columns``.  A column entry names its ``type`` and
+the byte length of each of its ``buffers``:
+
+``epoch`` / ``int``
+    ``base`` plus unsigned offsets ``width`` bytes wide (``width`` 8: plain
+    int64, no base).  Epoch seconds read back as ``DATETIME_FMT`` strings.
+``paise``
+    A float column holding whole hundredths, stored as ``int`` above and
+    divided by 100 on decode; only used when that round-trips exactly.
+``f64``
+    Raw float64.
+``str``
+    ``int``-style codes into the header's ``labels``.
+``list``
+    ``int``-style row lengths (``lengthBase``/``lengthWidth``), then the
+    items of every row.
+
+Float columns mixing ints set ``ints`` and carry one leading byte per row
+flagging them.  Decoding yields a ``ColumnarTable`` in place of each table,
+its columns loaded straight from the buffers.
+"""
+import json
+import struct
+
+import numpy as np
+
+from app.utils.columnar_table import (
+    EPOCH,
+    FLOAT,
+    INT,
+    LIST,
+    STR,
+    Column,
+    ColumnarTable,
+)
+from app.utils.datetime_codec import to_epoch
+
+COLUMNAR_MIMETYPE = "application/x-blk-columnar"
+
+MAGIC = b"BLKC"
+VERSION = 1
+_PREFIX = struct.Struct("<4sH2xQ")
+_ALIGN = 8
+
+_FLOAT_EXACT_INT = 2 ** 53
+# Epochs outside DATETIME_FMT's years 1..9999 cannot be formatted back.
+_EPOCH_RANGE = (to_epoch("0001-01-01 00:00:00"), to_epoch("9999-12-31 23:59:59"))
+
+_WIDTHS = (1, 2, 4)
+
+
+def _padded(buf):
+    return buf + bytes(-len(buf) % _ALIGN)
+
+
+def _pack_ints(values):
+    """``(spec, buffer)``: int64 ``values`` as the narrowest base + offsets."""
+    if len(values):
+        lo, hi = int(values.min()), int(values.max())
+        for width in _WIDTHS:
+            if hi - lo < 256 ** width:
+                offsets = (values - lo).astype(f"<u{width}")
+                return {"base": lo, "width": width}, offsets.tobytes()
+    return {"base": 0, "width": 8}, values.astype("<i8").tobytes()
+
+
+def _unpack_ints(buf, spec, count):
+    width = spec.get("width", 8)
+    if width == 8:
+        return _frombuffer(buf, "<i8", count).astype(np.int64)
+    if width not in _WIDTHS:
+        raise ValueError(f"Unsupported integer width: {width}")
+    return _frombuffer(buf, f"<u{width}", count).astype(np.int64) + spec.get("base", 0)
+
+
+def _frombuffer(buf, dtype, count):
+    dtype = np.dtype(dtype)
+    if len(buf) != dtype.itemsize * count:
+        raise ValueError("Column buffer does not match its row count")
+    return np.frombuffer(buf, dtype=dtype, count=count)
+
+
+def _paise(values):
+    """``values`` as int64 hundredths when that is exact, else ``None``."""
+    with np.errstate(invalid="ignore", over="ignore"):
+        scaled = np.rint(values * 100)
+        exact = np.isfinite(scaled) & (np.abs(scaled) < _FLOAT_EXACT_INT)
+        if not exact.all():
+            return None
+        paise = scaled.astype(np.int64)
+        # -0.0 would come back as 0.0.
+        if (paise / 100.0 != values).any() or np.signbit(values[paise == 0]).any():
+            return None
+    return paise
+
+
+def _encode_column(name, column):
+    kind, values, extra = column
+    spec = {"name": name}
+    buffers = []
+    if kind in (EPOCH, INT):
+        packed, buf = _pack_ints(values)
+        spec.update(type=kind, **packed)
+        buffers.append(buf)
+    elif kind == FLOAT:
+        if extra is not None and extra.any():
+            spec["ints"] = True
+            buffers.append(extra.astype(np.uint8).tobytes())
+        paise = _paise(values)
+        if paise is None:
+            spec["type"] = "f64"
+            buffers.append(values.astype("<f8").tobytes())
+        else:
+            packed, buf = _pack_ints(paise)
+            spec.update(type="paise", **packed)
+            buffers.append(buf)
+    elif kind == STR:
+        packed, buf = _pack_ints(values)
+        spec.update(type=STR, labels=list(extra), **packed)
+        buffers.append(buf)
+    elif kind == LIST:
+        lengths, buf = _pack_ints(np.diff(values))
+        items, items_buf = _pack_ints(extra)
+        spec.update(
+            type=LIST, lengthBase=lengths["base"], lengthWidth=lengths["width"],
+            **items,
+        )
+        buffers += [buf, items_buf]
+    else:
+        raise ValueError(f"Unknown column kind: {kind}")
+    spec["buffers"] = [len(buf) for buf in buffers]
+    return spec, buffers
+
+
+def _decode_column(spec, buffers, n):
+    kind = spec.get("type")
+    if kind in (EPOCH, INT):
+        values = _unpack_ints(buffers[0], spec, n)
+        if kind == EPOCH and n and (
+            values.min() < _EPOCH_RANGE[0] or values.max() > _EPOCH_RANGE[1]
+        ):
+            raise ValueError(f"Column {spec.get('name')!r} has dates out of range")
+        return Column(kind, values, None)
+    if kind in ("paise", "f64"):
+        ints = None
+        if spec.get("ints"):
+            ints = _frombuffer(buffers[0], np.uint8, n).astype(bool)
+            buffers = buffers[1:]
+        if kind == "f64":
+            values = _frombuffer(buffers[0], "<f8", n).astype(np.float64)
+            if not np.isfinite(values).all():
+                raise ValueError(f"Column {spec.get('name')!r} is not finite")
+        else:
+            values = _unpack_ints(buffers[0], spec, n) / 100.0
+        if ints is not None and ints.any():
+            whole = values[ints]
+            if not (np.isfinite(whole).all() and (whole == np.trunc(whole)).all()):
+                raise ValueError(f"Column {spec.get('name')!r} flags non-integer ints")
+            if (np.abs(whole) >= _FLOAT_EXACT_INT).any():
+                raise ValueError(f"Column {spec.get('name')!r} has ints out of range")
+        return Column(FLOAT, values, ints)
+    if kind == STR:
+        labels = spec.get("labels")
+        if not isinstance(labels, list) or not all(type(s) is str for s in labels):
+            raise ValueError(f"Column {spec.get('name')!r} has bad labels")
+        codes = _unpack_ints(buffers[0], spec, n)
+        if n and (codes.min() < 0 or codes.max() >= len(labels)):
+            raise ValueError(f"Column {spec.get('name')!r} has codes out of range")
+        return Column(STR, codes, labels)
+    if kind == LIST:
+        lengths = _unpack_ints(
+            buffers[0],
+            {"base": spec.get("lengthBase", 0), "width": spec.get("lengthWidth", 8)},
+            n,
+        )
+        if n and lengths.min() < 0:
+            raise ValueError(f"Column {spec.get('name')!r} has negative lengths")
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        items = _unpack_ints(buffers[1], spec, int(offsets[-1]))
+        return Column(LIST, offsets, items)
+    raise ValueError(f"Unknown column type: {kind!r}")
+
+
+def encode(obj):
+    """Encode a JSON object, sending its tables as columns.
+
+    ``ColumnarTable`` values are tables; so is any non-empty list of flat
+    dicts with the same keys and column-friendly values.  Everything else
+    goes into ``meta``.
+    """
+    meta, tables, body = {}, [], []
+    for name, value in obj.items():
+        table = value if isinstance(value, ColumnarTable) else None
+        if table is None and isinstance(value, list):
+            table = ColumnarTable.from_records(value)
+        if table is None:
+            meta[name] = value
+            continue
+        columns = []
+        for column_name, column in table.columns.items():
+            spec, buffers = _encode_column(column_name, column)
+            columns.append(spec)
+            body += [_padded(buf) for buf in buffers]
+        tables.append({"name": name, "rows": len(table), "columns": columns})
+
+    header = json.dumps(
+        {"meta": meta, "tables": tables}, separators=(",", ":"), sort_keys=True,
+    ).encode("utf-8")
+    return b"".join([_PREFIX.pack(MAGIC, VERSION, len(header)), _padded(header), *body])
+
+
+def decode(data):
+    """Inverse of ``encode``: a dict with ``ColumnarTable`` values for tables.
+
+    Raises ``ValueError`` for anything malformed.
+    """
+    data = memoryview(data)
+    if len(data) < _PREFIX.size:
+        raise ValueError("Body too short for the columnar format")
+    magic, version, header_len = _PREFIX.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a columnar body (bad magic)")
+    if version != VERSION:
+        raise ValueError(f"Unsupported columnar version: {version}")
+    pos = _PREFIX.size
+    header = json.loads(bytes(data[pos:pos + header_len]))
+    pos += header_len + (-header_len % _ALIGN)
+    if not isinstance(header, dict) or not isinstance(header.get("meta", {}), dict):
+        raise ValueError("Columnar header must be an object")
+
+    obj = dict(header.get("meta", {}))
+    try:
+        for table in header.get("tables", []):
+            n = int(table["rows"])
+            if n < 0:
+                raise ValueError("Negative row count")
+            columns = {}
+            for spec in table["columns"]:
+                buffers = []
+                for size in spec["buffers"]:
+                    if size < 0 or pos + size > len(data):
+                        raise ValueError("Columnar body is truncated")
+                    buffers.append(data[pos:pos + size])
+                    pos += size + (-size % _ALIGN)
+                columns[spec["name"]] = _decode_column(spec, buffers, n)
+            obj[table["name"]] = ColumnarTable(columns, n)
+    except (KeyError, TypeError, IndexError) as exc:
+        raise ValueError(f"Malformed columnar header: {exc!r}")
+    return obj
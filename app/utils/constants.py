@@ -6,12 +6,33 @@ format}, 𝑡𝑖 ≠ 𝑡𝑗
 , 𝑥 < 5 × 10^5
 ).
 """
+import os
+import tempfile
+
 NPS_RATE = 0.0711
 INDEX_RATE = 0.1449
 DEFAULT_INFLATION = 0.055
+DEFAULT_AGE = 30
 RETIREMENT_AGE = 60
 MIN_INVESTMENT_YEARS = 5
 
+# Monte Carlo mode: annual volatility of log returns / log inflation, and
+# limits on the per-request path count and time budget.
+NPS_VOLATILITY = 0.09
+INDEX_VOLATILITY = 0.18
+INFLATION_VOLATILITY = 0.015
+SIM_DEFAULT_PATHS = 10_000
+SIM_MAX_PATHS = 1_000_000
+SIM_BATCH_PATHS = 5_000
+SIM_DEFAULT_BUDGET_MS = 2_000
+SIM_MAX_BUDGET_MS = 10_000
+
+# Memoized (rate, inflation, years) growth/discount tables for trajectories.
+TRAJECTORY_CACHE_SIZE = 1024
+
+# Upper bound on instruments x ages x inflations in one /returns:scenarios call.
+MAX_SCENARIOS = 10_000
+
 MAX_NPS_DEDUCTION = 200_000
 NPS_DEDUCTION_INCOME_PCT = 0.10
 
@@ -20,6 +41,87 @@ ROUNDING_CONST = 100
 
 DATETIME_FMT = "%Y-%m-%d %H:%M:%S"
 
+NDJSON_CHUNK_SIZE = 10_000
+
+# Response encoding: lists this long are streamed in chunks; bodies at least
+# COMPRESS_MIN_BYTES are gzip/deflate compressed when the client accepts it.
+STREAM_MIN_ITEMS = 10_000
+STREAM_CHUNK_ITEMS = 5_000
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_LEVEL = 6
+
+# Batches at least this large use the NumPy columnar engine.
+COLUMNAR_MIN_ROWS = 256
+# With maxErrors, rows are checked this many at a time and the first block
+# that reaches the limit is the last one examined.
+SHAPE_BLOCK_ROWS = 4096
+
+# Shared process pool for batch and parallel work (per gunicorn worker).
+PROCESS_POOL_WORKERS = int(os.environ.get("PROCESS_POOL_WORKERS", os.cpu_count() or 1))
+# Batches smaller than this are computed in-process.
+BATCH_PARALLEL_MIN_ITEMS = 8
+# Single requests with at least this many transactions run the q/p/k engine
+# over time shards in the process pool (0 disables).
+PARALLEL_PIPELINE_MIN_ROWS = int(os.environ.get("PARALLEL_PIPELINE_MIN_ROWS", 250_000))
+# Offline file processing (cli.py): bytes of input per worker task.
+BATCH_CHUNK_BYTES = int(os.environ.get("BATCH_CHUNK_BYTES", 8 * 1024 * 1024))
+MAX_BATCH_PORTFOLIOS = 100_000
+
+# Compiled rule sets kept in memory per worker; raw uploads are shared on disk.
+RULESET_CACHE_SIZE = int(os.environ.get("RULESET_CACHE_SIZE", 256))
+RULESET_DIR = os.environ.get(
+    "RULESET_DIR", os.path.join(tempfile.gettempdir(), "blk-rulesets")
+)
+
+# Per-user ledger: SQLite file shared by all workers, in-memory views per worker.
+LEDGER_DB = os.environ.get(
+    "LEDGER_DB", os.path.join(tempfile.gettempdir(), "blk-ledger.sqlite3")
+)
+LEDGER_CACHE_USERS = int(os.environ.get("LEDGER_CACHE_USERS", 10_000))
+
+# Response cache shared by all workers.  Entries expire after
+# RESPONSE_CACHE_TTL seconds; the oldest are evicted past RESPONSE_CACHE_MAX_BYTES.
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "1") != "0"
+RESPONSE_CACHE_DB = os.environ.get(
+    "RESPONSE_CACHE_DB", os.path.join(tempfile.gettempdir(), "blk-response-cache.sqlite3")
+)
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 300))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# Larger responses are not worth a cache slot.
+RESPONSE_CACHE_MAX_ENTRY_BYTES = 4 * 1024 * 1024
+# Part of every cache key.  Bump it in any change that alters what a cached
+# endpoint returns for the same request (fields, rounding, calculations).
+RESPONSE_FORMAT_VERSION = 1
+
+# Admission control (per worker process; see app/utils/admission.py).
+# Bodies, transaction counts and q/p/k counts over these limits get 413.
+ADMISSION_MAX_BODY_BYTES = int(os.environ.get("ADMISSION_MAX_BODY_BYTES", 128 * 1024 * 1024))
+ADMISSION_MAX_TRANSACTIONS = int(os.environ.get("ADMISSION_MAX_TRANSACTIONS", 1_000_000))
+ADMISSION_MAX_PERIODS = int(os.environ.get("ADMISSION_MAX_PERIODS", 100_000))
+# Requests per second per client (0 disables), with bursts up to ADMISSION_BURST.
+# Clients are told apart by ADMISSION_CLIENT_HEADER when set, else remote address.
+ADMISSION_RATE = float(os.environ.get("ADMISSION_RATE", 0))
+ADMISSION_BURST = int(os.environ.get("ADMISSION_BURST", 20))
+ADMISSION_CLIENT_HEADER = os.environ.get("ADMISSION_CLIENT_HEADER") or None
+ADMISSION_MAX_CLIENTS = 10_000
+# Bodies of at least ADMISSION_SMALL_BYTES share ADMISSION_INFLIGHT_BYTES of
+# declared size in flight; past that they get 429 with Retry-After.
+ADMISSION_SMALL_BYTES = int(os.environ.get("ADMISSION_SMALL_BYTES", 1024 * 1024))
+ADMISSION_INFLIGHT_BYTES = int(os.environ.get("ADMISSION_INFLIGHT_BYTES", 96 * 1024 * 1024))
+ADMISSION_RETRY_AFTER = 1
+
+# Latency metrics: each process writes a snapshot here at most every
+# METRICS_FLUSH_INTERVAL seconds; /performance merges the snapshots.
+METRICS_DIR = os.environ.get(
+    "METRICS_DIR", os.path.join(tempfile.gettempdir(), "blk-metrics")
+)
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 1.0))
+# Histogram upper bounds in seconds; a final +Inf bucket is implied.
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
 TAX_SLABS = [
     (700_000, 0.00),
     (1_000_000, 0.10),
@@ -27,3 +129,12 @@ TAX_SLABS = [
     (1_500_000, 0.20),
     (float("inf"), 0.30),
 ]
+
+# Tax regimes: TAX_SLABS is built in as "default"; TAX_REGIMES_FILE may add
+# or replace regimes ({"name": [[limit or null, rate], ...]}, null = no limit)
+# and TAX_REGIME selects the one used by the returns endpoints.
+DEFAULT_TAX_REGIME = "default"
+TAX_REGIME = os.environ.get("TAX_REGIME", DEFAULT_TAX_REGIME)
+TAX_REGIMES_FILE = os.environ.get("TAX_REGIMES_FILE")
+# NPS benefits for fewer buckets than this are computed without NumPy.
+TAX_VECTOR_MIN = 16
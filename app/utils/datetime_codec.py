@@ -0,0 +1,170 @@
+"""Fast codec between ``DATETIME_FMT`` strings and integer epoch seconds.
+
+Timestamps are naive, so epochs are counted as if the strings were UTC; only
+their ordering and differences matter to the services.  Canonical
+zero-padded strings are decoded with integer arithmetic (no ``strptime`` and
+no datetime objects).  Anything else falls back to ``strptime`` so that the
+set of accepted strings is exactly the same as before.
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.utils.constants import DATETIME_FMT
+
+_EPOCH = datetime(1970, 1, 1)
+_SECONDS_PER_DAY = 86_400
+
+_DATE_LEN = 19
+# Offsets of each digit / separator inside "YYYY-MM-DD HH:MM:SS".
+_DIGIT_POS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+_SEP_POS = {4: "-", 7: "-", 10: " ", 13: ":", 16: ":"}
+_SEPARATORS = tuple(_SEP_POS.items())
+_ASCII_DIGITS = frozenset("0123456789")
+
+# Rows per ``decode_canonical`` call in ``to_epochs``.
+_DECODE_CHUNK = 65_536
+
+_MONTH_DAYS = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+_DAYS_IN_MONTH = np.array(_MONTH_DAYS)
+
+
+def days_from_civil(year, month, day):
+    """Days since 1970-01-01 for a proleptic Gregorian date.
+
+    Works element-wise on NumPy integer arrays as well as on plain ints.
+    """
+    year = year - (month <= 2)
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + 12 * (month <= 2) - 3) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146_097 + doe - 719_468
+
+
+def _leap(year):
+    return ((year % 4 == 0) & (year % 100 != 0)) | (year % 400 == 0)
+
+
+def _strptime_epoch(s):
+    delta = datetime.strptime(s, DATETIME_FMT) - _EPOCH
+    return delta.days * _SECONDS_PER_DAY + delta.seconds
+
+
+def to_epoch(s):
+    """Epoch seconds for one timestamp string.
+
+    Raises ``ValueError`` / ``TypeError`` exactly where ``strptime`` would.
+    """
+    if type(s) is str and len(s) == _DATE_LEN:
+        if all(s[pos] == sep for pos, sep in _SEPARATORS) and _ASCII_DIGITS.issuperset(
+            s[0:4] + s[5:7] + s[8:10] + s[11:13] + s[14:16] + s[17:19]
+        ):
+            year, month, day = int(s[0:4]), int(s[5:7]), int(s[8:10])
+            hour, minute, second = int(s[11:13]), int(s[14:16]), int(s[17:19])
+            if (
+                year >= 1 and 1 <= month <= 12 and 1 <= day
+                and day <= _MONTH_DAYS[month] + (month == 2 and _leap(year))
+                and hour < 24 and minute < 60 and second < 60
+            ):
+                days = days_from_civil(year, month, day)
+                return days * _SECONDS_PER_DAY + hour * 3600 + minute * 60 + second
+    return _strptime_epoch(s)
+
+
+def try_epoch(s):
+    """Like ``to_epoch`` but returns ``None`` for unparseable input."""
+    try:
+        return to_epoch(s)
+    except (ValueError, TypeError):
+        return None
+
+
+def from_epoch(epoch):
+    """Format epoch seconds back into ``DATETIME_FMT``.
+
+    Formatted by hand because ``strftime`` does not zero-pad years < 1000.
+    """
+    dt = _EPOCH + timedelta(seconds=int(epoch))
+    return (
+        f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d} "
+        f"{dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}"
+    )
+
+
+def _char_matrix(dates):
+    """(n, 19) matrix of character codes for equal-length strings."""
+    joined = "".join(dates)
+    if joined.isascii():
+        codes = np.frombuffer(joined.encode("ascii"), dtype=np.uint8)
+        return codes.reshape(-1, _DATE_LEN)
+    return (
+        np.array(dates, dtype=f"U{_DATE_LEN}")
+        .view(np.uint32)
+        .reshape(-1, _DATE_LEN)
+    )
+
+
+def decode_canonical(dates):
+    """Vectorized decode of canonical timestamps.
+
+    Returns ``(epochs, ok)``: int64 epoch seconds and a mask of rows that were
+    canonical and in range.  Rows outside the mask hold 0 and need the scalar
+    ``to_epoch`` to get a verdict.
+    """
+    n = len(dates)
+    epochs = np.zeros(n, dtype=np.int64)
+    ok = np.zeros(n, dtype=bool)
+    if not n:
+        return epochs, ok
+    if set(map(type, dates)) == {str}:
+        lengths = np.fromiter(map(len, dates), dtype=np.int64, count=n)
+    else:
+        lengths = np.fromiter(
+            (len(d) if type(d) is str else -1 for d in dates),
+            dtype=np.int64, count=n,
+        )
+    rows = np.flatnonzero(lengths == _DATE_LEN)
+    if not len(rows):
+        return epochs, ok
+
+    chars = _char_matrix(dates if len(rows) == n else [dates[i] for i in rows])
+    good = np.ones(len(rows), dtype=bool)
+    for pos, sep in _SEPARATORS:
+        good &= chars[:, pos] == ord(sep)
+    digits = chars[:, _DIGIT_POS].astype(np.int64) - ord("0")
+    good &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month, day, hour, minute, second = (
+        digits[:, i] * 10 + digits[:, i + 1] for i in range(4, 14, 2)
+    )
+    month_len = _DAYS_IN_MONTH[np.clip(month, 0, 12)] + (_leap(year) & (month == 2))
+    good &= (year >= 1) & (month >= 1) & (month <= 12)
+    good &= (day >= 1) & (day <= month_len)
+    good &= (hour < 24) & (minute < 60) & (second < 60)
+
+    seconds = (
+        days_from_civil(year, month, day) * _SECONDS_PER_DAY
+        + hour * 3600 + minute * 60 + second
+    )
+    epochs[rows] = np.where(good, seconds, 0)
+    ok[rows] = good
+    return epochs, ok
+
+
+def to_epochs(dates):
+    """Epoch seconds for a sequence of timestamp strings, as an int64 array.
+
+    Decoded ``_DECODE_CHUNK`` rows at a time, which bounds the temporary
+    digit matrices whatever the input size.  Raises like ``to_epoch`` on the
+    first string that cannot be parsed.
+    """
+    epochs = np.empty(len(dates), dtype=np.int64)
+    for start in range(0, len(dates), _DECODE_CHUNK):
+        chunk = dates[start:start + _DECODE_CHUNK]
+        part, ok = decode_canonical(chunk)
+        for i in np.flatnonzero(~ok):
+            part[i] = to_epoch(chunk[i])
+        epochs[start:start + len(part)] = part
+    return epochs
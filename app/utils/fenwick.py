@@ -0,0 +1,39 @@
+class FenwickTree:
+    """Binary indexed tree over a growable list of values.
+
+    ``append`` and ``add`` are O(log n), ``prefix``/``range_sum`` are O(log n).
+    Use integer values (e.g. paise) when sums must be exact.
+    """
+
+    def __init__(self, values=()):
+        self._tree = [0]
+        for value in values:
+            self.append(value)
+
+    def __len__(self):
+        return len(self._tree) - 1
+
+    def append(self, value):
+        i = len(self._tree)
+        # Node i covers (i - lowbit(i), i]; everything but value is already in the tree.
+        low = i - (i & -i)
+        self._tree.append(value + self.prefix(i - 1) - self.prefix(low))
+
+    def add(self, index, delta):
+        i = index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix(self, count):
+        """Sum of the first ``count`` values."""
+        total = 0
+        i = count
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def range_sum(self, left, right):
+        """Sum of values in positions ``[left, right)``."""
+        return self.prefix(right) - self.prefix(left)
@@ -0,0 +1,79 @@
+from bisect import bisect_right
+
+import numpy as np
+
+_NO_END = -(2 ** 63)
+
+
+class IntervalIndex:
+    """Static index over closed integer intervals ``[start, end]``.
+
+    ``contains`` answers "is t inside any interval" with one binary search
+    over the merged, disjoint cover of all intervals: O(log k).  ``matches``
+    lists which original intervals contain t using a max-end segment tree
+    over the start-sorted intervals: O(log k) per reported match.
+    Inverted intervals (end < start) contain nothing and are ignored.
+    """
+
+    def __init__(self, intervals):
+        live = sorted(
+            (start, end, i) for i, (start, end) in enumerate(intervals) if start <= end
+        )
+        self._starts = [start for start, _, _ in live]
+        self._order = [i for _, _, i in live]
+
+        merged_starts, merged_ends = [], []
+        for start, end, _ in live:
+            if merged_ends and start <= merged_ends[-1] + 1:
+                merged_ends[-1] = max(merged_ends[-1], end)
+            else:
+                merged_starts.append(start)
+                merged_ends.append(end)
+        self._merged_starts = merged_starts
+        self._merged_ends = merged_ends
+
+        size = 1
+        while size < len(live):
+            size *= 2
+        self._size = size
+        max_end = [_NO_END] * (2 * size)
+        for pos, (_, end, _) in enumerate(live):
+            max_end[size + pos] = end
+        for node in range(size - 1, 0, -1):
+            max_end[node] = max(max_end[2 * node], max_end[2 * node + 1])
+        self._max_end = max_end
+
+    def __len__(self):
+        return len(self._order)
+
+    def contains(self, t):
+        pos = bisect_right(self._merged_starts, t) - 1
+        return pos >= 0 and t <= self._merged_ends[pos]
+
+    def contains_many(self, points):
+        """Vectorized ``contains`` over an array of points."""
+        points = np.asarray(points, dtype=np.int64)
+        if not self._merged_starts:
+            return np.zeros(len(points), dtype=bool)
+        starts = np.array(self._merged_starts, dtype=np.int64)
+        ends = np.array(self._merged_ends, dtype=np.int64)
+        pos = np.searchsorted(starts, points, side="right") - 1
+        return (pos >= 0) & (points <= ends[np.maximum(pos, 0)])
+
+    def matches(self, t):
+        """Original positions of every interval containing ``t``, ascending."""
+        limit = bisect_right(self._starts, t)
+        found = []
+        stack = [(1, 0, self._size)]
+        while stack:
+            node, lo, hi = stack.pop()
+            if lo >= limit or self._max_end[node] < t:
+                continue
+            if hi - lo == 1:
+                found.append(self._order[lo])
+                continue
+            mid = (lo + hi) // 2
+            stack.append((2 * node + 1, mid, hi))
+            stack.append((2 * node, lo, mid))
+        found.sort()
+        return found
@@ -0,0 +1,233 @@
+"""Request and stage latency histograms and counters, merged across processes.
+
+Every process (gunicorn worker or pool child) records into fixed-bucket
+histograms and plain counters in memory, and writes a JSON snapshot to
+``METRICS_DIR/<pid>.json`` at most every ``METRICS_FLUSH_INTERVAL`` seconds.  ``collect`` merges the
+snapshots of all live processes; files left by exited processes are removed.
+Percentiles are estimated from the buckets the way Prometheus'
+``histogram_quantile`` does.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from app.utils.constants import LATENCY_BUCKETS, METRICS_DIR, METRICS_FLUSH_INTERVAL
+
+REQUESTS = "requests"
+STAGES = "stages"
+COUNTERS = "counters"
+HISTOGRAMS = (REQUESTS, STAGES)
+
+_PROMETHEUS = {
+    REQUESTS: ("blk_request_duration_seconds", "HTTP request latency by route."),
+    STAGES: ("blk_stage_duration_seconds", "Internal pipeline stage latency."),
+}
+
+
+def _empty():
+    return {"buckets": [0] * (len(LATENCY_BUCKETS) + 1), "count": 0, "sum": 0.0, "max": 0.0}
+
+
+def _new_data():
+    return {REQUESTS: {}, STAGES: {}, COUNTERS: {}}
+
+
+def _merge(into, other):
+    into["buckets"] = [a + b for a, b in zip(into["buckets"], other["buckets"])]
+    into["count"] += other["count"]
+    into["sum"] += other["sum"]
+    into["max"] = max(into["max"], other["max"])
+
+
+def quantile(hist, q):
+    """Estimate the ``q`` quantile (0..1) of a histogram, in seconds."""
+    if not hist["count"]:
+        return 0.0
+    rank = q * hist["count"]
+    seen = 0
+    for i, count in enumerate(hist["buckets"]):
+        if seen + count >= rank and count:
+            lower = LATENCY_BUCKETS[i - 1] if i else 0.0
+            if i == len(LATENCY_BUCKETS):
+                return hist["max"]
+            upper = LATENCY_BUCKETS[i]
+            return min(lower + (upper - lower) * (rank - seen) / count, hist["max"])
+        seen += count
+    return hist["max"]
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class _StageTimer:
+    __slots__ = ("_metrics", "_name", "_started")
+
+    def __init__(self, metrics, name):
+        self._metrics = metrics
+        self._name = name
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._metrics.observe(STAGES, self._name, time.perf_counter() - self._started)
+        return False
+
+
+class Metrics:
+    def __init__(self, directory=METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._data = _new_data()
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+    def observe(self, kind, name, seconds):
+        with self._lock:
+            hist = self._data[kind].get(name)
+            if hist is None:
+                hist = self._data[kind][name] = _empty()
+            hist["buckets"][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            hist["count"] += 1
+            hist["sum"] += seconds
+            if seconds > hist["max"]:
+                hist["max"] = seconds
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            counters = self._data[COUNTERS]
+            counters[name] = counters.get(name, 0) + amount
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def time_stage(self, name):
+        """Context manager recording the duration of one stage run."""
+        return _StageTimer(self, name)
+
+    def snapshot(self):
+        """This process's histograms and counters (a deep copy)."""
+        with self._lock:
+            return json.loads(json.dumps(self._data))
+
+    def reset(self):
+        with self._lock:
+            self._data = _new_data()
+
+    def flush(self):
+        """Write this process's snapshot for other workers to read."""
+        data = self.snapshot()
+        self._last_flush = time.monotonic()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, os.path.join(self.directory, f"{os.getpid()}.json"))
+        except OSError:
+            # Metrics must never fail a request; the next flush retries.
+            pass
+
+    def collect(self):
+        """Data merged over every live process, plus the process count."""
+        self.flush()
+        merged = _new_data()
+        processes = 0
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            names = []
+        for name in names:
+            pid_str, ext = os.path.splitext(name)
+            if ext != ".json" or not pid_str.isdigit():
+                continue
+            path = os.path.join(self.directory, name)
+            if not _pid_alive(int(pid_str)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            processes += 1
+            for kind in HISTOGRAMS:
+                series = merged[kind]
+                for key, hist in data.get(kind, {}).items():
+                    _merge(series.setdefault(key, _empty()), hist)
+            counters = merged[COUNTERS]
+            for key, value in data.get(COUNTERS, {}).items():
+                counters[key] = counters.get(key, 0) + value
+        return merged, processes
+
+    def summary(self):
+        """Per route and per stage count, mean, p50, p99 and max in ms.
+
+        Counters are reported as merged totals.
+        """
+        merged, processes = self.collect()
+        out = {"processes": processes, COUNTERS: dict(sorted(merged[COUNTERS].items()))}
+        for kind in HISTOGRAMS:
+            out[kind] = {
+                key: {
+                    "count": hist["count"],
+                    "meanMs": round(1000 * hist["sum"] / hist["count"], 3),
+                    "p50Ms": round(1000 * quantile(hist, 0.50), 3),
+                    "p99Ms": round(1000 * quantile(hist, 0.99), 3),
+                    "maxMs": round(1000 * hist["max"], 3),
+                }
+                for key, hist in sorted(merged[kind].items())
+                if hist["count"]
+            }
+        return out
+
+    def prometheus(self):
+        """Merged data in the Prometheus text exposition format."""
+        merged, _ = self.collect()
+        lines = []
+        for kind, (metric, help_text) in _PROMETHEUS.items():
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} histogram")
+            for key, hist in sorted(merged[kind].items()):
+                if kind == REQUESTS:
+                    method, _, route = key.partition(" ")
+                    labels = f'method="{method}",route="{_escape(route)}"'
+                else:
+                    labels = f'stage="{_escape(key)}"'
+                cumulative = 0
+                bounds = [repr(b) for b in LATENCY_BUCKETS] + ["+Inf"]
+                for bound, count in zip(bounds, hist["buckets"]):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{metric}_sum{{{labels}}} {hist['sum']!r}")
+                lines.append(f"{metric}_count{{{labels}}} {hist['count']}")
+        for key, value in sorted(merged[COUNTERS].items()):
+            lines.append(f"# TYPE blk_{key}_total counter")
+            lines.append(f"blk_{key}_total {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Metrics()
+atexit.register(metrics.flush)
@@ -0,0 +1,93 @@
+"""Memory-mapped, line-aligned chunk readers for expense files.
+
+``split`` cuts a file into byte ranges that each end on a newline, looking
+only at the bytes around each cut, so a pool of processes can each map the
+file and decode their own range straight from the page cache.  Files hold
+one record per line: NDJSON objects, or CSV rows under a header naming at
+least ``timestamp`` and ``amount`` (quoted fields must not span lines).
+"""
+import csv
+import mmap
+import os
+
+from app.utils.serialization import loads
+
+FORMATS = ("csv", "ndjson")
+CSV_COLUMNS = ("timestamp", "amount")
+
+
+def detect_format(path):
+    """``csv`` or ``ndjson`` from the file extension."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return "csv"
+    if ext in (".ndjson", ".jsonl"):
+        return "ndjson"
+    raise ValueError(f"Cannot tell the format of {path}; pass it explicitly")
+
+
+def _map(f):
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def csv_header(path):
+    """``(columns, data_start)``: header names and the offset of row one."""
+    with open(path, "rb") as f:
+        line = f.readline()
+    columns = next(csv.reader([line.decode("utf-8-sig")]), [])
+    columns = [c.strip() for c in columns]
+    missing = [c for c in CSV_COLUMNS if c not in columns]
+    if missing:
+        raise ValueError(f"CSV header lacks column(s): {', '.join(missing)}")
+    return columns, len(line)
+
+
+def split(path, chunk_bytes, start=0):
+    """Byte ranges ``[(start, end), ...]`` of about ``chunk_bytes`` each.
+
+    Every range but the last ends just after a newline.
+    """
+    size = os.path.getsize(path)
+    if size <= start:
+        return []
+    ranges = []
+    with open(path, "rb") as f, _map(f) as mm:
+        while start < size:
+            cut = mm.find(b"\n", min(start + chunk_bytes, size) - 1)
+            end = size if cut < 0 else cut + 1
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _csv_value(text):
+    # Numbers get JSON semantics ("250" is an int, "250.5" a float); anything
+    # else stays a string, for validation to reject.
+    try:
+        value = loads(text)
+    except ValueError:
+        return text
+    return value if type(value) in (int, float) else text
+
+
+def read_records(path, fmt, start, end, columns=None):
+    """Decode the records in ``[start, end)`` of ``path`` as expense dicts.
+
+    ``columns`` is the CSV header (from ``csv_header``).  Raises
+    ``ValueError`` on a malformed NDJSON line.
+    """
+    with open(path, "rb") as f, _map(f) as mm:
+        data = mm[start:end]
+    lines = data.splitlines()
+    if fmt == "ndjson":
+        return [loads(line) for line in lines if line.strip()]
+
+    ts_col = columns.index("timestamp")
+    amount_col = columns.index("amount")
+    records = []
+    for row in csv.reader(line.decode("utf-8") for line in lines if line.strip()):
+        records.append({
+            "timestamp": row[ts_col].strip() if ts_col < len(row) else "",
+            "amount": _csv_value(row[amount_col]) if amount_col < len(row) else None,
+        })
+    return records
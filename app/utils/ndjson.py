@@ -0,0 +1,49 @@
+from app.utils.constants import NDJSON_CHUNK_SIZE
+from app.utils.serialization import dumps, loads, stream_response
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+def iter_ndjson_chunks(stream, chunk_size=NDJSON_CHUNK_SIZE):
+    """Read an NDJSON byte stream line by line, yielding lists of records.
+
+    Only one chunk of decoded records is held at a time, so memory stays
+    bounded by ``chunk_size`` regardless of how large the body is.  A line
+    that is not a JSON object raises ``ValueError``.
+    """
+    chunk = []
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        record = loads(line)
+        if not isinstance(record, dict):
+            raise ValueError(f"expected a JSON object, got {type(record).__name__}")
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def encode_ndjson(records):
+    return b"".join(dumps(r) + b"\n" for r in records)
+
+
+def ndjson_response(encoded_chunks):
+    """Stream already-encoded NDJSON chunks back to the client.
+
+    A malformed input line (bad JSON, not an object, or missing or
+    mistyped fields) ends the stream with a trailing ``error`` record,
+    since the status line has already been sent by then.
+    """
+    def generate():
+        try:
+            for encoded in encoded_chunks:
+                if encoded:
+                    yield encoded
+        except (ValueError, TypeError, KeyError, AttributeError) as exc:
+            yield encode_ndjson([{"error": f"Invalid NDJSON input: {exc}"}])
+
+    return stream_response(generate(), mimetype=NDJSON_MIMETYPE)
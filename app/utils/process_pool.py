@@ -0,0 +1,49 @@
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from app.utils.constants import PROCESS_POOL_WORKERS
+
+_pool = None
+_lock = threading.Lock()
+
+
+def _context():
+    # Forking a threaded gunicorn worker is unsafe; forkserver/spawn children
+    # start from a clean interpreter instead.
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context(
+        "forkserver" if "forkserver" in methods else "spawn"
+    )
+
+
+def pool_size():
+    return PROCESS_POOL_WORKERS
+
+
+def get_process_pool():
+    """Process pool shared by everything in this worker, created on first use.
+
+    It is bounded to ``PROCESS_POOL_WORKERS`` processes and stays alive
+    across requests, so only the first heavy request pays the start-up cost.
+    """
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PROCESS_POOL_WORKERS, mp_context=_context()
+            )
+        return _pool
+
+
+def discard_process_pool():
+    """Drop the shared pool, e.g. after a child crashed and broke it."""
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False)
+
+
+atexit.register(discard_process_pool)
@@ -0,0 +1,297 @@
+"""Response cache for idempotent JSON endpoints, shared by all workers.
+
+Entries live in one SQLite file and are keyed by a hash of the route, the
+canonical (sorted-key) request body and ``CACHE_VERSION``, a hash of the
+constants (``RESPONSE_FORMAT_VERSION`` among them) and the tax-regime file,
+so a release that bumps the format version or a configuration change never
+serves stale results.  The hash of the raw body
+bytes is recorded as an alias of that key, so an exact retry is answered
+with a hash and one lookup, without parsing the body.  Each accepted content
+encoding and response format (JSON or columnar) is stored separately, so a
+hit is returned byte for byte.  Entries
+expire after ``RESPONSE_CACHE_TTL`` seconds and the oldest are evicted once
+the file holds more than ``RESPONSE_CACHE_MAX_BYTES`` of bodies.
+"""
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from flask import Response, request
+from werkzeug.exceptions import BadRequest
+
+from app.utils import constants
+from app.utils.constants import (
+    RESPONSE_CACHE_DB,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_MAX_ENTRY_BYTES,
+    RESPONSE_CACHE_TTL,
+)
+from app.utils.metrics import metrics
+from app.utils.serialization import (
+    JSON_MIMETYPE,
+    accepted_encoding,
+    dumps,
+    is_columnar_request,
+    read_json,
+    response_mimetype,
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT NOT NULL,
+    encoding TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    content_type TEXT NOT NULL,
+    content_encoding TEXT,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (key, encoding)
+);
+CREATE INDEX IF NOT EXISTS responses_created ON responses (created);
+CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires);
+CREATE TABLE IF NOT EXISTS aliases (
+    raw_key TEXT PRIMARY KEY,
+    key TEXT NOT NULL
+);
+"""
+
+# Eviction scans the table, so each process runs it once per this many puts.
+_EVICT_EVERY = 64
+
+
+def _cache_version():
+    digest = hashlib.sha256()
+    for name in sorted(dir(constants)):
+        if name.isupper():
+            digest.update(f"{name}={getattr(constants, name)!r};".encode())
+    if constants.TAX_REGIMES_FILE:
+        try:
+            with open(constants.TAX_REGIMES_FILE, "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            pass
+    return digest.hexdigest()[:16]
+
+
+CACHE_VERSION = _cache_version()
+
+
+class ResponseCache:
+    def __init__(
+        self, path=RESPONSE_CACHE_DB, ttl=RESPONSE_CACHE_TTL,
+        max_bytes=RESPONSE_CACHE_MAX_BYTES, enabled=RESPONSE_CACHE_ENABLED,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._schema_ready = False
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self):
+        # One connection per thread, reused across requests; opening one per
+        # lookup would cost more than serving a small request from scratch.
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(
+            self.path, timeout=5, isolation_level=None, check_same_thread=False
+        )
+        if not self._schema_ready:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._schema_ready = True
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def key(route, body):
+        """Cache key for a JSON body posted to ``route``."""
+        payload = b"\0".join([CACHE_VERSION.encode(), route.encode(), dumps(body)])
+        return hashlib.sha256(payload).hexdigest()
+
+    @staticmethod
+    def raw_key(route, data):
+        """Alias key for the exact request bytes posted to ``route``."""
+        payload = b"\0".join([CACHE_VERSION.encode(), route.encode(), b"raw", data])
+        return hashlib.sha256(payload).hexdigest()
+
+    def _fetch(self, query, params):
+        row = self._connect().execute(query, params).fetchone()
+        if row is None:
+            return None
+        status, content_type, content_encoding, body = row
+        response = Response(body, status=status, content_type=content_type)
+        if content_encoding:
+            response.headers["Content-Encoding"] = content_encoding
+        # Entries are keyed by the negotiated mimetype too, as on a miss.
+        response.vary.add("Accept-Encoding")
+        response.vary.add("Accept")
+        return response
+
+    def get(self, key, encoding):
+        """``Response`` for a live entry, or ``None``."""
+        return self._fetch(
+            "SELECT status, content_type, content_encoding, body FROM responses"
+            " WHERE key = ? AND encoding = ? AND expires > ?",
+            (key, encoding, time.time()),
+        )
+
+    def get_raw(self, raw_key, encoding):
+        """Like ``get``, looked up through a raw-body alias."""
+        return self._fetch(
+            "SELECT r.status, r.content_type, r.content_encoding, r.body"
+            " FROM aliases a JOIN responses r ON r.key = a.key"
+            " WHERE a.raw_key = ? AND r.encoding = ? AND r.expires > ?",
+            (raw_key, encoding, time.time()),
+        )
+
+    def add_alias(self, raw_key, key):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO aliases (raw_key, key) VALUES (?, ?)",
+            (raw_key, key),
+        )
+
+    def put(self, key, encoding, response, raw_key=None):
+        body = response.get_data()
+        if len(body) > RESPONSE_CACHE_MAX_ENTRY_BYTES:
+            return
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, encoding, status, content_type,"
+                " content_encoding, body, size, created, expires)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key, encoding, response.status_code, response.content_type,
+                    response.headers.get("Content-Encoding"), body, len(body),
+                    now, now + self.ttl,
+                ),
+            )
+            if raw_key is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO aliases (raw_key, key) VALUES (?, ?)",
+                    (raw_key, key),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self._puts += 1
+            evict = self._puts % _EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries and enforce the size budget now."""
+        conn = self._connect()
+        conn.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),))
+        (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total > self.max_bytes:
+            # Drop the oldest entries until about 90% of the budget is left.
+            excess = total - int(self.max_bytes * 0.9)
+            cutoff = conn.execute(
+                "SELECT created FROM (SELECT created, SUM(size) OVER (ORDER BY created)"
+                " AS running FROM responses) WHERE running >= ? LIMIT 1",
+                (excess,),
+            ).fetchone()
+            if cutoff is not None:
+                conn.execute("DELETE FROM responses WHERE created <= ?", cutoff)
+        conn.execute(
+            "DELETE FROM aliases WHERE key NOT IN (SELECT key FROM responses)"
+        )
+
+    def stats(self):
+        try:
+            entries, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        except (sqlite3.Error, OSError):
+            entries = size = 0
+        return {"entries": entries, "bytes": size, "maxBytes": self.max_bytes}
+
+
+response_cache = ResponseCache()
+
+
+def _try(func, *args):
+    # The cache is an optimization: a failing store must not fail the request.
+    try:
+        return func(*args)
+    except (sqlite3.Error, OSError):
+        return None
+
+
+def _hit(response):
+    metrics.increment("response_cache_hits")
+    response.headers["X-Cache"] = "HIT"
+    return response
+
+
+def cached_response(cacheable=None):
+    """Serve a JSON POST view from ``response_cache`` when possible.
+
+    ``cacheable(body)`` may veto caching for a request (e.g. a request that
+    asks for fresh randomness).  Only complete 200 responses are stored;
+    streamed ones pass through.  Every response carries ``X-Cache``: HIT,
+    MISS or BYPASS.
+    """
+    def decorate(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = response_cache
+            if not cache.enabled:
+                return _bypass(view, args, kwargs)
+            route = request.full_path
+            mimetype = response_mimetype()
+            if mimetype != JSON_MIMETYPE:
+                route = f"{route} {mimetype}"
+            encoding = accepted_encoding() or "identity"
+            raw_key = cache.raw_key(route, request.get_data())
+            response = _try(cache.get_raw, raw_key, encoding)
+            if response is not None:
+                return _hit(response)
+
+            try:
+                body = read_json()
+            except BadRequest:
+                body = None
+            if not isinstance(body, dict) or (cacheable and not cacheable(body)):
+                return _bypass(view, args, kwargs)
+
+            # A columnar body is already canonical: its bytes are the key.
+            key = raw_key if is_columnar_request() else cache.key(route, body)
+            response = _try(cache.get, key, encoding)
+            if response is not None:
+                _try(cache.add_alias, raw_key, key)
+                return _hit(response)
+
+            metrics.increment("response_cache_misses")
+            response = view(*args, **kwargs)
+            if response.status_code == 200 and not response.is_streamed:
+                _try(cache.put, key, encoding, response, raw_key)
+            response.headers["X-Cache"] = "MISS"
+            return response
+        return wrapper
+    return decorate
+
+
+def _bypass(view, args, kwargs):
+    response = view(*args, **kwargs)
+    response.headers["X-Cache"] = "BYPASS"
+    return response
@@ -0,0 +1,25 @@
+import numpy as np
+
+# Beyond this magnitude round(x, 2) is the identity in Python but x * 100 / 100
+# may not round-trip, so those values are rounded one by one.
+_EXACT_LIMIT = 1e13
+
+
+def round2(values):
+    """Element-wise ``round(x, 2)`` matching Python's float semantics exactly.
+
+    ``np.round`` scales by 100 before rounding, which can flip results that lie
+    within float error of a half-cent.  Those rows (and very large values) are
+    re-rounded with the builtin, so the output is bit-identical to a loop.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    flat = values.reshape(-1)
+    out = np.round(flat, 2)
+    scaled = flat * 100
+    with np.errstate(invalid="ignore"):
+        tricky = (np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6) | (
+            np.abs(flat) >= _EXACT_LIMIT
+        )
+    for i in np.flatnonzero(tricky):
+        out[i] = round(float(flat[i]), 2)
+    return out.reshape(values.shape)
@@ -0,0 +1,205 @@
+"""JSON encoding and response building shared by every blueprint.
+
+``orjson`` is used when installed, with the standard library as fallback;
+both produce compact output with sorted keys, like ``jsonify``.  Responses
+whose top-level lists are large are encoded incrementally and streamed, and
+every response is gzip/deflate compressed when the client accepts it.
+
+Bodies may also use the binary columnar format of ``columnar_wire``: a
+request sent with its content type is decoded into ``ColumnarTable``
+tables, and a client that accepts it gets successful responses in it.
+"""
+import json
+import zlib
+
+from flask import Response, g, request, stream_with_context
+from werkzeug.exceptions import BadRequest
+
+from app.utils import columnar_wire
+from app.utils.admission import check_payload
+from app.utils.columnar_table import ColumnarTable
+from app.utils.columnar_wire import COLUMNAR_MIMETYPE
+from app.utils.constants import (
+    COMPRESS_LEVEL,
+    COMPRESS_MIN_BYTES,
+    STREAM_CHUNK_ITEMS,
+    STREAM_MIN_ITEMS,
+)
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+JSON_MIMETYPE = "application/json"
+
+_ENCODINGS = {
+    # wbits: gzip container vs. zlib stream (what HTTP calls "deflate").
+    "gzip": 16 + zlib.MAX_WBITS,
+    "deflate": zlib.MAX_WBITS,
+}
+
+
+def _default(obj):
+    if isinstance(obj, ColumnarTable):
+        return obj.records()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _std_dumps(obj):
+    return json.dumps(
+        obj, sort_keys=True, separators=(",", ":"), default=_default,
+    ).encode("utf-8")
+
+
+def dumps(obj):
+    """Serialize to compact UTF-8 JSON bytes with sorted keys.
+
+    ``ColumnarTable`` values are written as their list of records.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_default, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            # e.g. integers beyond 64 bits; the stdlib handles those.
+            pass
+    return _std_dumps(obj)
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def is_columnar_request():
+    return request.mimetype == COLUMNAR_MIMETYPE
+
+
+def read_json():
+    """Parse the request body as JSON regardless of content type.
+
+    Equivalent to ``request.get_json(force=True)`` but uses the fast decoder.
+    A body in the columnar format (by its content type) is decoded with
+    ``columnar_wire`` instead.  The result is kept for the rest of the
+    request, so parsing happens once.  Bodies over the admission limits on
+    transaction and period counts raise ``RequestEntityTooLarge``.
+    """
+    if "json_body" not in g:
+        if is_columnar_request():
+            try:
+                body = columnar_wire.decode(request.get_data())
+            except ValueError as exc:
+                raise BadRequest(f"Failed to decode columnar body: {exc}")
+        else:
+            try:
+                body = loads(request.get_data())
+            except ValueError as exc:
+                raise BadRequest(f"Failed to decode JSON object: {exc}")
+        check_payload(body)
+        g.json_body = body
+    return g.json_body
+
+
+def response_mimetype():
+    """``JSON_MIMETYPE`` or ``COLUMNAR_MIMETYPE``, from the request's Accept."""
+    return request.accept_mimetypes.best_match(
+        [JSON_MIMETYPE, COLUMNAR_MIMETYPE], default=JSON_MIMETYPE,
+    )
+
+
+def accepted_encoding():
+    """``"gzip"``, ``"deflate"`` or ``None``, from the request's Accept-Encoding."""
+    return request.accept_encodings.best_match(list(_ENCODINGS))
+
+
+def _negotiate_encoding(size_hint):
+    if size_hint is not None and size_hint < COMPRESS_MIN_BYTES:
+        return None
+    return accepted_encoding()
+
+
+def _compress_stream(chunks, encoding):
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, _ENCODINGS[encoding])
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def stream_response(chunks, mimetype=JSON_MIMETYPE, status=200):
+    """Stream an iterable of byte chunks, compressed if the client allows."""
+    encoding = _negotiate_encoding(None)
+    if encoding is not None:
+        chunks = _compress_stream(chunks, encoding)
+    response = Response(
+        stream_with_context(chunks), status=status, mimetype=mimetype
+    )
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def _large_lists(obj):
+    if not isinstance(obj, dict):
+        return False
+    return any(
+        isinstance(value, (list, ColumnarTable)) and len(value) >= STREAM_MIN_ITEMS
+        for value in obj.values()
+    )
+
+
+def _iter_encoded(obj):
+    """Encode a dict piece by piece, splitting its lists into chunks.
+
+    Only the current chunk of a list is ever held as encoded bytes (or, for
+    a ``ColumnarTable``, as dicts).
+    """
+    yield b"{"
+    for n, key in enumerate(sorted(obj)):
+        if n:
+            yield b","
+        yield dumps(key) + b":"
+        value = obj[key]
+        if not isinstance(value, (list, ColumnarTable)):
+            yield dumps(value)
+            continue
+        yield b"["
+        for start in range(0, len(value), STREAM_CHUNK_ITEMS):
+            encoded = dumps(value[start:start + STREAM_CHUNK_ITEMS])[1:-1]
+            if start and encoded:
+                yield b","
+            yield encoded
+        yield b"]"
+    yield b"}"
+
+
+def json_response(obj, status=200):
+    """Drop-in replacement for ``jsonify(obj), status``.
+
+    Successful responses are sent in the columnar format instead when the
+    client prefers it; errors always stay JSON.
+    """
+    mimetype = JSON_MIMETYPE
+    if status == 200 and isinstance(obj, dict):
+        mimetype = response_mimetype()
+    if mimetype == JSON_MIMETYPE and _large_lists(obj):
+        response = stream_response(_iter_encoded(obj), status=status)
+        response.vary.add("Accept")
+        return response
+
+    body = dumps(obj) if mimetype == JSON_MIMETYPE else columnar_wire.encode(obj)
+    encoding = _negotiate_encoding(len(body))
+    if encoding is not None:
+        compressor = zlib.compressobj(
+            COMPRESS_LEVEL, zlib.DEFLATED, _ENCODINGS[encoding]
+        )
+        body = compressor.compress(body) + compressor.flush()
+    response = Response(body, status=status, mimetype=mimetype)
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.vary.add("Accept")
+    return response
@@ -0,0 +1 @@
+"""Reproducible benchmarks for the service layer; see ``bench.run``."""
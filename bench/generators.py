@@ -0,0 +1,66 @@
+"""Seeded synthetic workloads.
+
+The same ``(size, seed)`` always produces the same data, so benchmark runs
+on different commits are comparable.  Timestamps are unique and spread over
+about a year from ``START``; expenses are shuffled so the sweep has to sort.
+"""
+import random
+
+from app.services.transaction_service import parse_expenses
+from app.utils.constants import MAX_AMOUNT
+from app.utils.datetime_codec import from_epoch, to_epoch
+
+START = to_epoch("2023-01-01 00:00:00")
+SPAN = 365 * 86_400
+
+
+def _epochs(rng, n):
+    # One slot of ``step`` seconds per expense keeps the timestamps unique.
+    step = max(1, SPAN // max(n, 1))
+    epochs = [START + i * step + rng.randrange(step) for i in range(n)]
+    rng.shuffle(epochs)
+    return epochs
+
+
+def _amount(rng):
+    # Half whole rupees, half with paise; up to 1% of MAX_AMOUNT.
+    if rng.random() < 0.5:
+        return rng.randrange(1, MAX_AMOUNT // 100)
+    return round(rng.uniform(1, MAX_AMOUNT / 100), 2)
+
+
+def expenses(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        {"timestamp": from_epoch(epoch), "amount": _amount(rng)}
+        for epoch in _epochs(rng, n)
+    ]
+
+
+def transactions(n, seed=0):
+    return parse_expenses(expenses(n, seed))
+
+
+def _window(rng, max_days):
+    start = START + rng.randrange(SPAN)
+    end = start + rng.randrange(1, max_days * 86_400)
+    return from_epoch(start), from_epoch(end)
+
+
+def periods(n, seed=0):
+    """q, p and k period lists sized for ``n`` transactions.
+
+    Each has about one period per 100 transactions (between 1 and 1000),
+    lasting up to 30 days for q/p and up to 90 days for k.
+    """
+    rng = random.Random(seed + 1)
+    count = min(1000, max(1, n // 100))
+    q, p, k = [], [], []
+    for _ in range(count):
+        start, end = _window(rng, 30)
+        q.append({"start": start, "end": end, "fixed": rng.randrange(0, 100)})
+        start, end = _window(rng, 30)
+        p.append({"start": start, "end": end, "extra": rng.randrange(1, 50)})
+        start, end = _window(rng, 90)
+        k.append({"start": start, "end": end})
+    return q, p, k
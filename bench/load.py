@@ -0,0 +1,422 @@
+"""Load and soak test the WSGI app end to end over HTTP.
+
+    python -m bench.load                                   # in-process server, 30 s
+    python -m bench.load --server gunicorn --workers 2 --threads 2 --duration 60
+    python -m bench.load --sweep 1x1,2x2,4x2 --duration 20 # gunicorn configurations
+    python -m bench.load --server gunicorn --duration 3600 --max-rss-growth 50
+
+Starts ``wsgi:app`` (under gunicorn, or in this process on a threaded
+werkzeug server) and has ``--concurrency`` client threads replay a weighted
+``--mix`` of parse, validator, filter, returns and performance requests.
+Bodies are synthetic (``bench.generators``, ``--size`` transactions each),
+with ``--distinct`` different bodies per endpoint, so the response cache
+sees realistic repeats (``--no-cache`` turns it off).
+
+The report gives throughput, latency percentiles and error rate per
+endpoint and overall, plus the server's resident memory sampled every
+``--interval`` seconds.  A soak run sets ``--max-rss-growth``: the exit
+status is 2 when RSS grew by more megabytes than that between the end of
+``--warmup`` and the end of the run.  In-process, RSS includes the client
+threads.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import psutil
+
+from bench import generators
+from bench.run import _write_json
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+RESULTS = os.path.join(HERE, "results", "load.json")
+API = "/blackrock/challenge/v1"
+MIX = "parse=3,validator=3,filter=2,returns=2,performance=1"
+ENDPOINTS = ("parse", "validator", "filter", "returns", "performance")
+PERCENTILES = (50, 90, 99)
+MB = 1024 * 1024
+
+
+def parse_mix(text):
+    """``{"parse": 3, ...}`` from ``"parse=3,..."``."""
+    mix = {}
+    for item in text.split(","):
+        if not item:
+            continue
+        name, _, weight = item.partition("=")
+        if name not in ENDPOINTS:
+            raise ValueError(f"unknown endpoint in mix: {name}")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("the mix needs at least one positive weight")
+    return mix
+
+
+def _bodies(name, size, seed):
+    if name == "performance":
+        return "GET", f"{API}/performance", None
+    q, p, k = generators.periods(size, seed)
+    if name == "parse":
+        return "POST", f"{API}/transactions:parse", {
+            "expenses": generators.expenses(size, seed),
+        }
+    transactions = generators.transactions(size, seed)
+    if name == "validator":
+        return "POST", f"{API}/transactions:validator", {
+            "wage": 50_000, "transactions": transactions,
+        }
+    if name == "filter":
+        return "POST", f"{API}/transactions:filter", {
+            "transactions": transactions, "q": q, "p": p, "k": k,
+        }
+    instrument = "nps" if seed % 2 == 0 else "index"
+    return "POST", f"{API}/returns:{instrument}", {
+        "transactions": transactions, "q": q, "p": p, "k": k,
+        "age": 29, "wage": 50_000,
+    }
+
+
+def build_plan(mix, size, distinct, seed=0):
+    """Pre-encoded ``(name, method, path, body)`` requests per endpoint."""
+    plan = {}
+    for name in mix:
+        requests = []
+        for i in range(distinct if name != "performance" else 1):
+            method, path, body = _bodies(name, size, seed + i)
+            encoded = None if body is None else json.dumps(body).encode()
+            requests.append((name, method, path, encoded))
+        plan[name] = requests
+    return plan
+
+
+class Recorder:
+    """Per-request ``(endpoint, start, seconds, status)``; status None on I/O errors."""
+
+    def __init__(self):
+        self.records = []
+        self.errors = 0
+
+    def add(self, name, start, seconds, status):
+        self.records.append((name, start, seconds, status))
+        if status is None or status >= 400:
+            self.errors += 1
+
+
+def _client(host, port, plan, mix, deadline, recorder, seed):
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    conn = http.client.HTTPConnection(host, port, timeout=120)
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        _, method, path, body = rng.choice(plan[name])
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+            if response.will_close:
+                conn.close()
+        except (OSError, http.client.HTTPException):
+            status = None
+            conn.close()
+        recorder.add(name, start, time.perf_counter() - start, status)
+    conn.close()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(host, port, proc=None, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"server exited with status {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=5)
+            conn.request("GET", f"{API}/performance")
+            if conn.getresponse().status == 200:
+                conn.close()
+                return
+        except (OSError, http.client.HTTPException):
+            time.sleep(0.2)
+    raise RuntimeError("server did not become ready")
+
+
+class InProcessServer:
+    """``wsgi:app`` on a threaded werkzeug server in this process."""
+
+    def __init__(self, cache=True):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        from app.utils import response_cache
+        from wsgi import app
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        if not cache:
+            response_cache.response_cache.enabled = False
+        self.host = "127.0.0.1"
+        self._server = make_server(
+            self.host, 0, app, threaded=True, request_handler=QuietHandler,
+        )
+        self.port = self._server.server_port
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self.label = "inprocess"
+
+    def __enter__(self):
+        self._thread.start()
+        _wait_ready(self.host, self.port)
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._thread.join()
+
+    def rss(self):
+        return psutil.Process().memory_info().rss
+
+
+class GunicornServer:
+    """``gunicorn wsgi:app`` as a child process."""
+
+    def __init__(self, workers, threads, cache=True):
+        self.host = "127.0.0.1"
+        self.port = _free_port()
+        self.label = f"gunicorn {workers}x{threads}"
+        self._cmd = [
+            sys.executable, "-m", "gunicorn", "--bind", f"{self.host}:{self.port}",
+            "--workers", str(workers), "--threads", str(threads), "wsgi:app",
+        ]
+        self._env = dict(os.environ)
+        if not cache:
+            self._env["RESPONSE_CACHE_ENABLED"] = "0"
+        self._proc = None
+
+    def __enter__(self):
+        self._proc = subprocess.Popen(
+            self._cmd, cwd=ROOT, env=self._env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            _wait_ready(self.host, self.port, self._proc)
+        except BaseException:
+            self.__exit__()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self._proc.terminate()
+        try:
+            self._proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+            self._proc.wait()
+
+    def rss(self):
+        """Master plus workers (and their pool processes)."""
+        try:
+            root = psutil.Process(self._proc.pid)
+            procs = [root] + root.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return 0
+        total = 0
+        for proc in procs:
+            try:
+                total += proc.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        return total
+
+
+def _latency(seconds):
+    if not seconds:
+        return {}
+    values = np.percentile(np.array(seconds) * 1000, PERCENTILES)
+    latency = {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, values)}
+    latency["max"] = round(max(seconds) * 1000, 2)
+    return latency
+
+
+def summarize(records, started, duration):
+    """Throughput, latency percentiles (ms) and error rate, per endpoint.
+
+    Only requests that started at or after ``started`` count.
+    """
+    groups = {}
+    for name, start, seconds, status in records:
+        if start >= started:
+            groups.setdefault(name, []).append((seconds, status))
+    groups["all"] = [entry for name in list(groups) for entry in groups[name]]
+    summary = {}
+    for name, entries in groups.items():
+        errors = sum(1 for _, status in entries if status is None or status >= 400)
+        summary[name] = {
+            "requests": len(entries),
+            "errors": errors,
+            "errorRate": round(errors / len(entries), 4) if entries else 0.0,
+            "throughput": round(len(entries) / duration, 2) if duration > 0 else 0.0,
+            "latencyMs": _latency([seconds for seconds, _ in entries]),
+        }
+    return summary
+
+
+def rss_growth(samples, started):
+    """RSS change (MB) over the samples taken from ``started`` on, and its slope."""
+    points = [(t, rss) for t, rss in samples if t >= started]
+    if len(points) < 2:
+        return {"growthMB": 0.0, "slopeMBPerHour": 0.0}
+    t = np.array([p[0] for p in points])
+    rss = np.array([p[1] for p in points], dtype=np.float64) / MB
+    slope = np.polyfit(t - t[0], rss, 1)[0] if t[-1] > t[0] else 0.0
+    return {
+        "growthMB": round(float(rss[-1] - rss[0]), 2),
+        "slopeMBPerHour": round(float(slope) * 3600, 2),
+    }
+
+
+def run_load(server, plan, mix, duration, concurrency, warmup=0.0, interval=1.0, seed=0):
+    """Drive ``server`` for ``warmup + duration`` seconds; returns the report."""
+    recorder = Recorder()
+    began = time.perf_counter()
+    started = began + warmup
+    deadline = started + duration
+    clients = [
+        threading.Thread(
+            target=_client,
+            args=(server.host, server.port, plan, mix, deadline, recorder, seed + i),
+            daemon=True,
+        )
+        for i in range(concurrency)
+    ]
+    for thread in clients:
+        thread.start()
+
+    samples, timeline = [], []
+    while any(thread.is_alive() for thread in clients):
+        now = time.perf_counter()
+        rss = server.rss()
+        samples.append((now, rss))
+        timeline.append({
+            "t": round(now - began, 2),
+            "rssMB": round(rss / MB, 1),
+            "requests": len(recorder.records),
+            "errors": recorder.errors,
+        })
+        next(t for t in clients if t.is_alive() or t is clients[-1]).join(interval)
+    samples.append((time.perf_counter(), server.rss()))
+
+    return {
+        "server": server.label,
+        "concurrency": concurrency,
+        "duration": duration,
+        "warmup": warmup,
+        "endpoints": summarize(recorder.records, started, duration),
+        "rss": rss_growth(samples, started),
+        "timeline": timeline,
+    }
+
+
+def _print_report(report, stream=sys.stderr):
+    print(f"== {report['server']}, {report['concurrency']} clients", file=stream)
+    for name, s in report["endpoints"].items():
+        lat = s["latencyMs"]
+        print(
+            f"{name:>12} {s['requests']:7d} req {s['throughput']:8.1f}/s"
+            f"  p50 {lat.get('p50', 0):8.1f}  p99 {lat.get('p99', 0):8.1f} ms"
+            f"  errors {s['errorRate']:.2%}",
+            file=stream,
+        )
+    rss = report["rss"]
+    print(
+        f"{'rss':>12} {rss['growthMB']:+.1f} MB ({rss['slopeMBPerHour']:+.1f} MB/h)",
+        file=stream,
+    )
+
+
+def _parse_config(text):
+    workers, _, threads = text.partition("x")
+    return int(workers), int(threads or 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", choices=("inprocess", "gunicorn"), default="inprocess")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument(
+        "--sweep", help="comma-separated gunicorn WORKERSxTHREADS configurations",
+    )
+    parser.add_argument("--mix", default=MIX, help="endpoint=weight list")
+    parser.add_argument("--size", type=int, default=1000, help="transactions per body")
+    parser.add_argument("--distinct", type=int, default=16, help="bodies per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=0.0, help="unmeasured seconds first")
+    parser.add_argument("--interval", type=float, default=1.0, help="RSS sampling period")
+    parser.add_argument("--no-cache", action="store_true", help="disable the response cache")
+    parser.add_argument(
+        "--max-rss-growth", type=float,
+        help="fail (exit 2) if server RSS grows by more MB than this",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=RESULTS)
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as exc:
+        parser.error(str(exc))
+    configs = [_parse_config(c) for c in args.sweep.split(",") if c] if args.sweep else None
+    plan = build_plan(mix, args.size, args.distinct, args.seed)
+    cache = not args.no_cache
+
+    if configs:
+        servers = [GunicornServer(w, t, cache) for w, t in configs]
+    elif args.server == "gunicorn":
+        servers = [GunicornServer(args.workers, args.threads, cache)]
+    else:
+        servers = [InProcessServer(cache)]
+
+    reports = []
+    for server in servers:
+        with server:
+            report = run_load(
+                server, plan, mix, args.duration, args.concurrency,
+                args.warmup, args.interval, args.seed,
+            )
+        _print_report(report)
+        reports.append(report)
+    _write_json(args.output, {"mix": mix, "size": args.size, "runs": reports})
+
+    if args.max_rss_growth is not None:
+        grown = [r for r in reports if r["rss"]["growthMB"] > args.max_rss_growth]
+        for report in grown:
+            print(
+                f"RSS GROWTH {report['server']}: {report['rss']['growthMB']} MB"
+                f" > {args.max_rss_growth} MB",
+                file=sys.stderr,
+            )
+        if grown:
+            return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
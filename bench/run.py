@@ -0,0 +1,320 @@
+"""Benchmark the service layer on seeded workloads.
+
+    python -m bench.run                          # run, compare to bench/baseline.json
+    python -m bench.run --sizes 1000,10000       # smaller sweep
+    python -m bench.run --update-baseline        # record a new baseline
+    python -m bench.run --memory                 # also record bytes per transaction
+
+Each case is timed ``--repeat`` times (once at 10^6) and the best time is
+kept.  Results are written as JSON; any case slower than the baseline by
+more than ``--threshold`` (a fraction) exits non-zero.  Baselines are
+machine-specific: record one on the machine that compares.  A case that
+looks slower is timed again ``--recheck`` times before it is reported, and
+its best time is kept, so one noisy round on a shared machine does not fail
+the run.
+
+    python -m bench.run --against main           # compare to main, timed here
+
+``--against`` replaces the stored baseline with a run of another git
+revision on this machine: the revision is exported to a temporary
+directory and its own ``bench/run.py`` is timed one size at a time,
+alternating with this tree, so both see the same machine load.
+
+With ``--memory`` each case is also run once under ``tracemalloc`` and its
+peak allocation divided by the input size is reported as
+``bytesPerTransaction``, and the ``TransactionStore`` of one q/p/k run as
+``storeBytesPerTransaction`` (its columns' ``nbytes`` over the row count).
+Neither is ever compared.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import tracemalloc
+
+from app.services.investment_service import calculate_returns
+from app.services.period_rule_service import (
+    apply_k_grouping,
+    apply_p_rules,
+    apply_q_rules,
+    filter_transactions,
+)
+from app.services.pipeline_service import compile_periods, run_pipeline
+from app.services.transaction_service import parse_expenses, validate_transactions
+from app.utils import columnar_wire
+from app.utils.constants import NPS_RATE
+from bench import generators
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+BASELINE = os.path.join(HERE, "baseline.json")
+RESULTS = os.path.join(HERE, "results", "latest.json")
+SIZES = (1_000, 10_000, 100_000, 1_000_000)
+# Slowdowns smaller than this are timer noise, whatever the ratio.
+MIN_DELTA = 0.001
+
+
+def _workload(n, seed):
+    q, p, k = generators.periods(n, seed)
+    expenses = generators.expenses(n, seed)
+    return {
+        "expenses": expenses,
+        # As a columnar-wire request body decodes it.
+        "expense_table": columnar_wire.decode(columnar_wire.encode({"e": expenses}))["e"],
+        "transactions": generators.transactions(n, seed),
+        "q": q,
+        "p": p,
+        "k": k,
+    }
+
+
+# The services copy rather than mutate their inputs, so one workload is
+# shared by every case and repeat.
+CASES = {
+    "parse_expenses": lambda w: parse_expenses(w["expenses"]),
+    "parse_expenses_columnar": lambda w: parse_expenses(w["expense_table"]),
+    "validate_transactions": lambda w: validate_transactions(50_000, w["transactions"]),
+    "apply_q_rules": lambda w: apply_q_rules(w["transactions"], w["q"]),
+    "apply_p_rules": lambda w: apply_p_rules(w["transactions"], w["p"]),
+    "apply_k_grouping": lambda w: apply_k_grouping(w["transactions"], w["k"]),
+    "filter_transactions": lambda w: filter_transactions(
+        w["transactions"], w["q"], w["p"], w["k"],
+    ),
+    "calculate_returns": lambda w: calculate_returns(
+        w["transactions"], w["q"], w["p"], w["k"],
+        29, 50_000, 0.055, NPS_RATE, is_nps=True,
+    ),
+}
+
+
+def _time(func, workload, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        func(workload)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _peak_bytes(func, workload):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func(workload)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _store_bytes(workload):
+    compiled = compile_periods(workload["q"], workload["p"], workload["k"])
+    return run_pipeline(workload["transactions"], compiled).store.bytes_per_transaction()
+
+
+def _export(ref, directory):
+    """Write the tree of git revision ``ref`` into ``directory``."""
+    archive = os.path.join(directory, "tree.tar")
+    subprocess.run(
+        ["git", "archive", "--format=tar", "-o", archive, ref], cwd=ROOT, check=True,
+    )
+    with tarfile.open(archive) as tar:
+        tar.extractall(directory)
+
+
+def _time_reference(tree, n, cases, repeat, seed):
+    """Best time per case at size ``n`` using the benchmark in ``tree``."""
+    output = os.path.join(tree, "reference.json")
+    print(f"{'reference':>24} n={n}", file=sys.stderr)
+    subprocess.run(
+        [
+            sys.executable, "-m", "bench.run", "--sizes", str(n),
+            "--cases", ",".join(cases), "--repeat", str(repeat), "--seed", str(seed),
+            "--baseline", os.path.join(tree, "no-baseline.json"), "--output", output,
+        ],
+        cwd=tree, check=True,
+    )
+    with open(output) as f:
+        return json.load(f)["results"]
+
+
+def run(sizes, cases, repeat, seed, memory=None, store_bytes=None, reference=None):
+    """Best time per case.
+
+    Peak bytes per transaction go into ``memory`` and the store's bytes
+    per transaction, per size, into ``store_bytes``.  With ``reference``,
+    a ``(tree, results)`` pair, the benchmark in ``tree`` is timed before
+    each size and its results are added to ``results``.
+    """
+    results = {}
+    for n in sizes:
+        if reference is not None:
+            tree, reference_results = reference
+            reference_results.update(_time_reference(tree, n, cases, repeat, seed))
+        workload = _workload(n, seed)
+        if store_bytes is not None:
+            per_txn = store_bytes[str(n)] = _store_bytes(workload)
+            print(f"{'TransactionStore':>24} n={n:<9} {per_txn:8.1f} B/txn", file=sys.stderr)
+        for name in cases:
+            # Fewer repeats for the largest inputs keeps a full run tractable.
+            seconds = _time(CASES[name], workload, repeat if n < 1_000_000 else 1)
+            results[f"{name}[{n}]"] = seconds
+            line = f"{name:>24} n={n:<9} {seconds * 1000:10.2f} ms"
+            if memory is not None:
+                per_txn = _peak_bytes(CASES[name], workload) / max(n, 1)
+                memory[f"{name}[{n}]"] = round(per_txn, 1)
+                line += f" {per_txn:8.1f} B/txn"
+            print(line, file=sys.stderr)
+    return results
+
+
+def regressed(results, baseline, threshold):
+    """Names of the cases slower than baseline by more than ``threshold``."""
+    slower = []
+    for case, seconds in sorted(results.items()):
+        before = baseline.get(case)
+        if before is None or seconds - before < MIN_DELTA:
+            continue
+        if seconds / before - 1 > threshold:
+            slower.append(case)
+    return slower
+
+
+def compare(results, baseline, threshold):
+    """Cases slower than baseline by more than ``threshold``, as messages."""
+    regressions = []
+    for case in regressed(results, baseline, threshold):
+        before, seconds = baseline[case], results[case]
+        regressions.append(
+            f"{case}: {before * 1000:.2f} ms -> {seconds * 1000:.2f} ms "
+            f"(+{seconds / before - 1:.0%})"
+        )
+    return regressions
+
+
+def recheck(results, baseline, threshold, repeat, seed, rounds):
+    """Time the regressed cases again, keeping each one's best time.
+
+    Stops early once nothing is slower than ``threshold``; ``results`` is
+    updated in place.
+    """
+    for _ in range(rounds):
+        slower = regressed(results, baseline, threshold)
+        if not slower:
+            return
+        workloads = {}
+        for case in slower:
+            name, n = case[:-1].split("[")
+            n = int(n)
+            if n not in workloads:
+                workloads[n] = _workload(n, seed)
+            seconds = _time(CASES[name], workloads[n], repeat if n < 1_000_000 else 1)
+            print(f"{'recheck ' + name:>24} n={n:<9} {seconds * 1000:10.2f} ms", file=sys.stderr)
+            results[case] = min(results[case], seconds)
+
+
+def _write_json(path, payload):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", default=",".join(map(str, SIZES)),
+        help="comma-separated input sizes",
+    )
+    parser.add_argument(
+        "--cases", default=",".join(CASES),
+        help="comma-separated case names",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument(
+        "--recheck", type=int, default=2,
+        help="times to re-run a case that looks slower before reporting it",
+    )
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument(
+        "--against", metavar="REF",
+        help="compare to git revision REF timed on this machine instead of --baseline",
+    )
+    parser.add_argument("--output", default=RESULTS)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument(
+        "--memory", action="store_true",
+        help="also record peak bytes per transaction (tracemalloc)",
+    )
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    cases = [c for c in args.cases.split(",") if c]
+    unknown = sorted(set(cases) - set(CASES))
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+
+    if args.against and args.update_baseline:
+        parser.error("--against and --update-baseline are exclusive")
+
+    memory = {} if args.memory else None
+    store_bytes = {} if args.memory else None
+    if args.against:
+        with tempfile.TemporaryDirectory() as tree:
+            _export(args.against, tree)
+            reference = (tree, {})
+            results = run(sizes, cases, args.repeat, args.seed, memory, store_bytes, reference)
+        baseline = {"seed": args.seed, "results": reference[1]}
+    else:
+        results = run(sizes, cases, args.repeat, args.seed, memory, store_bytes)
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seed": args.seed,
+        "results": results,
+    }
+    if memory is not None:
+        report["bytesPerTransaction"] = memory
+        report["storeBytesPerTransaction"] = store_bytes
+    _write_json(args.output, report)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f).get("results", {})
+        baseline.update(results)
+        _write_json(args.baseline, {"seed": args.seed, "results": baseline})
+        print(f"baseline updated: {args.baseline}", file=sys.stderr)
+        return 0
+
+    if not args.against:
+        if not os.path.exists(args.baseline):
+            print(f"no baseline at {args.baseline}; nothing to compare", file=sys.stderr)
+            return 0
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if baseline.get("seed") != args.seed:
+        print("baseline was recorded with a different seed", file=sys.stderr)
+        return 2
+    recheck(results, baseline["results"], args.threshold, args.repeat, args.seed, args.recheck)
+    # The rechecked best times replace the first round's.
+    _write_json(args.output, report)
+    regressions = compare(results, baseline["results"], args.threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""Process expense files offline, without the HTTP server.
+
+    python cli.py expenses.csv --out results/
+    python cli.py export.ndjson --rules rules.json --age 29 --wage 50000 --workers 8
+
+Runs parse -> validate -> q/p/k -> returns over a process pool and writes
+``valid.ndjson``, ``invalid.ndjson``, ``returns.json`` and ``summary.json``
+to ``--out``.  ``--rules`` is a JSON file with the ``q``, ``p`` and ``k``
+lists of the API.  Progress goes to stderr; the summary (rows per second
+included) is printed as JSON on stdout.
+"""
+import argparse
+import json
+import sys
+
+from app.services.batch_service import run_batch
+from app.utils.constants import (
+    BATCH_CHUNK_BYTES,
+    DEFAULT_AGE,
+    DEFAULT_INFLATION,
+    PROCESS_POOL_WORKERS,
+)
+from app.utils.mmap_reader import FORMATS
+from app.utils.serialization import dumps
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="expense file (.csv, .ndjson or .jsonl)")
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the extension")
+    parser.add_argument("--rules", help="JSON file with q, p and k periods")
+    parser.add_argument("--age", type=int, default=DEFAULT_AGE)
+    parser.add_argument("--wage", type=float, default=0)
+    parser.add_argument("--inflation", type=float, default=DEFAULT_INFLATION)
+    parser.add_argument(
+        "--instruments", default="nps,index",
+        help="comma-separated instruments for returns.json",
+    )
+    parser.add_argument("--workers", type=int, default=PROCESS_POOL_WORKERS)
+    parser.add_argument(
+        "--chunk-bytes", type=int, default=BATCH_CHUNK_BYTES,
+        help="input bytes per worker task",
+    )
+    parser.add_argument(
+        "--k-matches", action="store_true",
+        help="add kIndices to every valid transaction",
+    )
+    parser.add_argument("--quiet", action="store_true", help="no progress output")
+    args = parser.parse_args(argv)
+
+    rules = None
+    try:
+        if args.rules:
+            with open(args.rules) as f:
+                rules = json.load(f)
+        summary = run_batch(
+            args.input, args.out, fmt=args.format, rules=rules,
+            age=args.age, wage=args.wage, inflation=args.inflation,
+            instruments=[i for i in args.instruments.split(",") if i],
+            workers=args.workers, chunk_bytes=args.chunk_bytes,
+            include_k_matches=args.k_matches,
+            progress=None if args.quiet else sys.stderr,
+        )
+    except (OSError, ValueError, KeyError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
+    sys.stdout.write(dumps(summary).decode() + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
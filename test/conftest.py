@@ -1,6 +1,7 @@
 import pytest
 
 from app import create_app
+from app.utils import response_cache
 
 
 @pytest.fixture
@@ -13,3 +14,10 @@ def app():
 @pytest.fixture
 def client(app):
     return app.test_client()
+
+
+@pytest.fixture(autouse=True)
+def fresh_response_cache(tmp_path, monkeypatch):
+    cache = response_cache.ResponseCache(path=str(tmp_path / "responses.sqlite3"))
+    monkeypatch.setattr(response_cache, "response_cache", cache)
+    return cache
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from app.utils.admission import TokenBuckets
+from bench import generators
+
+API = "/blackrock/challenge/v1"
+
+
+@pytest.fixture
+def admission(app):
+    return app.extensions["admission"]
+
+
+def _filter_body(n):
+    q, p, k = generators.periods(n, seed=1)
+    return {"transactions": generators.transactions(n, seed=1), "q": q, "p": p, "k": k}
+
+
+class TestLimits:
+    def test_body_size(self, client, admission):
+        admission.max_body_bytes = 1000
+        resp = client.post(f"{API}/transactions:filter", json=_filter_body(100))
+        assert resp.status_code == 413
+        assert resp.get_json()["error"].startswith("Body of ")
+
+    @pytest.mark.parametrize("route, body, message", [
+        ("transactions:filter", _filter_body(50), "50 transactions"),
+        ("transactions:parse", {"expenses": generators.expenses(50)}, "50 transactions"),
+        ("returns:nps", {"transactions": [], "k": [{}] * 11}, "11 k periods"),
+        ("returns:batch", {"portfolios": [_filter_body(30), _filter_body(30)]}, "60 transactions"),
+    ])
+    def test_counts(self, client, admission, route, body, message):
+        admission.max_transactions = 40
+        admission.max_periods = 10
+        resp = client.post(f"{API}/{route}", json=body)
+        assert resp.status_code == 413
+        assert resp.get_json()["error"].startswith(message)
+
+    def test_within_limits(self, client, admission):
+        admission.max_transactions = 100
+        assert client.post(f"{API}/transactions:filter", json=_filter_body(100)).status_code == 200
+
+
+class TestRateLimit:
+    def test_token_bucket_refills(self):
+        buckets = TokenBuckets(rate=2, burst=2, max_clients=2)
+        assert buckets.take("a", now=0.0) == buckets.take("a", now=0.0) == 0.0
+        assert buckets.take("a", now=0.0) == 0.5
+        assert buckets.take("a", now=0.5) == 0.0
+        buckets.take("b", now=0.5)
+        buckets.take("c", now=0.5)
+        assert list(buckets._buckets) == ["b", "c"]
+
+    def test_per_client(self, client, admission):
+        admission.buckets = TokenBuckets(rate=0.1, burst=2)
+        admission.client_header = "X-Client-Id"
+        get = lambda who: client.get(f"{API}/performance", headers={"X-Client-Id": who})
+        assert [get("a").status_code for _ in range(3)] == [200, 200, 429]
+        resp = get("a")
+        assert resp.headers["Retry-After"] == "10"
+        assert get("b").status_code == 200
+
+
+class TestBackpressure:
+    def test_heavy_requests_wait_their_turn(self, client, admission):
+        admission.small_bytes = 10_000
+        admission.limiter.capacity = 100_000
+        heavy = json.dumps(_filter_body(300)).encode()
+        small = json.dumps(_filter_body(20)).encode()
+        assert len(heavy) > admission.small_bytes > len(small)
+        post = lambda body: client.post(
+            f"{API}/transactions:filter", data=body, content_type="application/json",
+        )
+
+        assert admission.limiter.try_acquire(admission.limiter.capacity)
+        resp = post(heavy)
+        assert resp.status_code == 429
+        assert resp.headers["Retry-After"] == "1"
+        assert post(small).status_code == 200
+
+        admission.limiter.release(admission.limiter.capacity)
+        assert post(heavy).status_code == 200
+        assert admission.limiter.inflight == 0
@@ -0,0 +1,136 @@
+import csv
+import json
+import math
+
+import numpy as np
+import pytest
+
+import cli
+from app.services.batch_service import ChunkResult, _SeenDates, run_batch
+from app.services.investment_service import INSTRUMENT_RATES, calculate_returns
+from app.services.period_rule_service import filter_transactions
+from app.services.transaction_service import parse_expenses, validate_transactions
+from app.utils import mmap_reader
+from app.utils.serialization import dumps, loads
+from bench import generators
+
+
+@pytest.fixture
+def workload(tmp_path):
+    expenses = generators.expenses(3000, seed=2)
+    expenses[5]["timestamp"] = expenses[2500]["timestamp"]  # repeated across chunks
+    expenses[7]["amount"] = -5
+    csv_path = tmp_path / "expenses.csv"
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "amount"])
+        for e in expenses:
+            writer.writerow([e["timestamp"], e["amount"]])
+    ndjson_path = tmp_path / "expenses.ndjson"
+    ndjson_path.write_bytes(b"".join(dumps(e) + b"\n" for e in expenses))
+    q, p, k = generators.periods(3000, seed=2)
+    rules = {"q": q, "p": p, "k": k}
+    return expenses, rules, str(csv_path), str(ndjson_path)
+
+
+def _read(out, name):
+    return (out / name).read_bytes()
+
+
+class TestReader:
+    def test_split_is_line_aligned(self, workload):
+        _, _, csv_path, _ = workload
+        columns, start = mmap_reader.csv_header(csv_path)
+        ranges = mmap_reader.split(csv_path, 1000, start)
+        data = open(csv_path, "rb").read()
+        assert ranges[0][0] == start and ranges[-1][1] == len(data)
+        assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+        assert all(data[end - 1:end] == b"\n" for _, end in ranges)
+        records = [
+            r for s, e in ranges
+            for r in mmap_reader.read_records(csv_path, "csv", s, e, columns)
+        ]
+        assert len(records) == 3000
+        assert type(records[0]["amount"]) in (int, float)
+
+
+class TestRunBatch:
+    def test_matches_endpoints(self, workload, tmp_path):
+        expenses, rules, csv_path, _ = workload
+        out = tmp_path / "out"
+        summary = run_batch(csv_path, str(out), rules=rules, wage=50_000, chunk_bytes=4096)
+        assert summary["rows"] == 3000 and summary["chunks"] > 10
+        assert summary["valid"] + summary["invalid"] == 3000
+
+        checked = validate_transactions(0, parse_expenses(expenses))
+        expected = {
+            name: calculate_returns(
+                checked["valid"], rules["q"], rules["p"], rules["k"],
+                30, 50_000.0, 0.055, rate, is_nps=name == "nps",
+            )
+            for name, rate in INSTRUMENT_RATES.items()
+        }
+        assert _read(out, "returns.json") == dumps(expected)
+        filtered = filter_transactions(checked["valid"], rules["q"], rules["p"], rules["k"])
+        assert _read(out, "valid.ndjson") == b"".join(
+            dumps(t) + b"\n" for t in filtered["valid"]
+        )
+        invalid = [loads(line) for line in _read(out, "invalid.ndjson").splitlines()]
+        assert invalid[0]["message"].startswith("Amount -5")
+        assert any(i["message"].startswith("Duplicate date") for i in invalid)
+
+    def test_output_independent_of_chunking_and_workers(self, workload, tmp_path):
+        _, rules, csv_path, ndjson_path = workload
+        run_batch(csv_path, str(tmp_path / "a"), rules=rules, chunk_bytes=2048)
+        run_batch(ndjson_path, str(tmp_path / "b"), rules=rules, chunk_bytes=50_000, workers=2)
+        for name in ("valid.ndjson", "invalid.ndjson", "returns.json"):
+            assert _read(tmp_path / "a", name) == _read(tmp_path / "b", name)
+
+    def test_unparseable_rows_are_reported(self, tmp_path):
+        path = tmp_path / "bad.ndjson"
+        path.write_bytes(
+            b'{"timestamp": "2023-01-01 10:00:00", "amount": 250}\n'
+            b'{"timestamp": "2023-01-01 11:00:00", "amount": "x"}\n'
+        )
+        summary = run_batch(str(path), str(tmp_path / "out"))
+        assert (summary["valid"], summary["invalid"]) == (1, 1)
+        entry = loads(_read(tmp_path / "out", "invalid.ndjson"))
+        assert entry["message"].startswith("Unparseable expense")
+
+
+class TestSeenDates:
+    def test_many_chunks(self):
+        rng = np.random.default_rng(4)
+        seen, expected = _SeenDates(), set()
+        chunks, size = 512, 100
+        for _ in range(chunks):
+            epochs = rng.integers(0, 200_000, size=size)
+            result = ChunkResult(*[None] * 5, epochs, np.ones(size, dtype=bool), [], *[None] * 4)
+            assert seen.repeats(result) == [
+                i for i, e in enumerate(epochs.tolist()) if e in expected
+            ]
+            seen.add(result)
+            expected.update(epochs.tolist())
+        # Each epoch is copied O(log chunks) times, not once per later chunk.
+        assert seen.copied <= 3 * chunks * size * math.log2(chunks)
+        assert len(seen.runs) <= math.log2(chunks) + 1
+
+
+class TestCli:
+    def test_summary_and_errors(self, workload, tmp_path, capsys):
+        _, rules, csv_path, _ = workload
+        rules_path = tmp_path / "rules.json"
+        rules_path.write_text(json.dumps(rules))
+        out = tmp_path / "out"
+        assert cli.main([
+            csv_path, "--out", str(out), "--rules", str(rules_path),
+            "--workers", "1", "--instruments", "nps", "--quiet",
+        ]) == 0
+        summary = json.loads(capsys.readouterr().out)
+        assert summary["rows"] == 3000 and summary["rowsPerSecond"] > 0
+        assert list(json.loads(_read(out, "returns.json"))) == ["nps"]
+        assert cli.main([str(tmp_path / "x.txt"), "--out", str(out), "--quiet"]) == 1
+        rules_path.write_text("{not json")
+        for rules_arg in (str(rules_path), str(tmp_path / "missing.json")):
+            assert cli.main([csv_path, "--out", str(out), "--rules", rules_arg, "--quiet"]) == 1
+            assert capsys.readouterr().err.startswith("error: ")
@@ -0,0 +1,99 @@
+import json
+
+from bench import generators, load, run
+
+
+class TestGenerators:
+    def test_seeded_and_unique(self):
+        assert generators.expenses(500, seed=3) == generators.expenses(500, seed=3)
+        assert generators.expenses(500, seed=3) != generators.expenses(500, seed=4)
+        dates = [e["timestamp"] for e in generators.expenses(500)]
+        assert len(set(dates)) == 500
+
+    def test_periods_scale_with_size(self):
+        q, p, k = generators.periods(10_000)
+        assert len(q) == len(p) == len(k) == 100
+        assert all(kp["start"] <= kp["end"] for kp in k)
+
+
+class TestRunner:
+    def test_compare_flags_regressions(self):
+        baseline = {"a[1000]": 0.010, "b[1000]": 0.010, "c[1000]": 0.0001}
+        results = {"a[1000]": 0.020, "b[1000]": 0.011, "c[1000]": 0.0005, "d[1000]": 1.0}
+        regressions = run.compare(results, baseline, threshold=0.25)
+        assert len(regressions) == 1
+        assert regressions[0].startswith("a[1000]")
+
+    def test_recheck_keeps_best_time(self):
+        # A noisy first round; only the case that looks slower is timed again.
+        baseline = {"parse_expenses[200]": 1.0, "calculate_returns[200]": 100.0}
+        results = {"parse_expenses[200]": 60.0, "calculate_returns[200]": 60.0}
+        run.recheck(results, baseline, threshold=0.25, repeat=1, seed=0, rounds=1)
+        assert results["parse_expenses[200]"] < 1.0
+        assert results["calculate_returns[200]"] == 60.0
+        assert run.regressed(results, baseline, threshold=0.25) == []
+
+    def test_baseline_round_trip(self, tmp_path):
+        baseline = tmp_path / "baseline.json"
+        output = tmp_path / "results.json"
+        args = [
+            "--sizes", "200", "--cases", "parse_expenses,calculate_returns",
+            "--repeat", "1", "--baseline", str(baseline), "--output", str(output),
+        ]
+        assert run.main(args + ["--update-baseline"]) == 0
+        recorded = json.loads(baseline.read_text())["results"]
+        assert set(recorded) == {"parse_expenses[200]", "calculate_returns[200]"}
+        assert json.loads(output.read_text())["results"].keys() == recorded.keys()
+
+        baseline.write_text(json.dumps({
+            "seed": 0, "results": {case: 60.0 for case in recorded},
+        }))
+        assert run.main(args) == 0
+        assert run.main(args + ["--seed", "1"]) == 2
+
+    def test_against_revision(self, tmp_path):
+        output = tmp_path / "results.json"
+        assert run.main([
+            "--sizes", "200", "--cases", "calculate_returns", "--repeat", "1",
+            "--against", "HEAD", "--threshold", "100", "--output", str(output),
+        ]) == 0
+        assert set(json.loads(output.read_text())["results"]) == {"calculate_returns[200]"}
+
+    def test_memory_report(self, tmp_path):
+        output = tmp_path / "results.json"
+        assert run.main([
+            "--sizes", "200", "--cases", "calculate_returns", "--repeat", "1",
+            "--baseline", str(tmp_path / "none.json"), "--output", str(output),
+            "--memory",
+        ]) == 0
+        report = json.loads(output.read_text())
+        assert report["bytesPerTransaction"]["calculate_returns[200]"] > 0
+        assert report["storeBytesPerTransaction"] == {"200": 17.0}
+
+
+class TestLoad:
+    def test_summary_and_rss_growth(self):
+        records = [("parse", 0.0, 0.5, 200)] + [
+            ("parse", 1.0 + i, 0.01 * (i + 1), 200 if i < 99 else 500) for i in range(100)
+        ]
+        summary = load.summarize(records, started=1.0, duration=10.0)
+        assert summary["parse"]["requests"] == summary["all"]["requests"] == 100
+        assert summary["parse"]["errorRate"] == 0.01
+        assert summary["parse"]["throughput"] == 10.0
+        assert summary["parse"]["latencyMs"]["max"] == 1000.0
+        samples = [(t, (100 + 2 * t) * load.MB) for t in range(10)]
+        growth = load.rss_growth(samples, started=5)
+        assert growth == {"growthMB": 8.0, "slopeMBPerHour": 7200.0}
+
+    def test_in_process_run(self, tmp_path):
+        output = tmp_path / "load.json"
+        args = [
+            "--duration", "1", "--concurrency", "2", "--size", "50", "--distinct", "2",
+            "--interval", "0.2", "--output", str(output),
+        ]
+        assert load.main(args) == 0
+        run_report = json.loads(output.read_text())["runs"][0]
+        assert run_report["endpoints"]["all"]["requests"] > 0
+        assert run_report["endpoints"]["all"]["errors"] == 0
+        assert run_report["timeline"]
+        assert load.main(args + ["--max-rss-growth", "-1000"]) == 2
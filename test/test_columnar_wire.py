@@ -0,0 +1,123 @@
+import pytest
+
+from app.services.transaction_service import parse_expenses
+from app.utils import columnar_wire
+from app.utils.columnar_table import ColumnarTable
+from app.utils.columnar_wire import COLUMNAR_MIMETYPE
+from app.utils.serialization import dumps
+from bench import generators
+
+API = "/blackrock/challenge/v1"
+
+
+def _post(client, route, body, accept="application/json"):
+    return client.post(
+        f"{API}/{route}",
+        data=columnar_wire.encode(body),
+        headers={"Content-Type": COLUMNAR_MIMETYPE, "Accept": accept},
+    )
+
+
+def _as_json(resp):
+    if resp.mimetype == COLUMNAR_MIMETYPE:
+        return dumps(columnar_wire.decode(resp.data))
+    return resp.data
+
+
+@pytest.fixture
+def workload():
+    transactions = generators.transactions(2000, seed=4)
+    transactions[1]["remanent"] = float(transactions[1]["remanent"])
+    transactions[2]["remanent"] += 1
+    transactions[3]["date"] = transactions[4]["date"]
+    q, p, k = generators.periods(2000, seed=4)
+    q[0]["fixed"] = 7
+    return {"transactions": transactions, "q": q, "p": p, "k": k, "wage": 50_000}
+
+
+class TestCodec:
+    def test_round_trip_keeps_json_types(self):
+        body = {
+            "rows": [
+                {"date": "2023-01-01 10:00:00", "n": 5, "x": 5.0, "s": "a", "l": [1, 2]},
+                {"date": "2023-01-02 10:00:00", "n": -7, "x": 0.1, "s": "b", "l": []},
+                {"date": "2023-01-03 10:00:00", "n": 2 ** 40, "x": 7, "s": "a", "l": [3]},
+            ],
+            "neg": [{"v": -0.0}, {"v": 1e300}],
+            "odd": [{"date": "2023-1-1 10:00:00"}],
+            "mixed": [{"a": 1}, {"b": 2}],
+            "wage": 50_000,
+        }
+        decoded = columnar_wire.decode(columnar_wire.encode(body))
+        assert isinstance(decoded["rows"], ColumnarTable)
+        assert isinstance(decoded["mixed"], list)
+        assert dumps(decoded) == dumps(body)
+        assert decoded["rows"][0] == body["rows"][0]
+        assert str(decoded["neg"][0]["v"]) == "-0.0"
+
+    def test_smaller_than_json(self):
+        body = {"transactions": generators.transactions(5000, seed=1)}
+        assert len(columnar_wire.encode(body)) * 4 < len(dumps(body))
+
+    @pytest.mark.parametrize("data", [
+        b"", b"JSON{}", columnar_wire.encode({"t": [{"a": 1}, {"a": 2}]})[:-8],
+    ])
+    def test_malformed(self, data):
+        with pytest.raises(ValueError):
+            columnar_wire.decode(data)
+
+    def test_parse_keeps_columns(self):
+        expenses = generators.expenses(500, seed=2)
+        table = columnar_wire.decode(columnar_wire.encode({"e": expenses}))["e"]
+        parsed = parse_expenses(table)
+        assert isinstance(parsed, ColumnarTable)
+        assert dumps(parsed) == dumps(parse_expenses(expenses))
+
+
+class TestEndpoints:
+    @pytest.mark.parametrize("route", [
+        "transactions:validator", "transactions:filter", "returns:nps", "returns:index",
+    ])
+    def test_same_result_as_json(self, client, workload, route):
+        expected = client.post(f"{API}/{route}", json=workload)
+        assert expected.status_code == 200
+        as_json = _post(client, route, workload)
+        assert as_json.mimetype == "application/json"
+        assert as_json.data == expected.data
+        columnar = _post(client, route, workload, accept=COLUMNAR_MIMETYPE)
+        assert columnar.mimetype == COLUMNAR_MIMETYPE
+        assert _as_json(columnar) == expected.data
+
+    def test_filter_with_k_matches(self, client, workload):
+        body = dict(workload, includeKMatches=True)
+        expected = client.post(f"{API}/transactions:filter", json=body)
+        resp = _post(client, "transactions:filter", body, accept=COLUMNAR_MIMETYPE)
+        valid = columnar_wire.decode(resp.data)["valid"]
+        assert "kIndices" in valid.columns
+        assert _as_json(resp) == expected.data
+
+    def test_json_request_columnar_response(self, client):
+        expenses = generators.expenses(300, seed=3)
+        expected = client.post(f"{API}/transactions:parse", json={"expenses": expenses})
+        resp = client.post(
+            f"{API}/transactions:parse", json={"expenses": expenses},
+            headers={"Accept": COLUMNAR_MIMETYPE},
+        )
+        assert resp.mimetype == COLUMNAR_MIMETYPE
+        assert len(resp.data) < len(expected.data)
+        assert _as_json(resp) == expected.data
+
+    def test_bad_body_is_400(self, client):
+        resp = client.post(
+            f"{API}/transactions:filter", data=b"BLKC-not-really",
+            headers={"Content-Type": COLUMNAR_MIMETYPE},
+        )
+        assert resp.status_code == 400
+
+    def test_cache_keeps_formats_apart(self, client, workload):
+        json_resp = _post(client, "transactions:filter", workload)
+        columnar = _post(client, "transactions:filter", workload, accept=COLUMNAR_MIMETYPE)
+        again = _post(client, "transactions:filter", workload, accept=COLUMNAR_MIMETYPE)
+        assert json_resp.headers["X-Cache"] == columnar.headers["X-Cache"] == "MISS"
+        assert again.headers["X-Cache"] == "HIT"
+        assert again.data == columnar.data and again.mimetype == COLUMNAR_MIMETYPE
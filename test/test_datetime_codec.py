@@ -0,0 +1,45 @@
+
+from datetime import datetime
+
+import pytest
+
+from app.utils.datetime_codec import from_epoch, to_epoch, to_epochs, try_epoch
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _reference(s):
+    return int((datetime.strptime(s, "%Y-%m-%d %H:%M:%S") - EPOCH).total_seconds())
+
+
+class TestDatetimeCodec:
+    DATES = [
+        "2023-10-12 20:15:00",
+        "1970-01-01 00:00:00",
+        "1969-12-31 23:59:59",
+        "2024-02-29 12:00:00",
+        "2000-02-29 00:00:00",
+        "0001-01-01 00:00:00",
+        "9999-12-31 23:59:59",
+        "2023-1-5 1:2:3",
+    ]
+
+    def test_scalar_matches_strptime(self):
+        for s in self.DATES:
+            assert to_epoch(s) == _reference(s)
+
+    def test_batch_matches_scalar(self):
+        assert to_epochs(self.DATES).tolist() == [to_epoch(s) for s in self.DATES]
+
+    def test_invalid_dates(self):
+        for s in ["2023-02-29 10:00:00", "2023-13-01 00:00:00", "2023-01-01 24:00:00", "bad"]:
+            with pytest.raises(ValueError):
+                to_epoch(s)
+            assert try_epoch(s) is None
+        assert try_epoch(None) is None
+        with pytest.raises(ValueError):
+            to_epochs(["2023-10-12 20:15:00", "2023-02-30 10:00:00"])
+
+    def test_round_trip(self):
+        for s in self.DATES[:-1]:
+            assert from_epoch(to_epoch(s)) == s
@@ -0,0 +1,94 @@
+
+import json
+
+import pytest
+
+from app.services import ledger_service
+from app.services.investment_service import calculate_nps_returns
+from app.services.ledger_service import LedgerStore
+
+from test.test_period_rules import K, P, Q, TRANSACTIONS
+
+API = "/blackrock/challenge/v1"
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    s = LedgerStore(path=str(tmp_path / "ledger.sqlite3"))
+    monkeypatch.setattr(ledger_service, "store", s)
+    return s
+
+
+def _sorted_by_date(txns):
+    return sorted(txns, key=lambda t: t["date"])
+
+
+class TestLedgerStore:
+    def test_incremental_matches_full_recompute(self, store):
+        from app.services.pipeline_service import compile_periods
+
+        compiled = compile_periods(Q, P)
+        txns = _sorted_by_date(TRANSACTIONS)
+        store.append("u1", txns[:2], compiled)
+        store.append("u1", txns[2:], compiled)
+        result = store.returns("u1", K, 29, 50_000, 0.055, 0.0711, is_nps=True)
+        assert result == calculate_nps_returns(TRANSACTIONS, Q, P, K, 29, 50_000, 0.055)
+
+    def test_back_dated_and_duplicate_entries(self, store):
+        txns = _sorted_by_date(TRANSACTIONS)
+        store.append("u1", txns[2:])
+        result = store.append("u1", txns[:3])
+        assert result["appended"] == 2
+        assert "Duplicate date" in result["rejected"][0]["message"]
+        assert result["size"] == 4
+        savings = store.returns("u1", K, 29, 0, 0.055, 0.0711)["savingsByDates"]
+        assert [s["amount"] for s in savings] == [130, 175]
+
+    def test_other_worker_catches_up(self, store):
+        store.append("u1", TRANSACTIONS[:1])
+        other = LedgerStore(path=store.path)
+        other.returns("u1", K, 29, 0, 0.055, 0.0711)
+        store.append("u1", TRANSACTIONS[1:2])
+        savings = other.returns("u1", K, 29, 0, 0.055, 0.0711)["savingsByDates"]
+        assert savings[1]["amount"] == 75
+
+    def test_remanents_are_whole_paise(self, store):
+        # The validator accepts 50.004 for 50; the ledger stores 5000 paise.
+        txns = [{**t, "remanent": t["remanent"] + 0.004} for t in TRANSACTIONS]
+        assert store.append("u1", txns)["appended"] == 4
+        ledger = store.returns("u1", K[1:], 29, 0, 0.055, 0.0711)["savingsByDates"]
+        direct = calculate_nps_returns(txns, [], [], K[1:], 29, 0, 0.055)
+        assert ledger[0]["amount"] == 175
+        assert direct["savingsByDates"][0]["amount"] == 175.02
+
+    def test_users_are_isolated(self, store):
+        store.append("u1", TRANSACTIONS)
+        assert store.returns("u2", K, 29, 0, 0.055, 0.0711)["savingsByDates"][1]["amount"] == 0
+
+
+class TestLedgerEndpoints:
+    def test_append_and_query(self, client, store):
+        resp = client.post(
+            API + "/ledger/alice/transactions",
+            data=json.dumps({"q": Q, "p": P, "transactions": TRANSACTIONS}),
+            content_type="application/json",
+        )
+        assert resp.get_json()["appended"] == 4
+        resp = client.post(
+            API + "/ledger/alice/returns:index",
+            data=json.dumps({"age": 29, "wage": 50000, "k": K}),
+            content_type="application/json",
+        )
+        assert resp.get_json()["savingsByDates"][1]["amount"] == 145
+
+    @pytest.mark.parametrize("k", [
+        [{"start": "bad", "end": "bad"}], [{"start": "2023-01-01 00:00:00"}], ["x"], {"a": 1},
+    ])
+    def test_bad_k_periods(self, client, store, k):
+        resp = client.post(
+            API + "/ledger/alice/returns:nps",
+            data=json.dumps({"k": k}),
+            content_type="application/json",
+        )
+        assert resp.status_code == 400
+        assert resp.get_json()["error"].startswith("k")
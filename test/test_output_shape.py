@@ -0,0 +1,186 @@
+import pytest
+
+from app.services.output_shape import ERROR_CODES, FULL, parse_output_shape
+from app.services.period_rule_service import filter_transactions
+from app.services.transaction_service import validate_transactions
+from app.utils import columnar_wire
+from app.utils.columnar_wire import COLUMNAR_MIMETYPE
+from app.utils.serialization import dumps, loads
+from bench import generators
+
+API = "/blackrock/challenge/v1"
+
+
+def _transactions(n):
+    transactions = generators.transactions(n, seed=6)
+    transactions[1]["amount"] = -5
+    transactions[4]["date"] = transactions[3]["date"]
+    transactions[7]["ceiling"] += 100
+    transactions[7]["remanent"] += 1
+    transactions[9]["date"] = "2023-13-01 00:00:00"
+    return transactions
+
+
+def _table(transactions):
+    return columnar_wire.decode(columnar_wire.encode({"t": transactions}))["t"]
+
+
+def _shape(**options):
+    return parse_output_shape(options)
+
+
+def _plain(result):
+    return loads(dumps(result))
+
+
+@pytest.fixture(params=[40, 600, "table"])
+def transactions(request):
+    if request.param == "table":
+        return _table(_transactions(600))
+    return _transactions(request.param)
+
+
+class TestValidator:
+    def test_shapes_match_full_output(self, transactions):
+        full = _plain(validate_transactions(0, transactions))
+        counts = {"valid": len(full["valid"]), "invalid": len(full["invalid"])}
+
+        summary = _plain(validate_transactions(0, transactions, shape=_shape(output="summary")))
+        assert summary == {"counts": counts, "truncated": False}
+
+        invalid = _plain(validate_transactions(0, transactions, shape=_shape(output="invalid")))
+        assert invalid == {"counts": counts, "truncated": False, "invalid": full["invalid"]}
+
+        fields = ["date", "remanent"]
+        projected = _plain(validate_transactions(0, transactions, shape=_shape(fields=fields)))
+        assert projected["valid"] == [
+            {f: t[f] for f in fields} for t in full["valid"]
+        ]
+        assert projected["invalid"] == [
+            {"date": t["date"], "remanent": t["remanent"], "message": t["message"]}
+            for t in full["invalid"]
+        ]
+
+    def test_error_codes(self, transactions):
+        full = _plain(validate_transactions(0, transactions))
+        coded = _plain(validate_transactions(
+            0, transactions, shape=_shape(errorFormat="codes", output="invalid"),
+        ))
+        assert [t["date"] for t in coded["invalid"]] == [t["date"] for t in full["invalid"]]
+        for entry, expected in zip(coded["invalid"], full["invalid"]):
+            assert "message" not in entry
+            assert set(entry["errors"]) <= set(ERROR_CODES)
+            assert len(entry["errors"]) == len(expected["message"].split("; "))
+        assert coded["invalid"][0]["errors"] == ["AMOUNT_OUT_OF_RANGE"]
+        assert coded["invalid"][1]["errors"] == ["DUPLICATE_DATE"]
+        assert coded["invalid"][2]["errors"] == ["CEILING_MISMATCH", "REMANENT_MISMATCH"]
+
+    def test_max_errors(self, transactions):
+        full = _plain(validate_transactions(0, transactions))
+        result = _plain(validate_transactions(0, transactions, shape=_shape(maxErrors=2)))
+        # The second invalid row is the duplicate at position 4.
+        assert result["truncated"] is True
+        assert result["counts"] == {"valid": 3, "invalid": 2}
+        assert result["invalid"] == full["invalid"][:2]
+        assert result["valid"] == full["valid"][:3]
+        assert _plain(validate_transactions(
+            0, transactions, shape=_shape(maxErrors=len(full["invalid"]) + 1),
+        ))["truncated"] is False
+
+    def test_max_errors_stops_at_its_block(self, transactions):
+        expected = _plain(validate_transactions(0, transactions, shape=_shape(maxErrors=2)))
+        seen_dates = set()
+        result = validate_transactions(
+            0, transactions, seen_dates=seen_dates, shape=_shape(maxErrors=2), block_rows=3,
+        )
+        assert _plain(result) == expected
+        # Row 4 holds the second error, so only rows 0-5 were checked.
+        assert len(seen_dates) == 5
+
+
+class TestFilter:
+    @pytest.fixture(params=[40, 600, "table"])
+    def transactions(self, request):
+        if request.param == "table":
+            return _table(generators.transactions(600, seed=6))
+        return generators.transactions(request.param, seed=6)
+
+    @pytest.fixture
+    def periods(self):
+        q, p, k = generators.periods(4000, seed=6)
+        return q, p, k[:3]
+
+    def test_shapes_match_full_output(self, transactions, periods):
+        q, p, k = periods
+        full = _plain(filter_transactions(transactions, q, p, k, include_k_matches=True))
+        assert full["invalid"]
+
+        fields = ["date", "remanent"]
+        shape = _shape(output="all", fields=fields, errorFormat="codes")
+        result = _plain(filter_transactions(
+            transactions, q, p, k, include_k_matches=True, shape=shape,
+        ))
+        assert result["counts"] == {"valid": len(full["valid"]), "invalid": len(full["invalid"])}
+        assert result["valid"] == [
+            {"date": t["date"], "remanent": t["remanent"], "kIndices": t["kIndices"]}
+            for t in full["valid"]
+        ]
+        assert result["invalid"] == [
+            {"date": t["date"], "remanent": t["remanent"], "errors": ["OUTSIDE_K"]}
+            for t in full["invalid"]
+        ]
+
+        first = _plain(filter_transactions(
+            transactions, q, p, k, shape=_shape(output="invalid", maxErrors=1),
+        ))
+        assert first["invalid"] == full["invalid"][:1]
+        assert first["truncated"] is True
+
+    def test_max_errors_stops_at_its_block(self, periods):
+        q, p, k = periods
+        transactions = generators.transactions(600, seed=6)
+        expected = _plain(filter_transactions(
+            transactions, q, p, k, shape=_shape(output="invalid", maxErrors=1),
+        ))
+        # A bad date past the first block is never parsed.
+        transactions[-1]["date"] = "2023-13-01 00:00:00"
+        with pytest.raises(ValueError):
+            filter_transactions(transactions, q, p, k, shape=_shape(output="summary"))
+        assert _plain(filter_transactions(
+            transactions, q, p, k, shape=_shape(output="invalid", maxErrors=1), block_rows=64,
+        )) == expected
+
+    def test_default_shape_is_unchanged(self, transactions, periods):
+        q, p, k = periods
+        assert dumps(filter_transactions(transactions, q, p, k, shape=FULL)) == dumps(
+            filter_transactions(transactions, q, p, k)
+        )
+
+
+class TestEndpoints:
+    @pytest.mark.parametrize("route", ["transactions:validator", "transactions:filter"])
+    def test_json_and_columnar_agree(self, client, route):
+        transactions = _transactions(300)
+        if route == "transactions:filter":
+            transactions = generators.transactions(300, seed=6)
+        body = {
+            "transactions": transactions, "k": generators.periods(4000)[2][:3],
+            "output": "invalid", "fields": ["date"], "maxErrors": 3,
+        }
+        resp = client.post(f"{API}/{route}", json=body)
+        assert resp.status_code == 200
+        data = resp.get_json()
+        assert len(data["invalid"]) == data["counts"]["invalid"] == 3
+        assert "valid" not in data
+        columnar = client.post(
+            f"{API}/{route}", data=columnar_wire.encode(body),
+            headers={"Content-Type": COLUMNAR_MIMETYPE},
+        )
+        assert columnar.data == resp.data
+
+    @pytest.mark.parametrize("options", [
+        {"output": "valid"}, {"fields": "date"}, {"errorFormat": "text"}, {"maxErrors": 0},
+    ])
+    def test_bad_options(self, client, options):
+        resp = client.post(f"{API}/transactions:validator", json={"transactions": [], **options})
+        assert resp.status_code == 400
@@ -1,3 +1,11 @@
+import json
+import os
+
+import pytest
+
+from app.utils import metrics as metrics_module
+from app.utils.metrics import REQUESTS, STAGES, Metrics, quantile
+
 
 class TestPerformanceEndpoint:
     def test_performance_response(self, client):
@@ -24,3 +32,87 @@ class TestPerformanceEndpoint:
         data = resp.get_json()
         assert isinstance(data["threads"], int)
         assert data["threads"] > 0
+
+
+@pytest.fixture
+def metrics(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics_module.metrics, "directory", str(tmp_path))
+    metrics_module.metrics.reset()
+    return metrics_module.metrics
+
+
+class TestLatencyMetrics:
+    def test_quantiles_from_buckets(self, tmp_path):
+        m = Metrics(directory=str(tmp_path))
+        for _ in range(99):
+            m.observe(STAGES, "qp_sweep", 0.0007)
+        m.observe(STAGES, "qp_sweep", 0.2)
+        hist = m.snapshot()[STAGES]["qp_sweep"]
+        assert hist["count"] == 100
+        assert 0.0005 < quantile(hist, 0.5) <= 0.001
+        assert quantile(hist, 0.99) <= 0.001
+        assert quantile(hist, 1.0) == pytest.approx(0.2)
+
+    def test_merges_live_workers_and_drops_dead(self, tmp_path):
+        m = Metrics(directory=str(tmp_path))
+        m.observe(STAGES, "tax", 0.001)
+        other = {REQUESTS: {}, STAGES: {"tax": {
+            "buckets": [0, 0, 0, 2] + [0] * 13, "count": 2, "sum": 0.002, "max": 0.001,
+        }}}
+        # The parent process stands in for a second gunicorn worker.
+        (tmp_path / f"{os.getppid()}.json").write_text(json.dumps(other))
+        (tmp_path / "999999999.json").write_text(json.dumps(other))
+        merged, processes = m.collect()
+        assert processes == 2
+        assert merged[STAGES]["tax"]["count"] == 3
+        assert not (tmp_path / "999999999.json").exists()
+
+    def test_stage_timer(self, tmp_path):
+        m = Metrics(directory=str(tmp_path))
+        with m.time_stage("projection"):
+            pass
+        assert m.snapshot()[STAGES]["projection"]["count"] == 1
+
+    def test_requests_and_stages_reported(self, client, metrics):
+        client.post(
+            "/blackrock/challenge/v1/returns:nps",
+            json={
+                "age": 29, "wage": 50000, "inflation": 0.055,
+                "q": [], "p": [],
+                "k": [{"start": "2023-01-01 00:00:00", "end": "2023-12-31 23:59:59"}],
+                "transactions": [{
+                    "date": "2023-10-12 20:15:00", "amount": 250,
+                    "ceiling": 300, "remanent": 50,
+                }],
+            },
+        )
+        latency = client.get("/blackrock/challenge/v1/performance").get_json()["latency"]
+        assert latency["processes"] >= 1
+        route = latency["requests"]["POST /blackrock/challenge/v1/returns:nps"]
+        assert route["count"] == 1
+        assert set(route) == {"count", "meanMs", "p50Ms", "p99Ms", "maxMs"}
+        assert {"qp_sweep", "k_grouping", "tax", "projection"} <= set(latency["stages"])
+
+    def test_store_bytes_reported(self, client, metrics):
+        transactions = [
+            {"date": f"2023-10-{day:02d} 20:15:00", "amount": 250, "ceiling": 300, "remanent": 50}
+            for day in range(1, 11)
+        ]
+        client.post("/blackrock/challenge/v1/transactions:filter", json={
+            "q": [], "p": [], "k": [], "transactions": transactions,
+        })
+        store = client.get("/blackrock/challenge/v1/performance").get_json()["transactionStore"]
+        assert store == {"rows": 10, "bytes": 170, "bytesPerTransaction": 17.0}
+
+    def test_prometheus_format(self, client, metrics):
+        client.get("/blackrock/challenge/v1/performance")
+        resp = client.get("/blackrock/challenge/v1/metrics")
+        assert resp.status_code == 200
+        assert resp.mimetype == "text/plain"
+        text = resp.get_data(as_text=True)
+        assert "# TYPE blk_request_duration_seconds histogram" in text
+        assert (
+            'blk_request_duration_seconds_count{method="GET",'
+            'route="/blackrock/challenge/v1/performance"} 1'
+        ) in text
+        assert 'le="+Inf"' in text
@@ -0,0 +1,218 @@
+import pytest
+
+from app.services.period_rule_service import (
+    apply_k_grouping,
+    apply_p_rules,
+    apply_q_rules,
+    filter_transactions,
+)
+from app.services.pipeline_service import compile_periods, k_savings, run_pipeline
+
+TRANSACTIONS = [
+    {"date": "2023-10-12 20:15:00", "amount": 250, "ceiling": 300, "remanent": 50},
+    {"date": "2023-02-28 15:49:00", "amount": 375, "ceiling": 400, "remanent": 25},
+    {"date": "2023-07-01 21:59:00", "amount": 620, "ceiling": 700, "remanent": 80},
+    {"date": "2023-12-17 08:09:00", "amount": 480, "ceiling": 500, "remanent": 20},
+]
+Q = [{"fixed": 0, "start": "2023-07-01 00:00:00", "end": "2023-07-31 23:59:00"}]
+P = [{"extra": 25, "start": "2023-10-01 08:00:00", "end": "2023-12-31 19:59:00"}]
+K = [
+    {"start": "2023-03-01 00:00:00", "end": "2023-11-30 23:59:00"},
+    {"start": "2023-01-01 00:00:00", "end": "2023-12-31 23:59:00"},
+]
+
+
+class TestQRules:
+    def test_latest_start_wins(self):
+        q = [
+            {"fixed": 10, "start": "2023-01-01 00:00:00", "end": "2023-12-31 00:00:00"},
+            {"fixed": 20, "start": "2023-06-01 00:00:00", "end": "2023-12-31 00:00:00"},
+        ]
+        result = apply_q_rules(TRANSACTIONS, q)
+        assert [t["remanent"] for t in result] == [20, 10, 20, 20]
+
+    def test_tie_broken_by_list_position(self):
+        q = [
+            {"fixed": 1, "start": "2023-07-01 00:00:00", "end": "2023-07-31 00:00:00"},
+            {"fixed": 2, "start": "2023-07-01 00:00:00", "end": "2023-08-31 00:00:00"},
+        ]
+        assert apply_q_rules(TRANSACTIONS, q)[2]["remanent"] == 1
+
+    def test_boundaries_inclusive(self):
+        q = [{"fixed": 7, "start": "2023-10-12 20:15:00", "end": "2023-10-12 20:15:00"}]
+        assert apply_q_rules(TRANSACTIONS, q)[0]["remanent"] == 7
+
+    def test_inputs_not_mutated(self):
+        apply_q_rules(TRANSACTIONS, Q)
+        assert TRANSACTIONS[2]["remanent"] == 80
+
+
+class TestPRules:
+    def test_extras_stack(self):
+        p = P + [{"extra": 5, "start": "2023-12-01 00:00:00", "end": "2023-12-31 00:00:00"}]
+        result = apply_p_rules(TRANSACTIONS, p)
+        assert [t["remanent"] for t in result] == [75, 25, 80, 50]
+
+
+class TestKGrouping:
+    def test_challenge_example(self):
+        adjusted = apply_p_rules(apply_q_rules(TRANSACTIONS, Q), P)
+        savings = apply_k_grouping(adjusted, K)
+        assert [s["amount"] for s in savings] == [75, 145]
+
+    def test_fused_pipeline_matches_stages(self):
+        compiled = compile_periods(Q, P, K)
+        result = run_pipeline(TRANSACTIONS, compiled)
+        staged = apply_p_rules(apply_q_rules(TRANSACTIONS, Q), P)
+        assert result.adjusted == staged
+        assert k_savings(compiled, result) == apply_k_grouping(staged, K)
+
+
+class TestFilter:
+    def test_outside_k_is_invalid(self):
+        k = [{"start": "2023-03-01 00:00:00", "end": "2023-11-30 23:59:00"}]
+        result = filter_transactions(TRANSACTIONS, Q, P, k)
+        assert [t["date"] for t in result["valid"]] == [
+            "2023-10-12 20:15:00", "2023-07-01 21:59:00",
+        ]
+        assert len(result["invalid"]) == 2
+        assert result["invalid"][0]["message"] == "Transaction date outside all k periods"
+
+    def test_no_k_keeps_everything(self):
+        result = filter_transactions(TRANSACTIONS, [], [], [])
+        assert result == {"valid": TRANSACTIONS, "invalid": []}
+
+    def test_k_matches(self):
+        result = filter_transactions(TRANSACTIONS, Q, P, K, include_k_matches=True)
+        by_date = {t["date"]: t["kIndices"] for t in result["valid"]}
+        assert by_date["2023-10-12 20:15:00"] == [0, 1]
+        assert by_date["2023-02-28 15:49:00"] == [1]
+        assert "kIndices" not in TRANSACTIONS[0]
+
+
+class TestTransactionStore:
+    def test_remanent_types_survive(self):
+        q = [{"fixed": 3, "start": "2023-07-01 00:00:00", "end": "2023-07-31 23:59:00"}]
+        store = run_pipeline(TRANSACTIONS, compile_periods(q, P)).store
+        rows = store.materialize()
+        assert [type(t["remanent"]) for t in rows] == [float] * 4
+        assert [t["remanent"] for t in rows] == [75.0, 25.0, 3.0, 45.0]
+        assert rows[1] is not TRANSACTIONS[1]
+
+        store = run_pipeline(TRANSACTIONS, compile_periods(q)).store
+        assert [type(t["remanent"]) for t in store.materialize()] == [int] * 4
+        store.set_remanent(0, 2 ** 60 + 1)
+        assert store.value(0) == 2 ** 60 + 1
+
+    def test_rows_built_once_at_boundary(self):
+        store = run_pipeline(TRANSACTIONS, compile_periods(k_periods=K)).store
+        assert store.materialize() is TRANSACTIONS
+        assert store.row(0) is TRANSACTIONS[0]
+        assert store.row(0, tag=1) == {**TRANSACTIONS[0], "tag": 1}
+
+    def test_compact_columns(self):
+        store = run_pipeline(TRANSACTIONS * 250, compile_periods(Q, P, K)).store
+        assert len(store) == 1000
+        assert store.bytes_per_transaction() == 17.0
+
+
+class TestPeriodTimeline:
+    def test_matches_brute_force(self):
+        import random
+
+        from app.utils.datetime_codec import from_epoch, to_epoch
+
+        rng = random.Random(11)
+        base = to_epoch("2023-06-01 00:00:00")
+
+        def span():
+            start = base + rng.randrange(60)
+            return from_epoch(start), from_epoch(start + rng.randrange(20))
+
+        q = [dict(zip(("start", "end"), span()), fixed=rng.randrange(9)) for _ in range(12)]
+        p = [dict(zip(("start", "end"), span()), extra=rng.randrange(9)) for _ in range(12)]
+        txns = [
+            {"date": from_epoch(base + t), "amount": 1, "ceiling": 100, "remanent": 5}
+            for t in range(-5, 90)
+        ]
+        result = filter_transactions(txns, q, p, [])["valid"]
+        for txn, out in zip(txns, result):
+            t = txn["date"]
+            open_q = [(qp["start"], -i, qp["fixed"]) for i, qp in enumerate(q)
+                      if qp["start"] <= t <= qp["end"]]
+            extra = sum(pp["extra"] for pp in p if pp["start"] <= t <= pp["end"])
+            base_remanent = max(open_q)[2] if open_q else 5
+            assert out["remanent"] == base_remanent + extra
+
+    def test_inverted_q_period_stays_open(self):
+        q = [{"fixed": 9, "start": "2023-07-01 00:00:00", "end": "2023-03-01 00:00:00"}]
+        assert [t["remanent"] for t in apply_q_rules(TRANSACTIONS, q)] == [9, 25, 9, 9]
+
+    def test_compiled_once_reused(self):
+        compiled = compile_periods(Q, P)
+        assert len(compiled.timeline) == len(compiled.timeline.breaks) + 1
+        first = run_pipeline(TRANSACTIONS, compiled).adjusted
+        again = run_pipeline(TRANSACTIONS[::-1], compiled).adjusted
+        assert again == first[::-1]
+
+
+class TestShardedPipeline:
+    def test_matches_serial(self, monkeypatch):
+        from app.services import pipeline_service
+        from app.services.investment_service import calculate_returns
+        from bench import generators
+
+        txns = generators.transactions(3000, seed=6)
+        txns[10]["date"] = txns[2000]["date"]  # equal epochs across the list
+        txns[11]["remanent"] = 2 ** 60
+        q, p, k = generators.periods(3000, seed=6)
+        q[0]["fixed"] = 2 ** 62
+
+        def run():
+            return (
+                filter_transactions(txns, q, p, k, include_k_matches=True),
+                calculate_returns(txns, q, p, k, 30, 50_000, 0.055, 0.0711),
+                filter_transactions(txns, [], [], k),
+            )
+
+        serial = run()
+        monkeypatch.setattr(pipeline_service, "PARALLEL_PIPELINE_MIN_ROWS", 100)
+        monkeypatch.setattr(pipeline_service, "pool_size", lambda: 3)
+        assert pipeline_service._shard_count(txns) == 3
+        assert run() == serial
+
+        txns[1500]["date"] = "not a date"
+        with pytest.raises(ValueError, match="not a date"):
+            run_pipeline(txns, compile_periods(q, p, k))
+
+    def test_shards_keep_equal_epochs_together(self):
+        import numpy as np
+
+        from app.services.pipeline_service import _time_shards
+
+        epochs = np.array([5, 1, 5, 5, 9, 1, 5, 7] * 50, dtype=np.int64)
+        shards = _time_shards(epochs, 4)
+        assert sorted(np.concatenate(shards).tolist()) == list(range(len(epochs)))
+        seen = [set(epochs[rows].tolist()) for rows in shards]
+        assert all(a.isdisjoint(b) for i, a in enumerate(seen) for b in seen[i + 1:])
+        assert all((np.diff(rows) > 0).all() for rows in shards)
+
+
+class TestIntervalIndex:
+    def test_matches_brute_force(self):
+        import random
+
+        from app.utils.interval_index import IntervalIndex
+
+        rng = random.Random(5)
+        intervals = []
+        for _ in range(200):
+            start = rng.randrange(0, 1000)
+            intervals.append((start, start + rng.randrange(-5, 80)))
+        index = IntervalIndex(intervals)
+        points = list(range(-10, 1100, 3))
+        inside = index.contains_many(points).tolist()
+        for t, flag in zip(points, inside):
+            expected = [i for i, (s, e) in enumerate(intervals) if s <= t <= e]
+            assert index.matches(t) == expected
+            assert index.contains(t) == flag == bool(expected)
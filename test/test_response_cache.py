@@ -0,0 +1,103 @@
+import gzip
+import json
+
+import pytest
+
+from app.utils import constants
+from app.utils import metrics as metrics_module
+from app.utils.response_cache import CACHE_VERSION, ResponseCache, _cache_version
+
+from test.test_returns import TestChallengeExample as Example
+
+API = "/blackrock/challenge/v1"
+BODY = {
+    "age": 29, "wage": 50000, "inflation": 0.055,
+    "q": Example.Q, "p": Example.P, "k": Example.K,
+    "transactions": Example.TRANSACTIONS,
+}
+
+
+@pytest.fixture
+def metrics(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics_module.metrics, "directory", str(tmp_path / "metrics"))
+    metrics_module.metrics.reset()
+    return metrics_module.metrics
+
+
+class TestResponseCache:
+    def test_miss_then_hit(self, client):
+        first = client.post(f"{API}/returns:nps", json=BODY)
+        # Same body with keys in another order is the same request.
+        reordered = dict(reversed(list(BODY.items())))
+        second = client.post(f"{API}/returns:nps", data=json.dumps(reordered))
+        assert first.headers["X-Cache"] == "MISS"
+        assert second.headers["X-Cache"] == "HIT"
+        assert second.get_data() == first.get_data()
+        assert second.mimetype == "application/json"
+        assert second.headers["Vary"] == first.headers["Vary"] == "Accept-Encoding, Accept"
+
+    def test_routes_and_encodings_are_separate(self, client):
+        client.post(f"{API}/returns:nps", json=BODY)
+        assert client.post(f"{API}/returns:index", json=BODY).headers["X-Cache"] == "MISS"
+
+        body = {**BODY, "transactions": Example.TRANSACTIONS * 10}
+        headers = {"Accept-Encoding": "gzip"}
+        client.post(f"{API}/transactions:filter", json=body)
+        miss = client.post(f"{API}/transactions:filter", json=body, headers=headers)
+        hit = client.post(f"{API}/transactions:filter", json=body, headers=headers)
+        assert (miss.headers["X-Cache"], hit.headers["X-Cache"]) == ("MISS", "HIT")
+        assert hit.headers["Content-Encoding"] == "gzip"
+        assert json.loads(gzip.decompress(hit.get_data())) == json.loads(
+            gzip.decompress(miss.get_data())
+        )
+
+    def test_unseeded_simulation_bypasses(self, client):
+        body = {**BODY, "simulation": {"paths": 100}}
+        for _ in range(2):
+            resp = client.post(f"{API}/returns:nps", json=body)
+            assert resp.headers["X-Cache"] == "BYPASS"
+        body["simulation"]["seed"] = 3
+        client.post(f"{API}/returns:nps", json=body)
+        assert client.post(f"{API}/returns:nps", json=body).headers["X-Cache"] == "HIT"
+
+    def test_errors_not_cached(self, client):
+        body = {**BODY, "ruleset_id": "0" * 64}
+        for _ in range(2):
+            resp = client.post(f"{API}/returns:nps", json=body)
+            assert resp.status_code == 404
+            assert resp.headers.get("X-Cache") != "HIT"
+
+    def test_ttl(self, client, fresh_response_cache):
+        fresh_response_cache.ttl = 0
+        client.post(f"{API}/returns:nps", json=BODY)
+        assert client.post(f"{API}/returns:nps", json=BODY).headers["X-Cache"] == "MISS"
+
+    def test_disabled(self, client, fresh_response_cache):
+        fresh_response_cache.enabled = False
+        assert client.post(f"{API}/returns:nps", json=BODY).headers["X-Cache"] == "BYPASS"
+
+    def test_version_follows_format_version(self, monkeypatch):
+        assert _cache_version() == CACHE_VERSION
+        bumped = constants.RESPONSE_FORMAT_VERSION + 1
+        monkeypatch.setattr(constants, "RESPONSE_FORMAT_VERSION", bumped)
+        assert _cache_version() != CACHE_VERSION
+
+    def test_size_eviction_keeps_newest(self, tmp_path, app):
+        cache = ResponseCache(path=str(tmp_path / "c.sqlite3"), max_bytes=10_000)
+        with app.test_request_context():
+            for i in range(20):
+                resp = app.response_class(b"x" * 1000, mimetype="application/json")
+                cache.put(f"k{i}", "identity", resp)
+            cache.evict()
+            assert cache.stats()["bytes"] <= 10_000
+            assert cache.get("k19", "identity") is not None
+            assert cache.get("k0", "identity") is None
+
+    def test_hit_ratio_reported(self, client, metrics):
+        for _ in range(3):
+            client.post(f"{API}/returns:index", json=BODY)
+        stats = client.get(f"{API}/performance").get_json()["responseCache"]
+        assert (stats["hits"], stats["misses"], stats["hitRatio"]) == (2, 1, 0.6667)
+        assert stats["entries"] == 1
+        text = client.get(f"{API}/metrics").get_data(as_text=True)
+        assert "blk_response_cache_hits_total 2" in text
@@ -2,7 +2,14 @@
 import json
 import pytest
 
-from app.services.tax_service import calculate_tax, calculate_nps_tax_benefit
+from app.services.tax_service import (
+    TaxRegime,
+    calculate_nps_tax_benefit,
+    calculate_tax,
+    get_regime,
+    load_regimes,
+    nps_tax_benefits,
+)
 from app.services.investment_service import (
     _investment_years,
     _compound_interest,
@@ -48,6 +55,40 @@ class TestNPSTaxBenefit:
         assert benefit == expected
 
 
+class TestTaxRegime:
+    INCOMES = [0, 700_000, 700_000.01, 999_999.995, 1_000_000, 1_234_567.89, 1_500_000, 9e6]
+
+    def test_batch_matches_scalar(self):
+        regime = get_regime()
+        assert regime.taxes(self.INCOMES).tolist() == [calculate_tax(x) for x in self.INCOMES]
+
+    def test_nps_benefits_match_scalar(self):
+        invested = [0, 145, 12_345.67, 75_000.005, 199_999.99, 500_000] * 5
+        for income in (600_000, 1_150_000, 1_800_000, 5_000_000):
+            assert nps_tax_benefits(invested, income) == [
+                calculate_nps_tax_benefit(x, income) for x in invested
+            ]
+
+    def test_capped_table_without_open_slab(self):
+        regime = TaxRegime([(100, 0.0), (200, 0.5)])
+        assert regime.tax(150) == 25.0
+        assert regime.tax(1_000) == 50.0
+        assert regime.taxes([150, 1_000]).tolist() == [25.0, 50.0]
+
+    def test_regimes_from_file(self, tmp_path):
+        path = tmp_path / "regimes.json"
+        path.write_text(json.dumps({"flat": [[0, 0.0], [None, 0.1]]}))
+        regimes = load_regimes(str(path))
+        assert set(regimes) == {"default", "flat"}
+        assert regimes["flat"].tax(1_000_000) == 100_000.0
+
+    def test_invalid_regimes(self):
+        with pytest.raises(ValueError):
+            TaxRegime([(200, 0.1), (100, 0.2)])
+        with pytest.raises(ValueError):
+            get_regime("missing")
+
+
 class TestInvestmentYears:
     def test_normal_age(self):
         assert _investment_years(29) == 31
@@ -131,6 +172,44 @@ class TestChallengeExample:
         assert k2["taxBenefit"] == 0
 
 
+class TestTrajectory:
+    T = TestChallengeExample
+
+    def test_curve_ends_at_projection(self):
+        result = calculate_index_returns(
+            self.T.TRANSACTIONS, self.T.Q, self.T.P, self.T.K,
+            age=29, wage=50_000, inflation=0.055, trajectory=True,
+        )
+        plain = calculate_index_returns(
+            self.T.TRANSACTIONS, self.T.Q, self.T.P, self.T.K,
+            age=29, wage=50_000, inflation=0.055,
+        )
+        for entry, expected in zip(result["savingsByDates"], plain["savingsByDates"]):
+            curve = entry.pop("trajectory")
+            assert entry == expected
+            assert curve["age"] == list(range(30, 61))
+            assert len(curve["nominal"]) == len(curve["real"]) == 31
+            real = _inflation_adjust(
+                _compound_interest(entry["amount"], 0.1449, 31), 0.055, 31
+            )
+            assert curve["real"][-1] == round(real, 2)
+            assert curve["nominal"][0] == round(entry["amount"] * 1.1449, 2)
+
+    def test_endpoint_opt_in(self, client):
+        body = {
+            "age": 58, "wage": 50000, "inflation": 0.055,
+            "q": self.T.Q, "p": self.T.P, "k": self.T.K,
+            "transactions": self.T.TRANSACTIONS,
+        }
+        resp = client.post("/blackrock/challenge/v1/returns:nps", json=body)
+        assert "trajectory" not in resp.get_json()["savingsByDates"][0]
+        resp = client.post(
+            "/blackrock/challenge/v1/returns:nps", json={**body, "trajectory": True}
+        )
+        curve = resp.get_json()["savingsByDates"][0]["trajectory"]
+        assert curve["age"] == [59, 60, 61, 62, 63]
+
+
 class TestNPSEndpoint:
     def test_nps(self, client):
         payload = {
@@ -181,3 +260,116 @@ class TestIndexEndpoint:
         assert resp.status_code == 200
         data = resp.get_json()
         assert data["savingsByDates"][0]["taxBenefit"] == 0
+
+
+class TestScenarios:
+    def test_matches_single_calls(self):
+        from app.services.investment_service import calculate_scenarios
+
+        t = TestChallengeExample
+        result = calculate_scenarios(
+            t.TRANSACTIONS, t.Q, t.P, t.K, wage=150_000,
+            instruments=["nps", "index"], ages=[29, 58], inflations=[0.055, 0.07],
+        )
+        assert len(result["scenarios"]) == 8
+        for scenario in result["scenarios"]:
+            calc = calculate_nps_returns if scenario["instrument"] == "nps" else calculate_index_returns
+            single = calc(
+                t.TRANSACTIONS, t.Q, t.P, t.K,
+                age=scenario["age"], wage=150_000, inflation=scenario["inflation"],
+            )
+            assert scenario["savingsByDates"] == single["savingsByDates"]
+            assert result["transactionsTotalAmount"] == single["transactionsTotalAmount"]
+
+    def test_endpoint(self, client):
+        t = TestChallengeExample
+        payload = {
+            "wage": 50000,
+            "q": t.Q, "p": t.P, "k": t.K,
+            "transactions": t.TRANSACTIONS,
+            "ages": [29],
+        }
+        resp = client.post(
+            "/blackrock/challenge/v1/returns:scenarios",
+            data=json.dumps(payload),
+            content_type="application/json",
+        )
+        assert resp.status_code == 200
+        data = resp.get_json()
+        assert [s["instrument"] for s in data["scenarios"]] == ["nps", "index"]
+        assert data["scenarios"][0]["savingsByDates"][1]["amount"] == 145
+
+    @pytest.mark.parametrize("body, message", [
+        ({"instruments": ["gold"]}, "Unknown instruments"),
+        ({"instruments": "nps"}, "instruments must be"),
+        ({"instruments": [["nps"]]}, "instruments must be"),
+        ({"ages": 25}, "ages must be"),
+        ({"ages": [25, "x"]}, "ages must be"),
+        ({"inflations": [True]}, "inflations must be"),
+        ({"inflations": {"a": 0.05}}, "inflations must be"),
+    ])
+    def test_bad_grid(self, client, body, message):
+        resp = client.post(
+            "/blackrock/challenge/v1/returns:scenarios",
+            data=json.dumps(body),
+            content_type="application/json",
+        )
+        assert resp.status_code == 400
+        assert resp.get_json()["error"].startswith(message)
+
+
+class TestBatchReturns:
+    def _portfolio(self, instrument, age):
+        t = TestChallengeExample
+        return {
+            "instrument": instrument, "age": age, "wage": 50_000, "inflation": 0.055,
+            "q": t.Q, "p": t.P, "k": t.K, "transactions": t.TRANSACTIONS,
+        }
+
+    def test_results_in_input_order_with_errors(self, monkeypatch):
+        from app.services import investment_service
+
+        monkeypatch.setattr(investment_service, "pool_size", lambda: 2)
+        portfolios = [self._portfolio(["nps", "index"][i % 2], 20 + i) for i in range(10)]
+        portfolios[3] = {"instrument": "gold"}
+        portfolios[5]["transactions"] = [{"date": "not a date", "remanent": 1}]
+        portfolios[6]["transactions"] = [{"remanent": 1}]
+        portfolios[7] = "nps"
+        portfolios[8]["transactions"] = 5
+
+        results = investment_service.calculate_returns_batch(portfolios, chunksize=3)
+        assert len(results) == 10
+        assert "gold" in results[3]["error"]
+        assert "not a date" in results[5]["error"]
+        assert results[6]["error"] == "Missing field: date"
+        assert results[7]["error"] == "Portfolio must be an object"
+        assert results[8]["error"].startswith("Malformed portfolio")
+        assert not any("Error" in r.get("error", "") for r in results)
+        for i in (0, 1, 9):
+            calc = calculate_nps_returns if i % 2 == 0 else calculate_index_returns
+            p = portfolios[i]
+            expected = calc(
+                p["transactions"], p["q"], p["p"], p["k"],
+                age=p["age"], wage=p["wage"], inflation=p["inflation"],
+            )
+            assert results[i] == {"result": expected}
+
+    def test_endpoint(self, client):
+        resp = client.post(
+            "/blackrock/challenge/v1/returns:batch",
+            data=json.dumps({"portfolios": [self._portfolio("index", 29)]}),
+            content_type="application/json",
+        )
+        assert resp.status_code == 200
+        result = resp.get_json()["results"][0]["result"]
+        assert result["savingsByDates"][1]["amount"] == 145
+
+    @pytest.mark.parametrize("portfolios", [{"a": 1}, "nps", 5])
+    def test_portfolios_must_be_a_list(self, client, portfolios):
+        resp = client.post(
+            "/blackrock/challenge/v1/returns:batch",
+            data=json.dumps({"portfolios": portfolios}),
+            content_type="application/json",
+        )
+        assert resp.status_code == 400
+        assert resp.get_json() == {"error": "portfolios must be a list"}
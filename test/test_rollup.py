@@ -0,0 +1,116 @@
+from collections import defaultdict
+from datetime import datetime
+
+import pytest
+
+from app.services.period_rule_service import filter_transactions
+from app.services.rollup_service import rollup_transactions
+from app.utils import columnar_wire
+from app.utils.columnar_wire import COLUMNAR_MIMETYPE
+from app.utils.constants import DATETIME_FMT
+from bench import generators
+
+API = "/blackrock/challenge/v1"
+
+LABELS = {
+    "day": lambda d: d.strftime("%Y-%m-%d"),
+    "week": lambda d: "%04d-W%02d" % d.isocalendar()[:2],
+    "month": lambda d: d.strftime("%Y-%m"),
+    "year": lambda d: d.strftime("%Y"),
+}
+
+
+@pytest.fixture(scope="module")
+def workload():
+    transactions = generators.transactions(3000, seed=5)
+    q, p, k = generators.periods(3000, seed=5)
+    return transactions, q, p, k
+
+
+def _expected(valid, granularity):
+    groups = defaultdict(list)
+    for txn in valid:
+        groups[LABELS[granularity](datetime.strptime(txn["date"], DATETIME_FMT))].append(txn)
+    return {
+        label: (
+            len(rows),
+            *(round(sum(t[f] for t in rows), 2) for f in ("amount", "ceiling", "remanent")),
+        )
+        for label, rows in groups.items()
+    }
+
+
+class TestRollup:
+    @pytest.mark.parametrize("granularity", ["day", "week", "month", "year"])
+    def test_matches_filtered_output(self, workload, granularity):
+        transactions, q, p, k = workload
+        valid = filter_transactions(transactions, q, p, k)["valid"]
+        result = rollup_transactions(transactions, q, p, k, granularity)
+        got = {
+            b["bucket"]: (b["count"], b["amount"], b["ceiling"], b["remanent"])
+            for b in result["buckets"]
+        }
+        expected = _expected(valid, granularity)
+        assert got.keys() == expected.keys()
+        for label, (count, *sums) in expected.items():
+            assert got[label][0] == count
+            assert got[label][1:] == pytest.approx(sums, abs=0.011)
+        assert [b["start"] for b in result["buckets"]] == sorted(b["start"] for b in result["buckets"])
+        assert result["totals"]["count"] == len(valid)
+
+    def test_bucket_bounds_and_range(self):
+        transactions = [
+            {"date": "2024-12-30 10:00:00", "amount": 250, "ceiling": 300, "remanent": 50},
+            {"date": "2025-01-05 23:59:59", "amount": 120, "ceiling": 200, "remanent": 80},
+            {"date": "2025-01-06 00:00:00", "amount": 99.5, "ceiling": 100, "remanent": 0.5},
+            {"date": "2025-03-01 00:00:00", "amount": 10, "ceiling": 100, "remanent": 90},
+        ]
+        q = [{"fixed": 7, "start": "2025-01-06 00:00:00", "end": "2025-01-06 23:59:59"}]
+        result = rollup_transactions(
+            transactions, q, [], [], "week", end="2025-02-28 23:59:59",
+        )
+        assert result["buckets"] == [
+            {
+                "bucket": "2025-W01", "start": "2024-12-30 00:00:00",
+                "end": "2025-01-05 23:59:59", "count": 2,
+                "amount": 370.0, "ceiling": 500.0, "remanent": 130.0,
+            },
+            {
+                "bucket": "2025-W02", "start": "2025-01-06 00:00:00",
+                "end": "2025-01-12 23:59:59", "count": 1,
+                "amount": 99.5, "ceiling": 100.0, "remanent": 7.0,
+            },
+        ]
+        assert result["totals"] == {
+            "count": 3, "amount": 469.5, "ceiling": 600.0, "remanent": 137.0,
+        }
+        month = rollup_transactions(transactions, [], [], [], "month", start="2025-02-01 00:00:00")
+        assert [(b["bucket"], b["end"]) for b in month["buckets"]] == [
+            ("2025-03", "2025-03-31 23:59:59"),
+        ]
+
+    @pytest.mark.parametrize("kwargs", [
+        {"granularity": "hour"}, {"start": "2025-01-01"}, {"end": 5},
+    ])
+    def test_bad_arguments(self, kwargs):
+        with pytest.raises(ValueError):
+            rollup_transactions([], [], [], [], **kwargs)
+
+
+class TestEndpoint:
+    def test_json_and_columnar(self, client, workload):
+        transactions, q, p, k = workload
+        body = {"transactions": transactions, "q": q, "p": p, "k": k, "granularity": "week"}
+        resp = client.post(f"{API}/transactions:rollup", json=body)
+        assert resp.status_code == 200
+        assert resp.get_json() == rollup_transactions(transactions, q, p, k, "week")
+        columnar = client.post(
+            f"{API}/transactions:rollup", data=columnar_wire.encode(body),
+            headers={"Content-Type": COLUMNAR_MIMETYPE},
+        )
+        assert columnar.data == resp.data
+
+    def test_bad_granularity(self, client):
+        resp = client.post(f"{API}/transactions:rollup", json={"granularity": "hour"})
+        assert resp.status_code == 400
+        assert "granularity" in resp.get_json()["error"]
@@ -0,0 +1,94 @@
+
+import json
+
+import pytest
+
+from app.services import ruleset_service
+from app.services.ruleset_service import RulesetRegistry, UnknownRuleset, ruleset_id
+
+from test.test_period_rules import K, P, Q, TRANSACTIONS
+
+API = "/blackrock/challenge/v1"
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    reg = RulesetRegistry(capacity=2, directory=str(tmp_path))
+    monkeypatch.setattr(ruleset_service, "registry", reg)
+    return reg
+
+
+class TestRulesetRegistry:
+    def test_id_is_content_hash(self):
+        assert ruleset_id(Q, P, K) == ruleset_id(list(Q), list(P), list(K))
+        assert ruleset_id(Q, P, K) != ruleset_id([], P, K)
+
+    def test_hits_misses_and_eviction(self, registry):
+        rid = registry.register(Q, P, K)
+        registry.get(rid)
+        registry.register([], [], K)
+        registry.register([], P, [])
+        assert registry.stats()["size"] == 2
+        # Evicted from memory, recompiled from the on-disk copy.
+        compiled = registry.get(rid)
+        assert compiled.k_periods == K
+        stats = registry.stats()
+        assert (stats["hits"], stats["misses"]) == (1, 1)
+
+    def test_shared_across_registries(self, registry, tmp_path):
+        rid = registry.register(Q, P, K)
+        other = RulesetRegistry(directory=str(tmp_path))
+        assert other.get(rid).k_periods == K
+
+    def test_unknown(self, registry):
+        with pytest.raises(UnknownRuleset):
+            registry.get("0" * 64)
+
+    def test_malformed_ids_are_not_looked_up(self, registry):
+        rid = registry.register(Q, P, K)
+        for bad in (f"a/{rid}", f"../{rid}", rid.upper(), rid[:-1]):
+            with pytest.raises(UnknownRuleset):
+                registry.get(bad)
+        assert registry.stats()["size"] == 1
+
+    @pytest.mark.parametrize("content", ["{}", "[]", '{"q": 1, "p": [], "k": []}', "not json"])
+    def test_bad_file_is_unknown(self, registry, tmp_path, content):
+        rid = ruleset_id([], [], [])
+        (tmp_path / f"{rid}.json").write_text(content)
+        with pytest.raises(UnknownRuleset):
+            registry.get(rid)
+
+    def test_file_must_match_its_id(self, registry, tmp_path):
+        rid = registry.register(Q, P, K)
+        other = RulesetRegistry(directory=str(tmp_path))
+        (tmp_path / f"{rid}.json").write_text(json.dumps({"q": [], "p": [], "k": K}))
+        with pytest.raises(UnknownRuleset):
+            other.get(rid)
+
+
+class TestRulesetEndpoints:
+    def _post(self, client, path, payload):
+        return client.post(
+            API + path, data=json.dumps(payload), content_type="application/json"
+        )
+
+    def test_returns_with_ruleset_id(self, client, registry):
+        rid = self._post(client, "/rulesets", {"q": Q, "p": P, "k": K}).get_json()["ruleset_id"]
+        body = {"age": 29, "wage": 50000, "transactions": TRANSACTIONS}
+        by_id = self._post(client, "/returns:nps", {**body, "ruleset_id": rid}).get_json()
+        inline = self._post(client, "/returns:nps", {**body, "q": Q, "p": P, "k": K}).get_json()
+        assert by_id == inline
+
+        filtered = self._post(client, "/transactions:filter", {
+            "ruleset_id": rid, "transactions": TRANSACTIONS,
+        }).get_json()
+        assert len(filtered["valid"]) == 4
+        assert client.get(API + "/rulesets:stats").get_json()["hits"] == 2
+
+    def test_unknown_id_is_404(self, client, registry):
+        resp = self._post(client, "/returns:index", {"ruleset_id": "nope"})
+        assert resp.status_code == 404
+
+    def test_invalid_rules_rejected(self, client, registry):
+        resp = self._post(client, "/rulesets", {"k": [{"start": "bad", "end": "bad"}]})
+        assert resp.status_code == 400
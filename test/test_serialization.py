@@ -0,0 +1,87 @@
+import gzip
+import json
+import zlib
+
+from app.utils import serialization
+from app.utils.constants import STREAM_MIN_ITEMS
+from app.utils.serialization import dumps, loads
+
+API = "/blackrock/challenge/v1"
+
+
+def _expenses(n):
+    return [
+        {"timestamp": f"2023-01-01 00:{i // 60 % 60:02d}:{i % 60:02d}", "amount": 100 + i % 900}
+        for i in range(n)
+    ]
+
+
+class TestCodec:
+    def test_matches_stdlib_sorted_compact(self):
+        obj = {"b": [1, 2.5, None], "a": {"y": "é", "x": True}}
+        expected = json.dumps(obj, sort_keys=True, separators=(",", ":"))
+        assert loads(dumps(obj)) == obj
+        assert json.loads(dumps(obj)) == json.loads(expected)
+
+    def test_stdlib_fallback(self, monkeypatch):
+        monkeypatch.setattr(serialization, "orjson", None)
+        obj = {"b": 1, "a": [0.1, "x"]}
+        assert dumps(obj) == b'{"a":[0.1,"x"],"b":1}'
+        assert loads(b'{"a": 1}') == {"a": 1}
+
+    def test_big_integers_fall_back(self):
+        assert loads(dumps({"n": 2 ** 70})) == {"n": 2 ** 70}
+
+
+class TestResponses:
+    def test_bad_json_is_400(self, client):
+        resp = client.post(f"{API}/transactions:parse", data=b"{not json")
+        assert resp.status_code == 400
+
+    def test_small_response_not_compressed(self, client):
+        resp = client.post(
+            f"{API}/transactions:parse",
+            json={"expenses": _expenses(1)},
+            headers={"Accept-Encoding": "gzip"},
+        )
+        assert "Content-Encoding" not in resp.headers
+        assert len(resp.get_json()["transactions"]) == 1
+
+    def test_gzip(self, client):
+        resp = client.post(
+            f"{API}/transactions:parse",
+            json={"expenses": _expenses(200)},
+            headers={"Accept-Encoding": "gzip"},
+        )
+        assert resp.headers["Content-Encoding"] == "gzip"
+        body = json.loads(gzip.decompress(resp.get_data()))
+        plain = client.post(f"{API}/transactions:parse", json={"expenses": _expenses(200)})
+        assert body == plain.get_json()
+
+    def test_deflate(self, client):
+        resp = client.post(
+            f"{API}/transactions:parse",
+            json={"expenses": _expenses(200)},
+            headers={"Accept-Encoding": "deflate"},
+        )
+        assert resp.headers["Content-Encoding"] == "deflate"
+        assert len(json.loads(zlib.decompress(resp.get_data()))["transactions"]) == 200
+
+    def test_large_list_streamed(self, client):
+        n = STREAM_MIN_ITEMS + 7
+        resp = client.post(f"{API}/transactions:parse", json={"expenses": _expenses(n)})
+        assert resp.is_streamed
+        transactions = resp.get_json()["transactions"]
+        assert len(transactions) == n
+        assert transactions[-1]["amount"] == 100 + (n - 1) % 900
+
+    def test_large_list_streamed_gzip(self, client):
+        n = STREAM_MIN_ITEMS + 7
+        resp = client.post(
+            f"{API}/transactions:parse",
+            json={"expenses": _expenses(n)},
+            headers={"Accept-Encoding": "gzip"},
+        )
+        assert resp.headers["Content-Encoding"] == "gzip"
+        body = json.loads(gzip.decompress(resp.get_data()))
+        assert len(body["transactions"]) == n
@@ -0,0 +1,79 @@
+import pytest
+
+from app.services.investment_service import calculate_index_returns
+from app.services.simulation_service import parse_simulation, simulate
+from app.utils.constants import INDEX_VOLATILITY, SIM_BATCH_PATHS
+
+from test.test_returns import TestChallengeExample as Example
+
+API = "/blackrock/challenge/v1"
+BUCKETS = [{"amount": 75.0}, {"amount": 145.0}, {"amount": 0.0}]
+
+
+def _spec(**spec):
+    return parse_simulation({"seed": 7, **spec}, INDEX_VOLATILITY)
+
+
+class TestSimulate:
+    def test_seeded_and_ordered(self):
+        bands, info = simulate(BUCKETS, 31, 0.1449, 0.055, _spec(paths=2_000))
+        again, _ = simulate(BUCKETS, 31, 0.1449, 0.055, _spec(paths=2_000))
+        assert bands == again
+        assert info == {"paths": 2_000, "seed": 7, "truncated": False}
+        for band in bands[:2]:
+            assert 0 < band["p5"] < band["p50"] < band["p95"]
+        assert bands[2] == {"p5": 0.0, "p50": 0.0, "p95": 0.0}
+
+    def test_zero_volatility_is_deterministic_projection(self):
+        spec = _spec(paths=100, returnVolatility=0, inflationVolatility=0)
+        bands, _ = simulate(BUCKETS, 31, 0.1449, 0.055, spec)
+        expected = 145 * (1.1449 / 1.055) ** 31
+        rounded = round(expected, 2)
+        assert bands[1] == {"p5": rounded, "p50": rounded, "p95": rounded}
+
+    def test_time_budget_truncates(self):
+        spec = _spec(paths=1_000_000, timeBudgetMs=1)
+        _, info = simulate(BUCKETS, 31, 0.1449, 0.055, spec)
+        assert info["truncated"]
+        assert SIM_BATCH_PATHS <= info["paths"] < 1_000_000
+
+    @pytest.mark.parametrize("spec", [
+        {"paths": 0}, {"paths": 1.5}, {"timeBudgetMs": "1"}, {"seed": -1},
+        {"returnVolatility": 2}, [],
+    ])
+    def test_invalid_spec(self, spec):
+        with pytest.raises(ValueError):
+            parse_simulation(spec, INDEX_VOLATILITY)
+
+    def test_returns_unchanged_apart_from_bands(self):
+        args = (Example.TRANSACTIONS, Example.Q, Example.P, Example.K, 29, 50_000, 0.055)
+        plain = calculate_index_returns(*args)
+        simulated = calculate_index_returns(*args, simulation=_spec(paths=500))
+        assert simulated.pop("simulation")["paths"] == 500
+        for entry in simulated["savingsByDates"]:
+            assert set(entry.pop("realValueBands")) == {"p5", "p50", "p95"}
+        assert simulated == plain
+
+
+class TestSimulationEndpoint:
+    BODY = {
+        "age": 29, "wage": 50000, "inflation": 0.055,
+        "q": Example.Q, "p": Example.P, "k": Example.K,
+        "transactions": Example.TRANSACTIONS,
+    }
+
+    def test_nps(self, client):
+        resp = client.post(
+            f"{API}/returns:nps", json={**self.BODY, "simulation": {"paths": 1000, "seed": 1}}
+        )
+        assert resp.status_code == 200
+        data = resp.get_json()
+        assert data["simulation"] == {"paths": 1000, "seed": 1, "truncated": False}
+        assert "realValueBands" in data["savingsByDates"][1]
+
+    def test_invalid(self, client):
+        resp = client.post(
+            f"{API}/returns:index", json={**self.BODY, "simulation": {"paths": -5}}
+        )
+        assert resp.status_code == 400
+        assert "paths" in resp.get_json()["error"]
@@ -0,0 +1,181 @@
+import json
+import time
+
+import pytest
+
+from app.services import transaction_service
+from app.services.transaction_service import (
+    iter_validate_rows,
+    iter_validate_transactions,
+    parse_expenses,
+    validate_transactions,
+)
+from app.utils import columnar_wire
+from app.utils.columnar_table import ColumnarTable
+from app.utils.metrics import STAGES, Metrics
+
+NDJSON = "application/x-ndjson"
+
+
+def _ndjson_body(records):
+    return "".join(json.dumps(r) + "\n" for r in records)
+
+
+def _read_ndjson(resp):
+    return [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+
+
+class TestChunkedValidation:
+    def test_duplicates_detected_across_chunks(self):
+        chunks = [
+            [{"date": "2023-10-12 20:15:00", "amount": 250, "ceiling": 300, "remanent": 50}],
+            [{"date": "2023-10-12 20:15:00", "amount": 250, "ceiling": 300, "remanent": 50}],
+        ]
+        results = list(iter_validate_transactions(0, chunks))
+        assert len(results[0]["valid"]) == 1
+        assert len(results[1]["valid"]) == 0
+        assert "Duplicate date" in results[1]["invalid"][0]["message"]
+
+    def test_matches_single_call(self):
+        txns = [
+            {"date": f"2023-01-{d:02d} 10:00:00", "amount": 120, "ceiling": 200, "remanent": 80}
+            for d in (1, 2, 2, 3)
+        ]
+        whole = validate_transactions(0, txns)
+        chunked = list(iter_validate_transactions(0, [txns[:2], txns[2:]]))
+        assert [t for r in chunked for t in r["valid"]] == whole["valid"]
+        assert [t for r in chunked for t in r["invalid"]] == whole["invalid"]
+
+    def test_stage_time_excludes_the_consumer(self, tmp_path, monkeypatch):
+        m = Metrics(directory=str(tmp_path))
+        monkeypatch.setattr(transaction_service, "metrics", m)
+        txn = {"date": "2023-01-01 10:00:00", "amount": 120, "ceiling": 200, "remanent": 80}
+        for _ in iter_validate_rows(0, [[txn], [txn]]):
+            time.sleep(0.05)
+        hist = m.snapshot()[STAGES]["validate"]
+        assert hist["count"] == 2
+        assert hist["sum"] < 0.05
+
+
+class TestNDJSONEndpoints:
+    def test_parse_stream(self, client):
+        expenses = [
+            {"timestamp": "2023-10-12 20:15:00", "amount": 250},
+            {"timestamp": "2023-02-28 15:49:00", "amount": 375},
+        ]
+        resp = client.post(
+            "/blackrock/challenge/v1/transactions:parse",
+            data=_ndjson_body(expenses),
+            content_type=NDJSON,
+        )
+        assert resp.status_code == 200
+        assert resp.mimetype == NDJSON
+        assert _read_ndjson(resp) == parse_expenses(expenses)
+
+    def test_validator_stream(self, client):
+        txns = [
+            {"date": "2023-10-12 20:15:00", "amount": 250, "ceiling": 300, "remanent": 50},
+            {"date": "2023-10-12 20:15:00", "amount": 250, "ceiling": 300, "remanent": 50},
+        ]
+        resp = client.post(
+            "/blackrock/challenge/v1/transactions:validator?wage=50000",
+            data=_ndjson_body(txns),
+            content_type=NDJSON,
+        )
+        lines = _read_ndjson(resp)
+        assert lines[0] == {"valid": txns[0]}
+        assert "Duplicate date" in lines[1]["invalid"]["message"]
+
+    def test_validator_stream_keeps_input_order(self, client):
+        txns = [
+            {"date": "2023-10-12 20:15:00", "amount": 250, "ceiling": 300, "remanent": 50},
+            {"date": "2023-13-12 20:15:00", "amount": 250, "ceiling": 300, "remanent": 50},
+            {"date": "2023-10-13 20:15:00", "amount": 250, "ceiling": 300, "remanent": 50},
+        ]
+        resp = client.post(
+            "/blackrock/challenge/v1/transactions:validator",
+            data=_ndjson_body(txns),
+            content_type=NDJSON,
+        )
+        lines = _read_ndjson(resp)
+        assert [next(iter(line)) for line in lines] == ["valid", "invalid", "valid"]
+        assert lines[1]["invalid"]["date"] == txns[1]["date"]
+
+    @pytest.mark.parametrize("route, bad_line", [
+        ("transactions:parse", "5"),
+        ("transactions:parse", "[1]"),
+        ("transactions:parse", '{"amount": 250}'),
+        ("transactions:validator", "5"),
+        ("transactions:validator", "null"),
+    ])
+    def test_bad_record_ends_stream_with_error(self, client, route, bad_line):
+        good = {"timestamp": "2023-10-12 20:15:00", "date": "2023-10-12 20:15:00",
+                "amount": 250, "ceiling": 300, "remanent": 50}
+        resp = client.post(
+            f"/blackrock/challenge/v1/{route}",
+            data=json.dumps(good) + "\n" + bad_line + "\n",
+            content_type=NDJSON,
+        )
+        lines = _read_ndjson(resp)
+        assert "error" in lines[-1]
+
+    def test_malformed_line_ends_stream_with_error(self, client):
+        resp = client.post(
+            "/blackrock/challenge/v1/transactions:parse",
+            data='{"timestamp": "2023-10-12 20:15:00", "amount": 250}\nnot json\n',
+            content_type=NDJSON,
+        )
+        lines = _read_ndjson(resp)
+        assert "error" in lines[-1]
+
+    def test_json_mode_unchanged(self, client):
+        resp = client.post(
+            "/blackrock/challenge/v1/transactions:parse",
+            data=json.dumps({"expenses": [{"timestamp": "2023-10-12 20:15:00", "amount": 250}]}),
+            content_type="application/json",
+        )
+        assert resp.get_json()["transactions"][0]["remanent"] == 50
+
+
+class TestColumnarEngine:
+    """Large batches go through the NumPy engine; output must not change."""
+
+    def _transactions(self):
+        txns = []
+        for i in range(600):
+            amount = [i * 37, i * 41.25, 499_999.5][i % 3]
+            ceiling = -(-amount // 100) * 100
+            txns.append({
+                "date": f"2023-{i % 12 + 1:02d}-{i % 28 + 1:02d} 10:{i % 60:02d}:00",
+                "amount": amount,
+                "ceiling": ceiling,
+                "remanent": ceiling - amount,
+            })
+        txns[5]["date"] = "2023-1-5 1:2:3"
+        txns[6]["date"] = "2023-02-30 10:00:00"
+        txns[7]["amount"] = None
+        txns[8]["amount"] = 600_000
+        txns[9]["ceiling"] = 12
+        txns[10]["remanent"] = txns[10]["remanent"] + 0.004
+        txns[11]["remanent"] = txns[11]["remanent"] + 0.006
+        return txns
+
+    def test_validate_matches_scalar(self):
+        from app.services.transaction_service import _validate_scalar, _validate_columnar
+
+        txns = self._transactions()
+        assert _validate_columnar(txns, set()) == _validate_scalar(txns, set())
+        assert len(validate_transactions(0, txns)["invalid"]) > 0
+
+    def test_parse_matches_scalar(self):
+        from app.services.transaction_service import _parse_expenses_scalar
+
+        expenses = [
+            {"timestamp": "2023-10-12 20:15:00", "amount": [i, i * 1.005, i + 0.5][i % 3]}
+            for i in range(600)
+        ]
+        table = columnar_wire.decode(columnar_wire.encode({"e": expenses}))["e"]
+        result = parse_expenses(table)
+        assert isinstance(result, ColumnarTable)
+        assert result.records() == _parse_expenses_scalar(expenses)
+        assert [type(t["remanent"]) for t in result[:3]] == [int, float, float]